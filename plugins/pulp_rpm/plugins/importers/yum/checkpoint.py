@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Lets a yum sync that was cancelled, or whose worker died, be resumed.
+
+A resumable sync downloads into a directory in the repo's working dir that is
+kept until the sync succeeds, rather than into a temporary directory. A small
+journal in that directory records which feed and which revision of the
+metadata the files came from. A later sync of the same metadata reuses the
+metadata files and the packages that were downloaded completely, but not yet
+saved. Packages that were saved are already in the repo, so they are not
+decided upon again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CHECKPOINT_DIR_NAME = 'sync_checkpoint'
+JOURNAL_FILE_NAME = 'journal.json'
+
+
+class SyncCheckpoint(object):
+    """
+    Download directory and journal for one repo's resumable sync.
+
+    :ivar path:         full path to the download directory
+    :type path:         basestring
+    :ivar resuming:     True once begin() has found that the files in the
+                        directory came from the same metadata
+    :type resuming:     bool
+    """
+
+    def __init__(self, working_dir):
+        """
+        :param working_dir: full path to the repo's working directory
+        :type  working_dir: basestring
+        """
+        self.path = os.path.join(working_dir, CHECKPOINT_DIR_NAME)
+        self.journal_path = os.path.join(self.path, JOURNAL_FILE_NAME)
+        self.resuming = False
+
+    def open(self):
+        """
+        Create the download directory if it does not exist. Directories left
+        inside it by an interrupted sync, such as those of a distribution, are
+        removed, since their files are not reused.
+
+        :return:    full path to the download directory
+        :rtype:     basestring
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        return self.path
+
+    def begin(self, feed, repomd_file_name, revision):
+        """
+        Compare the newly downloaded repomd.xml with the journal. If they
+        describe the same metadata, the files already in the directory are
+        kept to be reused. If not, every other file is removed, and the journal
+        is started over for this metadata.
+
+        :param feed:                URL of the feed being synced
+        :type  feed:                basestring
+        :param repomd_file_name:    name of the repomd.xml file that was just
+                                    downloaded into the directory
+        :type  repomd_file_name:    basestring
+        :param revision:            revision from repomd.xml, which may be None
+        :type  revision:            basestring
+
+        :return:    True if the sync is being resumed, else False
+        :rtype:     bool
+        """
+        with open(os.path.join(self.path, repomd_file_name), 'rb') as repomd_file:
+            repomd_checksum = hashlib.sha256(repomd_file.read()).hexdigest()
+        entry = {'feed': feed, 'revision': revision, 'repomd_checksum': repomd_checksum}
+
+        self.resuming = self._load() == entry
+        if self.resuming:
+            _LOGGER.info('resuming the sync of revision %s' % revision)
+            return True
+
+        for name in os.listdir(self.path):
+            if name != repomd_file_name:
+                os.remove(os.path.join(self.path, name))
+        with open(self.journal_path, 'w') as journal_file:
+            json.dump(entry, journal_file)
+        return False
+
+    def discard(self):
+        """
+        Remove the download directory and the journal, once they are no longer
+        useful.
+        """
+        self.resuming = False
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _load(self):
+        """
+        :return:    the journal's contents, or None if there is no valid journal
+        :rtype:     dict or NoneType
+        """
+        try:
+            with open(self.journal_path) as journal_file:
+                return json.load(journal_file)
+        except (IOError, ValueError):
+            return None
@@ -15,6 +15,26 @@ from gettext import gettext as _
 
 from pulp.plugins.util import importer_config
 
+from pulp_rpm.common import constants
+from pulp_rpm.plugins import configuration_utils
+from pulp_rpm.plugins.importers.yum import package_filter
+
+
+# options that may only be set to a boolean value
+BOOLEAN_KEYS = (
+    constants.CONFIG_SINGLE_PASS,
+    constants.CONFIG_LAZY_REPODATA,
+    constants.CONFIG_SKIP_UNCHANGED,
+    constants.CONFIG_INCREMENTAL_FILELESS,
+    constants.CONFIG_BATCH_UNIT_WRITES,
+    constants.CONFIG_VERIFY_BY_REREAD,
+    constants.CONFIG_ASSOCIATE_FROM_STORE,
+    constants.CONFIG_UNIFIED_DOWNLOADS,
+    constants.CONFIG_VERIFY_METADATA,
+    constants.CONFIG_LINK_LOCAL_FEED,
+    constants.CONFIG_RESUMABLE,
+    constants.CONFIG_CACHE_DECOMPRESSED,
+)
 
 def validate(config):
     """
@@ -27,14 +47,52 @@ def validate(config):
     :rtype:  (bool, str)
     """
 
+    failure_messages = []
     try:
         importer_config.validate_config(config)
+    except importer_config.InvalidConfig, e:
+        failure_messages.extend(e.failure_messages)
+    for key in BOOLEAN_KEYS:
+        try:
+            configuration_utils.validate_non_required_bool(config, key)
+        except configuration_utils.ValidationError, e:
+            failure_messages.append(str(e))
+    try:
+        _validate_parse_processes(config)
+    except configuration_utils.ValidationError, e:
+        failure_messages.append(str(e))
+    failure_messages.extend(package_filter.validate(config))
+
+    if not failure_messages:
         return True, None
 
-    except importer_config.InvalidConfig, e:
-        # Concatenate all of the failure messages into a single message
-        msg = _('Configuration errors:\n')
-        for failure_message in e.failure_messages:
-            msg += failure_message + '\n'
-        msg = msg.rstrip()  # remove the trailing \n
-        return False, msg
+    # Concatenate all of the failure messages into a single message
+    msg = _('Configuration errors:\n')
+    for failure_message in failure_messages:
+        msg += failure_message + '\n'
+    msg = msg.rstrip()  # remove the trailing \n
+    return False, msg
+
+
+def _validate_parse_processes(config):
+    """
+    Make sure the parse_processes value is a positive integer, if it is set.
+
+    :param config: The configuration object that we are validating.
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+    """
+    parse_processes = config.get(constants.CONFIG_PARSE_PROCESSES)
+    if parse_processes is None:
+        return
+
+    if isinstance(parse_processes, basestring) and parse_processes.isdigit():
+        value = int(parse_processes)
+    elif isinstance(parse_processes, (int, long)) and not isinstance(parse_processes, bool):
+        value = parse_processes
+    else:
+        value = 0
+    if value < 1:
+        msg = _('The configuration parameter <%(name)s> must be set to a positive integer, but '
+                'is currently set to <%(value)s>.')
+        msg = msg % {'name': constants.CONFIG_PARSE_PROCESSES, 'value': parse_processes}
+        raise configuration_utils.ValidationError(msg)
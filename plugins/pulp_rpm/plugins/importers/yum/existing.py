@@ -12,8 +12,9 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import logging
+import os
 
-from pulp.server.db.model.criteria import UnitAssociationCriteria
+from pulp.server.db.model.criteria import Criteria, UnitAssociationCriteria
 
 from pulp_rpm.common import models
 from pulp_rpm.plugins.importers.yum.utils import paginate
@@ -21,7 +22,12 @@ from pulp_rpm.plugins.importers.yum.utils import paginate
 _LOGGER = logging.getLogger(__name__)
 
 
-def check_repo(wanted, unit_search_method):
+# when checking at least this many units of one type, it is cheaper to load
+# the keys of every unit of that type in the repo than to search for each one
+BULK_CHECK_THRESHOLD = 5000
+
+
+def check_repo(wanted, unit_search_method, checker=None):
     """
     Given an iterable of units as namedtuples, this function will search for them
     using the given search method and return the set of tuples that were not
@@ -35,27 +41,179 @@ def check_repo(wanted, unit_search_method):
     :type  wanted:          iterable
     :param sync_conduit:
     :type  sync_conduit:    pulp.plugins.conduits.repo_sync.RepoSyncConduit
+    :param checker:         object that removes existing units from a set, such
+                            as an ExistenceChecker. Passing the same instance
+                            to multiple calls allows it to cache what it finds.
+                            Defaults to a new ExistenceChecker.
+    :type  checker:         ExistenceChecker
 
     :return:    set of unit keys as namedtuples, identifying which of the
                 named tuples received as input were not found by the
                 search method.
     :rtype:     set
     """
+    if checker is None:
+        checker = ExistenceChecker(unit_search_method)
     # sort by type
     sorted_units = _sort_by_type(wanted)
-    # UAQ for each type
     for unit_type, values in sorted_units.iteritems():
+        checker.discard_existing(unit_type, values)
+
+    ret = set()
+    ret.update(*sorted_units.values())
+    return ret
+
+
+class PaginatedExistenceChecker(object):
+    """
+    Searches for wanted units a page at a time, using an "$or" of their unit
+    keys. This is efficient when a small number of units are wanted.
+    """
+
+    def __init__(self, unit_search_method):
+        """
+        :param unit_search_method:  method that takes a UnitAssociationCriteria
+                                    and returns an iterable of units, such as
+                                    a conduit's get_units method
+        :type  unit_search_method:  function
+        """
+        self.unit_search_method = unit_search_method
+
+    def discard_existing(self, unit_type, values):
+        """
+        Remove units from "values" that already exist in the repo.
+
+        :param unit_type:   unit type ID
+        :type  unit_type:   basestring
+        :param values:      set of units as namedtuples, all of type unit_type.
+                            This set is modified in place.
+        :type  values:      set
+        """
         model = models.TYPE_MAP[unit_type]
         fields = model.UNIT_KEY_NAMES
 
         unit_keys_generator = (unit._asdict() for unit in values.copy())
-        for unit in get_existing_units(unit_keys_generator, fields, unit_type, unit_search_method):
+        for unit in get_existing_units(unit_keys_generator, fields, unit_type, self.unit_search_method):
             named_tuple = model(metadata=unit.metadata, **unit.unit_key).as_named_tuple
             values.discard(named_tuple)
 
-    ret = set()
-    ret.update(*sorted_units.values())
-    return ret
+
+class BulkExistenceChecker(object):
+    """
+    Loads the unit keys of every unit of a type in the repo with one search,
+    only retrieving the unit key fields, and does the comparison in memory.
+    The keys are loaded the first time each type is checked and kept for the
+    life of this object, so it should not outlive one sync.
+    """
+
+    def __init__(self, unit_search_method):
+        """
+        :param unit_search_method:  method that takes a UnitAssociationCriteria
+                                    and returns an iterable of units, such as
+                                    a conduit's get_units method
+        :type  unit_search_method:  function
+        """
+        self.unit_search_method = unit_search_method
+        self._existing = {}
+
+    def existing_units(self, unit_type):
+        """
+        :param unit_type:   unit type ID
+        :type  unit_type:   basestring
+
+        :return:    set of units as namedtuples for every unit of the given
+                    type in the repo
+        :rtype:     set
+        """
+        if unit_type not in self._existing:
+            model = models.TYPE_MAP[unit_type]
+            fields = model.UNIT_KEY_NAMES
+            criteria = UnitAssociationCriteria([unit_type], unit_fields=fields,
+                                               association_fields=[])
+            self._existing[unit_type] = set(
+                model.NAMEDTUPLE(*(unit.unit_key[name] for name in fields))
+                for unit in self.unit_search_method(criteria))
+        return self._existing[unit_type]
+
+    def discard_existing(self, unit_type, values):
+        """
+        Remove units from "values" that already exist in the repo.
+
+        :param unit_type:   unit type ID
+        :type  unit_type:   basestring
+        :param values:      set of units as namedtuples, all of type unit_type.
+                            This set is modified in place.
+        :type  values:      set
+        """
+        values.difference_update(self.existing_units(unit_type))
+
+
+class ExistenceChecker(object):
+    """
+    Uses a BulkExistenceChecker when many units of a type are being checked,
+    and a PaginatedExistenceChecker otherwise.
+    """
+
+    def __init__(self, unit_search_method, bulk_threshold=None):
+        """
+        :param unit_search_method:  method that takes a UnitAssociationCriteria
+                                    and returns an iterable of units, such as
+                                    a conduit's get_units method
+        :type  unit_search_method:  function
+        :param bulk_threshold:      minimum number of units of one type that
+                                    must be checked at once to use the bulk
+                                    checker. Defaults to BULK_CHECK_THRESHOLD.
+        :type  bulk_threshold:      int
+        """
+        if bulk_threshold is None:
+            bulk_threshold = BULK_CHECK_THRESHOLD
+        self.bulk_threshold = bulk_threshold
+        self.paginated = PaginatedExistenceChecker(unit_search_method)
+        self.bulk = BulkExistenceChecker(unit_search_method)
+
+    def discard_existing(self, unit_type, values):
+        """
+        Remove units from "values" that already exist in the repo.
+
+        :param unit_type:   unit type ID
+        :type  unit_type:   basestring
+        :param values:      set of units as namedtuples, all of type unit_type.
+                            This set is modified in place.
+        :type  values:      set
+        """
+        if len(values) >= self.bulk_threshold:
+            self.bulk.discard_existing(unit_type, values)
+        else:
+            self.paginated.discard_existing(unit_type, values)
+
+
+def find_in_content_store(wanted, search_all_method):
+    """
+    Search the whole content store, not only the repo being synced, for units
+    matching the given unit keys. Since the unit key includes the checksum, a
+    unit found this way has the same bits that would otherwise be downloaded.
+    Units whose files are missing from disk are not returned.
+
+    :param wanted:              iterable of units as namedtuples
+    :type  wanted:              iterable
+    :param search_all_method:   method that takes a unit type ID and a Criteria
+                                and returns matching units from every repo,
+                                such as a conduit's search_all_units method
+    :type  search_all_method:   function
+
+    :return:    dict of the units that were found, keyed by their namedtuples
+    :rtype:     dict
+    """
+    found = {}
+    for unit_type, values in _sort_by_type(wanted).iteritems():
+        model = models.TYPE_MAP[unit_type]
+        for segment in paginate(unit._asdict() for unit in values):
+            criteria = Criteria(filters={'$or': list(segment)})
+            for unit in search_all_method(unit_type, criteria):
+                named_tuple = model(metadata=unit.metadata, **unit.unit_key).as_named_tuple
+                if named_tuple in values and os.path.exists(unit.storage_path):
+                    found[named_tuple] = unit
+    return found
 
 
 def get_existing_units(search_dicts, unit_fields, unit_type, search_method):
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Verification of downloaded files without reading them again from disk.
+
+A HashingFile can be given to nectar as the destination of a download
+request. It writes each chunk to disk and also feeds it to a checksum as it
+goes, so that once the download is done, its size and checksum are already
+known. The verify functions in this module use those results when they are
+available, and otherwise read the file again, as the old verification did.
+"""
+
+from pulp.plugins.util import verification
+
+
+class HashingFile(object):
+    """
+    File-like object that writes to a file at a given path, keeping track of
+    the number of bytes written and their checksum.
+
+    The file is not opened until the first write, so that many of these can be
+    created ahead of the downloads without holding a file descriptor each.
+    Nectar does not close file-like destinations, so whoever receives the
+    download report must call close().
+    """
+
+    def __init__(self, path, checksumtype=None):
+        """
+        :param path:            full path to the file that should be written
+        :type  path:            basestring
+        :param checksumtype:    type of checksum to calculate, or None. If the
+                                type is not supported, no checksum is calculated.
+        :type  checksumtype:    basestring
+        """
+        self.path = path
+        self.checksumtype = checksumtype
+        self.size = 0
+        # False once anything has been written out of order, in which case
+        # the results no longer describe the file
+        self.valid = True
+        self._file = None
+        self._hasher = None
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.valid = True
+        hash_func = verification.CHECKSUM_FUNCTIONS.get(self.checksumtype)
+        if hash_func is not None:
+            self._hasher = hash_func()
+        else:
+            self._hasher = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'wb')
+        return self._file
+
+    @property
+    def closed(self):
+        return self._file is not None and self._file.closed
+
+    def write(self, data):
+        """
+        :param data:    bytes to write
+        :type  data:    str
+        """
+        f = self._open()
+        if f.tell() != self.size:
+            self.valid = False
+        f.write(data)
+        self.size += len(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+
+    def seek(self, offset, whence=0):
+        f = self._open()
+        f.seek(offset, whence)
+        # a downloader starting over is the only kind of seek we can follow
+        if f.tell() == 0:
+            self._reset()
+
+    def tell(self):
+        return self._open().tell()
+
+    def truncate(self, size=None):
+        f = self._open()
+        if size is None:
+            size = f.tell()
+        f.truncate(size)
+        if size == 0 and f.tell() == 0:
+            self._reset()
+        elif size < self.size:
+            self.valid = False
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """
+        Close the file, creating it first if nothing was ever written. This is
+        safe to call more than once.
+        """
+        self._open().close()
+
+    def hexdigest(self, checksumtype):
+        """
+        :param checksumtype:    type of checksum wanted
+        :type  checksumtype:    basestring
+
+        :return:    checksum of everything written, or None if it is not known
+                    for the given type
+        :rtype:     str or NoneType
+        """
+        if self._hasher is None or not self.valid or checksumtype != self.checksumtype:
+            return None
+        return self._hasher.hexdigest()
+
+
+def destination_path(destination):
+    """
+    :param destination: destination of a download request or report
+    :type  destination: basestring or HashingFile
+
+    :return:    full path to the downloaded file
+    :rtype:     basestring
+    """
+    if isinstance(destination, HashingFile):
+        return destination.path
+    return destination
+
+
+def close_destination(destination):
+    """
+    Close the destination of a download report if it is a HashingFile. Nectar
+    closes the files it opens itself.
+
+    :param destination: destination of a download report
+    :type  destination: basestring or HashingFile
+    """
+    if isinstance(destination, HashingFile):
+        destination.close()
+
+
+def verify_size(destination, expected_size):
+    """
+    Verify the size of a downloaded file, using the count of bytes written if
+    it was downloaded through a HashingFile, or else reading the file.
+
+    :param destination:     destination of a download report
+    :type  destination:     basestring or HashingFile
+    :param expected_size:   size the file should have
+    :type  expected_size:   int
+
+    :raises verification.VerificationException: if the size is incorrect,
+            with the actual size as its first argument
+    """
+    if isinstance(destination, HashingFile) and destination.valid:
+        if destination.size != expected_size:
+            raise verification.VerificationException(destination.size)
+        return
+
+    with open(destination_path(destination)) as dest_file:
+        verification.verify_size(dest_file, expected_size)
+
+
+def verify_checksum(destination, checksumtype, expected_checksum):
+    """
+    Verify the checksum of a downloaded file, using the checksum calculated
+    while it was written if it was downloaded through a HashingFile, or else
+    reading the file.
+
+    :param destination:         destination of a download report
+    :type  destination:         basestring or HashingFile
+    :param checksumtype:        type of the expected checksum
+    :type  checksumtype:        basestring
+    :param expected_checksum:   checksum the file should have
+    :type  expected_checksum:   basestring
+
+    :raises verification.VerificationException: if the checksum is incorrect,
+            with the actual checksum as its first argument
+    :raises verification.InvalidChecksumType: if the checksum type is not supported
+    """
+    if isinstance(destination, HashingFile):
+        actual_checksum = destination.hexdigest(checksumtype)
+        if actual_checksum is not None:
+            if actual_checksum != expected_checksum:
+                raise verification.VerificationException(actual_checksum)
+            return
+
+    with open(destination_path(destination)) as dest_file:
+        verification.verify_checksum(dest_file, checksumtype, expected_checksum)
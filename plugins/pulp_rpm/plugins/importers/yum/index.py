@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+from pulp_rpm.plugins.importers.yum.repomd import packages
+
+
+class PackageIndex(object):
+    """
+    Compact summary of one pass over a package metadata file, such as
+    primary.xml. It remembers where each remote package lives in the file, so
+    that later phases of a sync can decide what to download and what to purge
+    without parsing every package again.
+
+    :ivar locations:    dict where keys are units as named tuples for every
+                        package in the remote repository, and values are
+                        tuples of (offset, length) locating that package's XML
+                        in the decompressed metadata file
+    :type locations:    dict
+    :ivar wanted:       dict where keys are units as named tuples that should
+                        be in the local repository, and values are their sizes
+    :type wanted:       dict
+    :ivar to_download:  set of units as named tuples that are wanted but are
+                        not already in the local repository
+    :type to_download:  set
+    """
+
+    def __init__(self, package_tag, process_func, record_func=None, snippet_func=None,
+                 filter_func=None):
+        """
+        :param package_tag:     XML tag that identifies each package
+        :type  package_tag:     basestring
+        :param process_func:    function that takes one argument, of type
+                                xml.etree.ElementTree.Element, and returns a
+                                pulp_rpm.common.models.Package instance
+        :type  process_func:    function
+        :param record_func:     optional function that takes the same argument
+                                and returns a lighter-weight object with an
+                                as_named_tuple attribute, such as a
+                                pulp_rpm.common.models.PackageRecord, to be
+                                generated while indexing instead of full models
+        :type  record_func:     function
+        :param snippet_func:    optional function that takes a
+                                pulp_rpm.plugins.importers.yum.repomd.packages.PackageSnippets
+                                instance and one package's raw XML, and
+                                returns the same as process_func. It is used
+                                instead of process_func when generating models
+                                to download, so that the raw XML can be reused.
+        :type  snippet_func:    function
+        :param filter_func:     optional function that takes a unit as a named
+                                tuple and returns False if the package should
+                                be left out of the index entirely
+        :type  filter_func:     function
+        """
+        self.package_tag = package_tag
+        self.process_func = process_func
+        self.record_func = record_func or process_func
+        self.snippet_func = snippet_func
+        self.filter_func = filter_func
+        self.namespace_declarations = ''
+        self.locations = {}
+        self.wanted = {}
+        self.to_download = set()
+
+    def model_generator(self, xml_handle):
+        """
+        Parse every package in the file exactly once, recording each one's
+        location as it goes.
+
+        :param xml_handle:  open file handle pointing to the beginning of the
+                            metadata file
+        :type  xml_handle:  file-like object
+
+        :return:    generator of whatever record_func returns, which by default
+                    is pulp_rpm.common.models.Package instances, for the
+                    packages that pass filter_func
+        :rtype:     generator
+        """
+        snippets = packages.PackageSnippets(xml_handle, self.package_tag)
+        for offset, snippet in snippets:
+            self.namespace_declarations = snippets.namespace_declarations
+            model = self.record_func(snippets.parse(snippet))
+            if self.filter_func is not None and not self.filter_func(model.as_named_tuple):
+                continue
+            self.locations[model.as_named_tuple] = (offset, len(snippet))
+            yield model
+
+    @property
+    def remote_units(self):
+        """
+        :return:    new set of units as named tuples representing every package
+                    in the remote repository
+        :rtype:     set
+        """
+        return set(self.locations)
+
+    def download_generator(self, xml_handle):
+        """
+        Generate models for only those units that need to be downloaded, by
+        reading and parsing just their portion of the metadata file. Units are
+        generated in document order so that the file handle only ever has to
+        seek forward.
+
+        :param xml_handle:  open file handle pointing to the beginning of the
+                            same metadata file that was indexed
+        :type  xml_handle:  file-like object
+
+        :return:    generator of pulp_rpm.common.models.Package instances
+        :rtype:     generator
+        """
+        snippets = packages.PackageSnippets(xml_handle, self.package_tag)
+        snippets.namespace_declarations = self.namespace_declarations
+        for offset, length in sorted(self.locations[unit] for unit in self.to_download):
+            snippet = snippets.read(offset, length)
+            if self.snippet_func is not None:
+                yield self.snippet_func(snippets, snippet)
+            else:
+                yield self.process_func(snippets.parse(snippet))
@@ -13,22 +13,41 @@
 
 import logging
 import shutil
+import threading
+import traceback
 
 from nectar.listener import DownloadEventListener, AggregatingEventListener
 from pulp.common.plugins import importer_constants
 from pulp.plugins.util import verification
 
 from pulp_rpm.common import constants, models
+from pulp_rpm.common.progress import ProgressPublisher
+from pulp_rpm.plugins.importers.yum import hashing
+from pulp_rpm.plugins.importers.yum.writer import BatchWriter
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class DistroFileListener(AggregatingEventListener):
-    def __init__(self, progress_report, progress_callback):
+    def __init__(self, progress_report, progress_callback, validate=False):
+        """
+        :param progress_report:     report whose "items_left" is decremented
+                                    for each file
+        :type  progress_report:     pulp_rpm.plugins.importers.yum.report.DistributionReport
+        :param progress_callback:   function that takes no arguments and sends
+                                    the report, such as RepoSync.update_progress,
+                                    which coalesces the frequent per-file updates
+        :type  progress_callback:   function
+        :param validate:            if True, each file whose checksum is known
+                                    is verified, and counted as failed if the
+                                    checksum does not match
+        :type  validate:            bool
+        """
         super(DistroFileListener, self).__init__()
         self.progress_report = progress_report
         self.progress_callback = progress_callback
+        self.validate = validate
 
     def download_succeeded(self, report):
         """
@@ -37,9 +56,51 @@ class DistroFileListener(AggregatingEventListener):
         :type  report: nectar.report.DownloadReport
         :return:
         """
+        hashing.close_destination(report.destination)
+        error_report = self._verify(report)
+        # the rest of the distribution sync only needs the path
+        report.destination = hashing.destination_path(report.destination)
+        if error_report is not None:
+            report.error_report = error_report
+            self.download_failed(report)
+            return
         self._decrement()
         super(DistroFileListener, self).download_succeeded(report)
 
+    def _verify(self, report):
+        """
+        Verify the checksum of a downloaded file if validation is on and the
+        treeinfo file listed a checksum for it.
+
+        :param report:  report of a successful download
+        :type  report:  nectar.report.DownloadReport
+
+        :return:    error report describing why verification failed, or None
+        :rtype:     dict or NoneType
+        """
+        file_dict = report.data
+        if not self.validate or not file_dict or not file_dict.get('checksum'):
+            return None
+        try:
+            hashing.verify_checksum(report.destination, file_dict['checksumtype'],
+                                    file_dict['checksum'])
+        except verification.VerificationException, e:
+            return {
+                constants.NAME: file_dict['relativepath'],
+                constants.ERROR_CODE: constants.ERROR_CHECKSUM_VERIFICATION,
+                constants.CHECKSUM_TYPE: file_dict['checksumtype'],
+                constants.ERROR_KEY_CHECKSUM_EXPECTED: file_dict['checksum'],
+                constants.ERROR_KEY_CHECKSUM_ACTUAL: e[0]
+            }
+        except verification.InvalidChecksumType:
+            return {
+                constants.NAME: file_dict['relativepath'],
+                constants.ERROR_CODE: constants.ERROR_CHECKSUM_TYPE_UNKNOWN,
+                constants.CHECKSUM_TYPE: file_dict['checksumtype'],
+                constants.ACCEPTED_CHECKSUM_TYPES: verification.CHECKSUM_FUNCTIONS.keys()
+            }
+        return None
+
     def download_failed(self, report):
         """
 
@@ -47,6 +108,7 @@ class DistroFileListener(AggregatingEventListener):
         :type  report: nectar.report.DownloadReport
         :return:
         """
+        hashing.close_destination(report.destination)
         self._decrement()
         super(DistroFileListener, self).download_failed(report)
 
@@ -56,15 +118,35 @@ class DistroFileListener(AggregatingEventListener):
 
 
 class ContentListener(DownloadEventListener):
-    def __init__(self, sync_conduit, progress_report, sync_call_config, metadata_files):
+    def __init__(self, sync_conduit, progress_report, sync_call_config, metadata_files,
+                 batch_writes=False, progress_publisher=None):
         """
         :type sync_call_config: pulp.plugins.config.PluginCallConfig
+        :param batch_writes:    if True, downloaded units are verified and saved
+                                in batches on a separate thread, so downloading
+                                can continue while units are written. finish()
+                                must then be called once downloading is done.
+        :type  batch_writes:    bool
+        :param progress_publisher:  publisher to send the progress report through,
+                                    which should be shared with the sync so that
+                                    updates are coalesced. One is created for the
+                                    conduit if not provided.
+        :type  progress_publisher:  pulp_rpm.common.progress.ProgressPublisher
         """
         super(ContentListener, self).__init__()
         self.sync_conduit = sync_conduit
         self.progress_report = progress_report
         self.sync_call_config = sync_call_config
         self.metadata_files = metadata_files
+        self.progress_publisher = progress_publisher or ProgressPublisher(sync_conduit)
+        # the progress report may be updated by the writer thread and by the
+        # downloader's threads at the same time
+        self.progress_lock = threading.Lock()
+        if batch_writes:
+            self.writer = BatchWriter(self.save_units)
+            self.writer.start()
+        else:
+            self.writer = None
 
     def download_succeeded(self, report):
         """
@@ -72,31 +154,115 @@ class ContentListener(DownloadEventListener):
         :type  report: nectar.report.DownloadReport
         :return:
         """
-        model = report.data
+        # release the file right away, rather than once it is saved
+        hashing.close_destination(report.destination)
+        if self.writer is not None:
+            # blocks if the writer has fallen too far behind
+            self.writer.put(report)
+        else:
+            self.save_units([report])
 
-        try:
-            self._verify_size(model, report)
-            self._verify_checksum(model, report)
-        except verification.VerificationException:
-            # The verify methods populates the error details of the progress report.
-            # There is also no need to clean up the bad file as the sync will blow away
-            # the temp directory after it finishes. Simply punch out so the good unit
-            # handling below doesn't run.
-            return
-        except verification.InvalidChecksumType:
+    def save_units(self, reports):
+        """
+        Verify and save the units that were downloaded successfully. Repodata is
+        looked up for the whole batch at once, and progress is reported once.
+
+        :param reports: reports of successful downloads
+        :type  reports: list of nectar.report.DownloadReport
+        """
+        verified = []
+        for report in reports:
+            model = report.data
+            try:
+                self._verify_size(model, report)
+                self._verify_checksum(model, report)
+            except verification.VerificationException:
+                # The verify methods populates the error details of the progress report.
+                # There is also no need to clean up the bad file as the sync will blow away
+                # the temp directory after it finishes. Simply skip it so the good unit
+                # handling below doesn't run.
+                continue
+            except verification.InvalidChecksumType:
+                continue
+            verified.append(report)
+        if not verified:
             return
 
         # these are the only types we store repo metadata snippets on in the DB
-        if isinstance(model, (models.RPM, models.SRPM)):
-            self.metadata_files.add_repodata(model)
-        # init unit, which is idempotent
-        unit = self.sync_conduit.init_unit(model.TYPE, model.unit_key, model.metadata, model.relative_path)
-        # move to final location
-        shutil.move(report.destination, unit.storage_path)
-        # save unit
-        self.sync_conduit.save_unit(unit)
-        self.progress_report['content'].success(model)
-        self.sync_conduit.set_progress(self.progress_report)
+        rpm_models = [report.data for report in verified
+                      if isinstance(report.data, (models.RPM, models.SRPM))]
+        if rpm_models:
+            missing = set(id(model) for model in
+                          self.metadata_files.add_repodata_batch(rpm_models))
+        else:
+            missing = set()
+        for report in verified:
+            model = report.data
+            try:
+                if id(model) in missing:
+                    # look the unit up on its own, which reports what is missing
+                    self.metadata_files.add_repodata(model)
+                # init unit, which is idempotent
+                unit = self.sync_conduit.init_unit(model.TYPE, model.unit_key, model.metadata, model.relative_path)
+                # move to final location
+                shutil.move(hashing.destination_path(report.destination), unit.storage_path)
+                # save unit
+                self.sync_conduit.save_unit(unit)
+            except Exception, e:
+                # only this unit fails; the rest of the batch is still saved
+                _LOGGER.exception('failed to save %s' % model)
+                self._save_failed(model, report, e)
+                continue
+            with self.progress_lock:
+                self.progress_report['content'].success(model)
+        with self.progress_lock:
+            self.progress_publisher.update(self.progress_report)
+
+    def _save_failed(self, model, report, exception):
+        """
+        Note in the progress report that a downloaded unit could not be saved.
+
+        :param model:       domain model instance of the package that was downloaded
+        :type  model:       pulp_rpm.common.models.Package
+        :param report:      report handed to this listener by the downloader
+        :type  report:      nectar.report.DownloadReport
+        :param exception:   exception raised while saving the unit
+        :type  exception:   Exception
+        """
+        error_report = {
+            constants.UNIT_KEY: model.unit_key,
+            constants.ERROR_CODE: constants.ERROR_SAVE_FAILED,
+            'url': report.url,
+            'error': '%s: %s' % (type(exception).__name__, exception),
+            'traceback': traceback.format_exc().splitlines(),
+        }
+        with self.progress_lock:
+            self.progress_report['content'].failure(model, error_report)
+
+    def finish(self):
+        """
+        Wait until every downloaded unit has been saved. This does nothing
+        unless writes are batched.
+
+        :raise Exception: any exception raised while saving units
+        """
+        if self.writer is not None:
+            self.writer.flush()
+
+    def stop(self):
+        """
+        Save any remaining units and stop the writer thread, if there is one.
+        """
+        if self.writer is not None:
+            self.writer.stop()
+
+    def cancel(self):
+        """
+        Discard any downloaded units that have not been saved yet, and stop the
+        writer thread, if there is one.
+        """
+        if self.writer is not None:
+            self.writer.cancel()
 
     def download_failed(self, report):
         """
@@ -105,10 +271,12 @@ class ContentListener(DownloadEventListener):
         :type  report: nectar.report.DownloadReport
         :return:
         """
+        hashing.close_destination(report.destination)
         model = report.data
         report.error_report['url'] = report.url
-        self.progress_report['content'].failure(model, report.error_report)
-        self.sync_conduit.set_progress(self.progress_report)
+        with self.progress_lock:
+            self.progress_report['content'].failure(model, report.error_report)
+            self.progress_publisher.update(self.progress_report)
 
     def _verify_size(self, model, report):
         """
@@ -127,8 +295,7 @@ class ContentListener(DownloadEventListener):
             return
 
         try:
-            with open(report.destination) as dest_file:
-                verification.verify_size(dest_file, model.metadata['size'])
+            hashing.verify_size(report.destination, model.metadata['size'])
 
         except verification.VerificationException, e:
             error_report = {
@@ -137,7 +304,8 @@ class ContentListener(DownloadEventListener):
                 constants.ERROR_KEY_EXPECTED_SIZE: model.metadata['size'],
                 constants.ERROR_KEY_ACTUAL_SIZE: e[0]
             }
-            self.progress_report['content'].failure(model, error_report)
+            with self.progress_lock:
+                self.progress_report['content'].failure(model, error_report)
             raise
 
     def _verify_checksum(self, model, report):
@@ -157,9 +325,8 @@ class ContentListener(DownloadEventListener):
             return
 
         try:
-            with open(report.destination) as dest_file:
-                verification.verify_checksum(dest_file, model.unit_key['checksumtype'],
-                                             model.unit_key['checksum'])
+            hashing.verify_checksum(report.destination, model.unit_key['checksumtype'],
+                                    model.unit_key['checksum'])
 
         except verification.VerificationException, e:
             error_report = {
@@ -169,7 +336,8 @@ class ContentListener(DownloadEventListener):
                 constants.ERROR_KEY_CHECKSUM_EXPECTED: model.unit_key['checksum'],
                 constants.ERROR_KEY_CHECKSUM_ACTUAL: e[0]
             }
-            self.progress_report['content'].failure(model, error_report)
+            with self.progress_lock:
+                self.progress_report['content'].failure(model, error_report)
             raise
         except verification.InvalidChecksumType, e:
             error_report = {
@@ -178,5 +346,6 @@ class ContentListener(DownloadEventListener):
                 constants.CHECKSUM_TYPE: model.unit_key['checksumtype'],
                 constants.ACCEPTED_CHECKSUM_TYPES: verification.CHECKSUM_FUNCTIONS.keys()
             }
-            self.progress_report['content'].failure(model, error_report)
+            with self.progress_lock:
+                self.progress_report['content'].failure(model, error_report)
             raise
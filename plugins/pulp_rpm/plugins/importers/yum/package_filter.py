@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Include and exclude rules that limit which packages in primary.xml a sync
+considers at all. Packages that do not pass are dropped as soon as they are
+parsed, so they are never decided upon or downloaded. They are also treated as
+absent from the remote repository when missing units are removed.
+"""
+
+from gettext import gettext as _
+import fnmatch
+import re
+
+from pulp_rpm.common import constants
+
+
+ARCH_KEYS = (constants.CONFIG_INCLUDE_ARCHES, constants.CONFIG_EXCLUDE_ARCHES)
+NAME_KEYS = (constants.CONFIG_INCLUDE_NAMES, constants.CONFIG_EXCLUDE_NAMES)
+REGEX_KEYS = (constants.CONFIG_INCLUDE_REGEXES, constants.CONFIG_EXCLUDE_REGEXES)
+RULE_KEYS = ARCH_KEYS + NAME_KEYS + REGEX_KEYS
+
+
+class PackageFilter(object):
+    """
+    Decides whether a package should be synced, based on its arch, its name
+    and its "name-version-release.arch" string.
+
+    A package passes if it matches every kind of include rule that is given,
+    and does not match any exclude rule.
+    """
+
+    def __init__(self, include_arches=None, exclude_arches=None, include_names=None,
+                 exclude_names=None, include_regexes=None, exclude_regexes=None):
+        """
+        :param include_arches:  arches that packages must have
+        :type  include_arches:  list of basestring
+        :param exclude_arches:  arches that packages must not have
+        :type  exclude_arches:  list of basestring
+        :param include_names:   glob patterns, one of which package names must
+                                match
+        :type  include_names:   list of basestring
+        :param exclude_names:   glob patterns that package names must not match
+        :type  exclude_names:   list of basestring
+        :param include_regexes: regular expressions, one of which must be found
+                                in each package's "name-version-release.arch"
+        :type  include_regexes: list of basestring
+        :param exclude_regexes: regular expressions that must not be found in
+                                any package's "name-version-release.arch"
+        :type  exclude_regexes: list of basestring
+        """
+        self.include_arches = frozenset(include_arches) if include_arches else None
+        self.exclude_arches = frozenset(exclude_arches or ())
+        self.include_names = _compile_globs(include_names)
+        self.exclude_names = _compile_globs(exclude_names)
+        self.include_regexes = [re.compile(pattern) for pattern in include_regexes or ()]
+        self.exclude_regexes = [re.compile(pattern) for pattern in exclude_regexes or ()]
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config:  config object for the importer
+        :type  config:  pulp.plugins.config.PluginCallConfiguration
+
+        :return:    filter for the rules in the config, or None if there are none
+        :rtype:     PackageFilter or NoneType
+        """
+        rules = [config.get(key) for key in RULE_KEYS]
+        if not any(rules):
+            return None
+        return cls(*rules)
+
+    def wants(self, unit):
+        """
+        :param unit:    unit key of a package from primary.xml
+        :type  unit:    pulp_rpm.common.models.RPM.NAMEDTUPLE
+
+        :return:    True if the package passes the rules, else False
+        :rtype:     bool
+        """
+        return self._wants(unit.name, unit.version, unit.release, unit.arch)
+
+    def wants_drpm(self, drpm):
+        """
+        A DRPM passes if the package it builds passes the rules.
+
+        :param drpm:    DRPM model from the presto metadata
+        :type  drpm:    pulp_rpm.common.models.DRPM
+
+        :return:    True if the DRPM passes the rules, else False
+        :rtype:     bool
+        """
+        metadata = drpm.metadata
+        return self._wants(metadata['new_package'], drpm.version, drpm.release,
+                           metadata['arch'])
+
+    def _wants(self, name, version, release, arch):
+        """
+        :return:    True if a package with these fields passes the rules, else
+                    False
+        :rtype:     bool
+        """
+        if self.include_arches is not None and arch not in self.include_arches:
+            return False
+        if arch in self.exclude_arches:
+            return False
+
+        if self.include_names is not None and not self.include_names.match(name):
+            return False
+        if self.exclude_names is not None and self.exclude_names.match(name):
+            return False
+
+        if self.include_regexes or self.exclude_regexes:
+            nvra = '%s-%s-%s.%s' % (name, version, release, arch)
+            if self.include_regexes and \
+                    not any(regex.search(nvra) for regex in self.include_regexes):
+                return False
+            if any(regex.search(nvra) for regex in self.exclude_regexes):
+                return False
+        return True
+
+    def filter(self, packages):
+        """
+        :param packages:    iterable of objects with an as_named_tuple
+                            attribute, such as models or PackageRecords
+        :type  packages:    iterable
+
+        :return:    generator of the packages that pass the rules
+        :rtype:     generator
+        """
+        wants = self.wants
+        for package in packages:
+            if wants(package.as_named_tuple):
+                yield package
+
+    def filter_drpms(self, drpms):
+        """
+        :param drpms:   iterable of DRPM models
+        :type  drpms:   iterable
+
+        :return:    generator of the DRPMs whose new packages pass the rules
+        :rtype:     generator
+        """
+        wants_drpm = self.wants_drpm
+        for drpm in drpms:
+            if wants_drpm(drpm):
+                yield drpm
+
+
+def validate(config):
+    """
+    Check the filter rules in an importer config.
+
+    :param config:  config object for the importer
+    :type  config:  pulp.plugins.config.PluginCallConfiguration
+
+    :return:    list of failure messages, which is empty if the rules are valid
+    :rtype:     list
+    """
+    failure_messages = []
+    for key in RULE_KEYS:
+        value = config.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, (list, tuple)) or \
+                not all(isinstance(item, basestring) for item in value):
+            failure_messages.append(
+                _('The configuration parameter <%(name)s> must be a list of strings') %
+                {'name': key})
+            continue
+        if key in REGEX_KEYS:
+            for pattern in value:
+                try:
+                    re.compile(pattern)
+                except re.error, e:
+                    failure_messages.append(
+                        _('The configuration parameter <%(name)s> has an invalid regular '
+                          'expression <%(pattern)s>: %(error)s') %
+                        {'name': key, 'pattern': pattern, 'error': e})
+    return failure_messages
+
+
+def _compile_globs(patterns):
+    """
+    :param patterns:    glob patterns
+    :type  patterns:    list of basestring
+
+    :return:    one regular expression that matches any of the patterns, or None
+                if there are no patterns
+    :rtype:     re.RegexObject or NoneType
+    """
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:%s)' % fnmatch.translate(pattern) for pattern in patterns))
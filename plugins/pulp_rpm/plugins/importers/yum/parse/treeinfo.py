@@ -21,6 +21,7 @@ from nectar.listener import AggregatingEventListener
 from nectar.request import DownloadRequest
 
 from pulp_rpm.common import constants, ids, models
+from pulp_rpm.plugins.importers.yum.hashing import HashingFile
 from pulp_rpm.plugins.importers.yum.listener import DistroFileListener
 from pulp_rpm.plugins.importers.yum.repomd import nectar_factory
 
@@ -32,7 +33,8 @@ KEY_PACKAGEDIR = 'packagedir'
 _LOGGER = logging.getLogger(__name__)
 
 
-def sync(sync_conduit, feed, working_dir, nectar_config, report, progress_callback):
+def sync(sync_conduit, feed, working_dir, nectar_config, report, progress_callback,
+         validate=False, hash_downloads=False, downloader_pool=None):
     """
     Look for a distribution in the target repo and sync it if found
 
@@ -49,50 +51,128 @@ def sync(sync_conduit, feed, working_dir, nectar_config, report, progress_callba
     :type  report:              pulp_rpm.plugins.importers.yum.report.DistributionReport
     :param progress_callback:   function that takes no arguments but induces
                                 the current progress report to be sent.
+    :param validate:            if True, files are verified against the
+                                checksums listed in the treefile
+    :type  validate:            bool
+    :param hash_downloads:      if True, files are hashed as they are
+                                downloaded, so they need not be read again to
+                                be verified
+    :type  hash_downloads:      bool
+    :param downloader_pool:     if given, downloaders are borrowed from this
+                                pool instead of being created
+    :type  downloader_pool:     pulp_rpm.plugins.importers.yum.repomd.nectar_factory.DownloaderPool
     """
     # this temporary dir will hopefully be moved to the unit's storage path
     # if all downloads go well. If not, it will be deleted below, ensuring a
     # complete cleanup
     tmp_dir = tempfile.mkdtemp(dir=working_dir)
     try:
-        treefile_path = get_treefile(feed, tmp_dir, nectar_config)
-        if not treefile_path:
-            _LOGGER.debug('no treefile found')
-            report['state'] = constants.STATE_COMPLETE
+        distribution = prepare(feed, tmp_dir, nectar_config, report, progress_callback,
+                               validate, hash_downloads, downloader_pool)
+        if distribution is None:
             return
-
-        try:
-            model, files = parse_treefile(treefile_path)
-        except ValueError:
-            _LOGGER.error('could not parse treefile')
-            report['state'] = constants.STATE_FAILED
-            return
-
-        report.set_initial_values(len(files))
-        listener = DistroFileListener(report, progress_callback)
-        downloader = nectar_factory.create_downloader(feed, nectar_config, listener)
+        model, listener, requests = distribution
+        downloader = _get_downloader(feed, nectar_config, listener, downloader_pool)
         _LOGGER.debug('downloading distribution files')
-        downloader.download(file_to_download_request(f, feed, tmp_dir) for f in files)
-        if len(listener.failed_reports) == 0:
-            unit = sync_conduit.init_unit(ids.TYPE_ID_DISTRO, model.unit_key, model.metadata, model.relative_path)
-            model.process_download_reports(listener.succeeded_reports)
-            # remove pre-existing dir
-            shutil.rmtree(unit.storage_path, ignore_errors=True)
-            shutil.move(tmp_dir, unit.storage_path)
-            # mkdtemp is very paranoid, so we'll change to more sensible perms
-            os.chmod(unit.storage_path, 0o775)
-            sync_conduit.save_unit(unit)
-        else:
-            _LOGGER.error('some distro file downloads failed')
-            report['state'] = constants.STATE_FAILED
-            report['error_details'] = [(fail.url, fail.error_report) for fail in listener.failed_reports]
-            return
-        report['state'] = constants.STATE_COMPLETE
+        try:
+            downloader.download(requests)
+        finally:
+            if downloader_pool is not None:
+                downloader_pool.release(downloader)
+        finish(sync_conduit, tmp_dir, model, listener, report)
     finally:
         shutil.rmtree(tmp_dir, ignore_errors=True)
 
 
-def file_to_download_request(file_dict, feed, storage_path):
+def prepare(feed, tmp_dir, nectar_config, report, progress_callback, validate=False,
+            hash_downloads=False, downloader_pool=None):
+    """
+    Download and parse the treefile, if there is one, and set up the download
+    of the distribution's files. This allows the files to be downloaded along
+    with other content; once they are, call finish().
+
+    :param feed:                URL of the yum repo being sync'd
+    :type  feed:                basestring
+    :param tmp_dir:             full path to an empty temporary directory, to
+                                which files should be downloaded
+    :type  tmp_dir:             basestring
+    :param nectar_config:       download config to be used by nectar
+    :type  nectar_config:       nectar.config.DownloaderConfig
+    :param report:              progress report object
+    :type  report:              pulp_rpm.plugins.importers.yum.report.DistributionReport
+    :param progress_callback:   function that takes no arguments but induces
+                                the current progress report to be sent.
+    :param validate:            if True, files are verified against the
+                                checksums listed in the treefile
+    :type  validate:            bool
+    :param hash_downloads:      if True, files are hashed as they are downloaded
+    :type  hash_downloads:      bool
+    :param downloader_pool:     if given, the treefile is downloaded with a
+                                downloader borrowed from this pool
+    :type  downloader_pool:     pulp_rpm.plugins.importers.yum.repomd.nectar_factory.DownloaderPool
+
+    :return:    tuple of the Distribution model, the listener that must receive
+                the download events, and a generator of download requests, or
+                None if there is no distribution to sync, in which case the
+                report's state has been set.
+    :rtype:     tuple or NoneType
+    """
+    treefile_path = get_treefile(feed, tmp_dir, nectar_config, downloader_pool)
+    if not treefile_path:
+        _LOGGER.debug('no treefile found')
+        report['state'] = constants.STATE_COMPLETE
+        return None
+
+    try:
+        model, files = parse_treefile(treefile_path)
+    except ValueError:
+        _LOGGER.error('could not parse treefile')
+        report['state'] = constants.STATE_FAILED
+        return None
+
+    report.set_initial_values(len(files))
+    listener = DistroFileListener(report, progress_callback, validate)
+    requests = (file_to_download_request(f, feed, tmp_dir, hash_downloads) for f in files)
+    return model, listener, requests
+
+
+def finish(sync_conduit, tmp_dir, model, listener, report):
+    """
+    Once the distribution's files have been downloaded, save the distribution
+    unit if all of them succeeded.
+
+    :param sync_conduit:    conduit provided by the platform
+    :type  sync_conduit:    pulp.plugins.conduits.repo_sync.RepoSyncConduit
+    :param tmp_dir:         full path to the directory the files were
+                            downloaded to, which is moved to the unit's
+                            storage path
+    :type  tmp_dir:         basestring
+    :param model:           the distribution, as returned by prepare()
+    :type  model:           pulp_rpm.common.models.Distribution
+    :param listener:        the listener returned by prepare(), after it has
+                            received the events for every request
+    :type  listener:        pulp_rpm.plugins.importers.yum.listener.DistroFileListener
+    :param report:          progress report object
+    :type  report:          pulp_rpm.plugins.importers.yum.report.DistributionReport
+    """
+    if len(listener.failed_reports) == 0:
+        unit = sync_conduit.init_unit(ids.TYPE_ID_DISTRO, model.unit_key, model.metadata, model.relative_path)
+        model.process_download_reports(listener.succeeded_reports)
+        # remove pre-existing dir
+        shutil.rmtree(unit.storage_path, ignore_errors=True)
+        shutil.move(tmp_dir, unit.storage_path)
+        # mkdtemp is very paranoid, so we'll change to more sensible perms
+        os.chmod(unit.storage_path, 0o775)
+        sync_conduit.save_unit(unit)
+    else:
+        _LOGGER.error('some distro file downloads failed')
+        report['state'] = constants.STATE_FAILED
+        report['error_details'] = [(fail.url, fail.error_report) for fail in listener.failed_reports]
+        return
+    report['state'] = constants.STATE_COMPLETE
+
+
+def file_to_download_request(file_dict, feed, storage_path, hash_download=False):
     """
     Takes information about a file described in a treeinfo file and turns that
     into a download request suitable for use with nectar.
@@ -105,6 +185,9 @@ def file_to_download_request(file_dict, feed, storage_path):
     :param storage_path:    full filesystem path to where the downloaded files
                             should be saved.
     :type  storage_path:    basestring
+    :param hash_download:   if True, the file is written through a HashingFile
+                            that calculates its checksum as it is downloaded
+    :type  hash_download:   bool
 
     :return:    new download request
     :rtype:     nectar.request.DownloadRequest
@@ -113,6 +196,8 @@ def file_to_download_request(file_dict, feed, storage_path):
     # make directories such as "images"
     if not os.path.exists(os.path.dirname(savepath)):
         os.makedirs(os.path.dirname(savepath))
+    if hash_download:
+        savepath = HashingFile(savepath, file_dict['checksumtype'])
 
     return DownloadRequest(
         os.path.join(feed, file_dict['relativepath']),
@@ -121,7 +206,7 @@ def file_to_download_request(file_dict, feed, storage_path):
     )
 
 
-def get_treefile(feed, tmp_dir, nectar_config):
+def get_treefile(feed, tmp_dir, nectar_config, downloader_pool=None):
     """
     Download the treefile and return its full path on disk, or None if not found
 
@@ -131,19 +216,46 @@ def get_treefile(feed, tmp_dir, nectar_config):
     :type  tmp_dir:         str
     :param nectar_config:   download config to be used by nectar
     :type  nectar_config:   nectar.config.DownloaderConfig
+    :param downloader_pool: if given, the downloader is borrowed from this pool
+    :type  downloader_pool: pulp_rpm.plugins.importers.yum.repomd.nectar_factory.DownloaderPool
 
     :return:        full path to treefile on disk, or None if not found
     :rtype:         str or NoneType
     """
-    for filename in constants.TREE_INFO_LIST:
-        path = os.path.join(tmp_dir, filename)
-        url = os.path.join(feed, filename)
-        request = DownloadRequest(url, path)
-        listener = AggregatingEventListener()
-        downloader = nectar_factory.create_downloader(feed, nectar_config, listener)
-        downloader.download([request])
-        if len(listener.succeeded_reports) == 1:
-            return path
+    # one downloader tries each name in turn, until one is found
+    listener = AggregatingEventListener()
+    downloader = _get_downloader(feed, nectar_config, listener, downloader_pool)
+    try:
+        for filename in constants.TREE_INFO_LIST:
+            path = os.path.join(tmp_dir, filename)
+            url = os.path.join(feed, filename)
+            request = DownloadRequest(url, path)
+            downloader.download([request])
+            if listener.succeeded_reports:
+                return path
+    finally:
+        if downloader_pool is not None:
+            downloader_pool.release(downloader)
+
+
+def _get_downloader(feed, nectar_config, listener, downloader_pool):
+    """
+    :param feed:            URL to the repository
+    :type  feed:            str
+    :param nectar_config:   download config to be used by nectar
+    :type  nectar_config:   nectar.config.DownloaderConfig
+    :param listener:        listener that will receive the download events
+    :type  listener:        nectar.listener.DownloadEventListener
+    :param downloader_pool: pool to borrow the downloader from, or None to
+                            create a new one
+    :type  downloader_pool: pulp_rpm.plugins.importers.yum.repomd.nectar_factory.DownloaderPool
+
+    :return:    a nectar downloader instance
+    :rtype:     nectar.downloaders.base.Downloader
+    """
+    if downloader_pool is not None:
+        return downloader_pool.get(feed, listener)
+    return nectar_factory.create_downloader(feed, nectar_config, listener)
 
 
 def parse_treefile(path):
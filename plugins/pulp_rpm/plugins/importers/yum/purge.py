@@ -16,10 +16,12 @@ from pulp.server.db.model.criteria import UnitAssociationCriteria
 from pulp.server.managers.repo.unit_association import OWNER_TYPE_IMPORTER
 
 from pulp_rpm.common import models
+from pulp_rpm.plugins.importers.yum import retention
+from pulp_rpm.plugins.importers.yum.package_filter import PackageFilter
 from pulp_rpm.plugins.importers.yum.repomd import packages, primary, presto, updateinfo, group
 
 
-def purge_unwanted_units(metadata_files, conduit, config):
+def purge_unwanted_units(metadata_files, conduit, config, rpm_index=None, parse_processes=None):
     """
     START HERE - this is probably the method you want to call in this module
 
@@ -35,9 +37,22 @@ def purge_unwanted_units(metadata_files, conduit, config):
     :type  conduit:         pulp.plugins.conduits.repo_sync.RepoSyncConduit
     :param config:          config object for this plugin
     :type  config:          pulp.plugins.config.PluginCallConfiguration
+    :param rpm_index:       optional index of primary.xml built earlier in the
+                            sync. If provided, it is used to determine which
+                            RPMs are in the remote repository instead of
+                            parsing primary.xml again.
+    :type  rpm_index:       pulp_rpm.plugins.importers.yum.index.PackageIndex
+    :param parse_processes: number of worker processes that parse primary.xml
+                            if there is no rpm_index. See
+                            packages.package_list_generator.
+    :type  parse_processes: int
     """
     if config.get_boolean(importer_constants.KEY_UNITS_REMOVE_MISSING) is True:
-        remove_missing_rpms(metadata_files, conduit)
+        if rpm_index is None:
+            remove_missing_rpms(metadata_files, conduit, parse_processes,
+                                PackageFilter.from_config(config))
+        else:
+            remove_missing_units(metadata_files, conduit, models.RPM, rpm_index.remote_units)
         remove_missing_drpms(metadata_files, conduit)
         remove_missing_errata(metadata_files, conduit)
         remove_missing_groups(metadata_files, conduit)
@@ -63,33 +78,38 @@ def remove_old_versions(num_to_keep, conduit):
     :type  conduit:     pulp.plugins.conduits.repo_sync.RepoSyncConduit
     """
     for model in (models.RPM, models.SRPM, models.DRPM):
-        units = {}
+        retainer = retention.VersionRetainer(num_to_keep)
         for unit in get_existing_units(model, conduit.get_units):
-            model_instance = model(metadata=unit.metadata, **unit.unit_key)
-            key = model_instance.key_string_without_version
-            serialized_version = model_instance.complete_version_serialized
-            versions = units.setdefault(key, {})
-            versions[serialized_version] = unit
+            record = models.PackageRecord(model, model.NAMEDTUPLE(**unit.unit_key), None)
+            # if we are over the limit, the oldest is evicted
+            evicted = retainer.add(record.key_string_without_version,
+                                   record.complete_version, unit)
+            if evicted is not None:
+                conduit.remove_unit(evicted)
 
-            # if we are over the limit, evict the oldest
-            if len(versions) > num_to_keep:
-                oldest_version = min(versions)
-                conduit.remove_unit(versions.pop(oldest_version))
 
-
-def remove_missing_rpms(metadata_files, conduit):
+def remove_missing_rpms(metadata_files, conduit, processes=None, package_filter=None):
     """
     Remove RPMs from the local repository which do not exist in the remote
-    repository.
+    repository, or which the remote repository has but are filtered out.
 
     :param metadata_files:  object containing metadata files from the repo
     :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
     :param conduit:         a conduit from the platform containing the get_units
                             and remove_unit methods.
     :type  conduit:         pulp.plugins.conduits.repo_sync.RepoSyncConduit
+    :param processes:       optional number of worker processes that should
+                            parse primary.xml
+    :type  processes:       int
+    :param package_filter:  optional filter that remote packages must pass
+    :type  package_filter:  pulp_rpm.plugins.importers.yum.package_filter.PackageFilter
     """
     remote_named_tuples = get_remote_units(metadata_files, primary.METADATA_FILE_NAME,
-                                            primary.PACKAGE_TAG, primary.process_package_element)
+                                            primary.PACKAGE_TAG, primary.process_package_record,
+                                            processes)
+    if package_filter is not None:
+        remote_named_tuples = set(unit for unit in remote_named_tuples
+                                  if package_filter.wants(unit))
     remove_missing_units(metadata_files, conduit, models.RPM, remote_named_tuples)
 
 
@@ -204,7 +224,7 @@ def get_existing_units(model, unit_search_func):
     return unit_search_func(criteria)
 
 
-def get_remote_units(metadata_files, file_name, tag, process_func):
+def get_remote_units(metadata_files, file_name, tag, process_func, processes=None):
     """
     return a set of units (as named tuples) that are in the remote repository
 
@@ -222,6 +242,10 @@ def get_remote_units(metadata_files, file_name, tag, process_func):
                             equivalent, and returns a dictionary containing
                             metadata about the unit
     :type  process_func:    function
+    :param processes:       optional number of worker processes that should
+                            parse the file, in which case process_func and
+                            what it returns must be picklable
+    :type  processes:       int
 
     :return:    set of named tuples representing units
     :rtype:     set
@@ -233,11 +257,15 @@ def get_remote_units(metadata_files, file_name, tag, process_func):
     try:
         package_info_generator = packages.package_list_generator(file_handle,
                                                                  tag,
-                                                                 process_func)
-
-        for model in package_info_generator:
-            named_tuple = model.as_named_tuple
-            remote_named_tuples.add(named_tuple)
+                                                                 process_func,
+                                                                 processes=processes)
+        try:
+            for model in package_info_generator:
+                named_tuple = model.as_named_tuple
+                remote_named_tuples.add(named_tuple)
+        finally:
+            # stops any worker processes parsing the file if this fails
+            package_info_generator.close()
 
     finally:
         file_handle.close()
@@ -27,7 +27,20 @@ def process_package_element(element):
                 values are full filesystem paths as strings.
     :rtype:     tuple(dict, dict)
     """
-    version_element = element.find('version')
+    version_element = None
+    files = []
+    dirs = []
+    # one pass over the children, rather than a find() and a findall()
+    for child in element:
+        tag = child.tag
+        if tag == 'file':
+            if child.attrib.get('type') == 'dir':
+                dirs.append(child.text)
+            else:
+                files.append(child.text)
+        elif tag == 'version' and version_element is None:
+            version_element = child
+
     unit_key = {
         'name': element.attrib['name'],
         'epoch': version_element.attrib['epoch'],
@@ -35,30 +48,5 @@ def process_package_element(element):
         'release': version_element.attrib['rel'],
         'arch': element.attrib['arch'],
     }
-    files = _sort_files_from_dirs(element.findall('file'))
-
-    return unit_key, files
-
-
-def _sort_files_from_dirs(elements):
-    """
-    For each "file" entry for a package, determine if it is a directory or not,
-    and sort accordingly. This is for storage in Pulp's database directly on the
-    RPM object.
-
-    :param elements:    list of xml.etree.ElementTree.Element instances
-    :type  elements:    list
-
-    :return:    dictionary containing keys "file" and "dir" where
-                values are full filesystem paths as strings.
-    :rtype:     dict
-    """
-    files = []
-    dirs = []
-    for element in elements:
-        if element.attrib.get('type') == 'dir':
-            dirs.append(element.text)
-        else:
-            files.append(element.text)
 
-    return {'file': files, 'dir': dirs}
\ No newline at end of file
+    return unit_key, {'file': files, 'dir': dirs}
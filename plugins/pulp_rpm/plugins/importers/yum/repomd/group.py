@@ -14,6 +14,7 @@
 import logging
 
 from pulp_rpm.common import models
+from pulp_rpm.plugins.importers.yum import utils
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -36,18 +37,21 @@ def process_group_element(repo_id, element):
     :return:    models.PackageGroup instance for the XML block
     :rtype:     pulp_rpm.common.models.PackageGroup
     """
-    packagelist = element.find('packagelist')
-    conditional, default, mandatory, optional = _parse_packagelist(packagelist.findall('packagereq'))
-    langonly = element.find('langonly') or element.find('lang_only')
-    name, translated_name = _parse_translated(element.findall('name'))
-    description, translated_description = _parse_translated(element.findall('description'))
-    display_order = element.find('display_order')
+    children = {'name': [], 'description': []}
+    utils.dispatch_children(element, children, _GROUP_HANDLERS, _TRANSLATED_HANDLERS)
+
+    conditional, default, mandatory, optional = _parse_packagelist(
+        children['packagelist'].findall('packagereq'))
+    langonly = children.get('langonly') or children.get('lang_only')
+    name, translated_name = _parse_translated(children['name'])
+    description, translated_description = _parse_translated(children['description'])
+    display_order = children.get('display_order')
     # yum.comps.Group.parse suggests that this should default to False
-    group_default = _parse_bool(element.find('default').text)\
-        if element.find('default') is not None else False
+    group_default = _parse_bool(children['default'].text)\
+        if children.get('default') is not None else False
     # yum.comps.Group.__init__ suggests that this should default to True
-    user_visible = _parse_bool(element.find('uservisible').text)\
-        if element.find('uservisible') is not None else True
+    user_visible = _parse_bool(children['uservisible'].text)\
+        if children.get('uservisible') is not None else True
 
     return models.PackageGroup.from_package_info({
         'conditional_package_names': conditional,
@@ -56,7 +60,7 @@ def process_group_element(repo_id, element):
         'description': description,
         # default of 1024 is from yum's own parsing of these objects
         'display_order': int(display_order.text) if display_order else 1024,
-        'id': element.find('id').text,
+        'id': children['id'].text,
         'langonly': langonly.text if langonly else None,
         'mandatory_package_names': mandatory,
         'name': name,
@@ -80,17 +84,20 @@ def process_category_element(repo_id, element):
     :return:    models.PackageCategory instance for the XML block
     :rtype:     pulp_rpm.common.models.PackageCategory
     """
-    description, translated_description = _parse_translated(element.findall('description'))
-    name, translated_name = _parse_translated(element.findall('name'))
-    display_order = element.find('display_order')
-    groups = element.find('grouplist').findall('groupid')
+    children = {'name': [], 'description': []}
+    utils.dispatch_children(element, children, _CATEGORY_HANDLERS, _TRANSLATED_HANDLERS)
+
+    description, translated_description = _parse_translated(children['description'])
+    name, translated_name = _parse_translated(children['name'])
+    display_order = children.get('display_order')
+    groups = children['grouplist'].findall('groupid')
 
     return models.PackageCategory.from_package_info({
         'description': description,
         # default of 1024 is from yum's own parsing of these objects
         'display_order': int(display_order.text) if display_order is not None else 1024,
         'packagegroupids': [group.text for group in groups],
-        'id': element.find('id').text,
+        'id': children['id'].text,
         'name': name,
         'repo_id': repo_id,
         'translated_description': translated_description,
@@ -165,3 +172,28 @@ def _parse_translated(items):
         else:
             value = item.text
     return value, translated_value
+
+
+# child element handlers -------------------------------------------------------
+
+# groups and categories are small, so the handlers just collect the children
+# they need in one pass, instead of calling find() and findall() for each
+
+def _keep_handler(tag):
+    def handler(children, element):
+        children[tag] = element
+    return handler
+
+
+def _append_handler(tag):
+    def handler(children, element):
+        children[tag].append(element)
+    return handler
+
+
+_GROUP_HANDLERS = dict((tag, _keep_handler(tag)) for tag in (
+    'id', 'packagelist', 'langonly', 'lang_only', 'display_order', 'default', 'uservisible'))
+
+_CATEGORY_HANDLERS = dict((tag, _keep_handler(tag)) for tag in ('id', 'display_order', 'grouplist'))
+
+_TRANSLATED_HANDLERS = dict((tag, _append_handler(tag)) for tag in ('name', 'description'))
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Zero-copy "downloads" from a feed on the local filesystem.
+
+Rather than reading every file and writing it out again, each file is hard
+linked to its destination, or cloned if the filesystem supports reflinks, and
+only copied if neither is possible. When the destination is on the same
+filesystem as the content store, the unit is then moved into place with a
+rename, so its bytes are never copied at all.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import urllib
+import urlparse
+
+from nectar.downloaders.base import Downloader
+from nectar.report import DownloadReport
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# ioctl request that makes a file share the data blocks of another, on
+# filesystems that support it, such as btrfs and xfs
+FICLONE = 0x40049409
+
+# size of each chunk when a file must be copied into a file-like destination
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class LocalLinkDownloader(Downloader):
+    """
+    Downloader for file:// URLs that links each file to its destination path
+    instead of copying it. A destination that is a file-like object, such as a
+    HashingFile, is written to instead, since it must see every byte.
+
+    Linked files share their data with the feed, so a feed whose files are
+    modified in place, rather than replaced, should not be synced this way.
+    """
+
+    def download(self, requests):
+        """
+        :param requests:    download requests, whose URLs must all be file:// URLs
+        :type  requests:    iterable of nectar.request.DownloadRequest
+        """
+        for request in requests:
+            if self.is_canceled:
+                break
+            report = DownloadReport(request.url, request.destination, request.data)
+            self.event_listener.download_started(report)
+            try:
+                source_path = url_to_path(request.url)
+                if isinstance(request.destination, basestring):
+                    link_or_copy(source_path, request.destination)
+                else:
+                    _copy_to_file(source_path, request.destination)
+                report.bytes_downloaded = os.path.getsize(source_path)
+            except (IOError, OSError), e:
+                _LOGGER.debug('could not link %s: %s' % (request.url, e))
+                report.error_msg = str(e)
+                self.event_listener.download_failed(report)
+                continue
+            self.event_listener.download_succeeded(report)
+
+
+def url_to_path(url):
+    """
+    :param url: a file:// URL
+    :type  url: basestring
+
+    :return:    full path to the file on the local filesystem
+    :rtype:     basestring
+    """
+    return urllib.url2pathname(urlparse.urlparse(url).path)
+
+
+def link_or_copy(source_path, destination_path):
+    """
+    Make the file at destination_path have the same contents as the file at
+    source_path, by hard linking it if possible, else by cloning it if the
+    filesystem supports reflinks, or else by copying it.
+
+    :param source_path:         full path to an existing file
+    :type  source_path:         basestring
+    :param destination_path:    full path where the file should appear. Any
+                                file already there is replaced.
+    :type  destination_path:    basestring
+
+    :raises IOError, OSError:   if the file cannot be linked or copied
+    """
+    if os.path.lexists(destination_path):
+        os.remove(destination_path)
+    try:
+        os.link(source_path, destination_path)
+        return
+    except OSError, e:
+        # a different filesystem, or links to files we do not own are forbidden
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK):
+            raise
+    if _reflink(source_path, destination_path):
+        return
+    shutil.copyfile(source_path, destination_path)
+
+
+def _reflink(source_path, destination_path):
+    """
+    :param source_path:         full path to an existing file
+    :type  source_path:         basestring
+    :param destination_path:    full path to a file that does not exist
+    :type  destination_path:    basestring
+
+    :return:    True if the destination was created as a clone of the source,
+                else False, in which case the destination does not exist
+    :rtype:     bool
+    """
+    with open(source_path, 'rb') as source_file:
+        with open(destination_path, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                return True
+            except IOError:
+                pass
+    os.remove(destination_path)
+    return False
+
+
+def _copy_to_file(source_path, destination):
+    """
+    :param source_path: full path to an existing file
+    :type  source_path: basestring
+    :param destination: file-like object to write the file's contents to
+    :type  destination: file-like object
+    """
+    with open(source_path, 'rb') as source_file:
+        while True:
+            chunk = source_file.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            destination.write(chunk)
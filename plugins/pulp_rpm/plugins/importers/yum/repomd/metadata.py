@@ -12,22 +12,29 @@
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
 from copy import deepcopy
-import gdbm
+import cPickle
 import gzip
-import hashlib
 import logging
 import lzma
+import mmap
+import multiprocessing
 import os
+import Queue
+import re
+import sqlite3
+import threading
+import time
+import traceback
 from urlparse import urljoin
-from xml.etree import ElementTree
+from xml.etree import cElementTree as ElementTree
 from xml.etree.cElementTree import iterparse
 
 from nectar.listener import AggregatingEventListener
 from nectar.request import DownloadRequest
-from pulp_rpm.plugins.importers.yum import utils
+from pulp.plugins.util import verification
+from pulp_rpm.plugins.importers.yum import hashing, utils
 
 from pulp_rpm.plugins.importers.yum.repomd import filelists, nectar_factory, other, packages
-from pulp_rpm.plugins.importers.yum.repomd.packages import package_list_generator
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -60,6 +67,41 @@ FILE_INFO_SKEL = {'name': None,
                   'open_checksum': {'algorithm': None, 'hex_digest': None},
                   'open_size': None}
 
+# repodata databases -----------------------------------------------------------
+
+# the filelists and other data for each package is stored in a sqlite database
+# that is indexed on the package's db key.
+REPODATA_TABLE_SCHEMA = 'CREATE TABLE repodata (db_key TEXT PRIMARY KEY, raw_xml TEXT, items BLOB)'
+REPODATA_INSERT = 'INSERT OR REPLACE INTO repodata (db_key, raw_xml, items) VALUES (?, ?, ?)'
+REPODATA_SELECT = 'SELECT db_key, raw_xml, items FROM repodata WHERE db_key IN (%s)'
+REPODATA_SELECT_ALL = 'SELECT db_key, raw_xml, items FROM repodata ORDER BY db_key'
+
+# metadata files that a db is generated from, with the tag that identifies
+# each package and the function that processes it
+REPODATA_DB_FILES = (
+    (filelists.METADATA_FILE_NAME, filelists.PACKAGE_TAG, filelists.process_package_element),
+    (other.METADATA_FILE_NAME, other.PACKAGE_TAG, other.process_package_element),
+)
+
+# sqlite limits the number of parameters in one statement to 999
+REPODATA_LOOKUP_PAGE_SIZE = 500
+
+# how many packages a db worker processes between progress messages
+REPODATA_PROGRESS_INTERVAL = 1000
+# how many seconds to wait for a message from a db worker before checking
+# whether it is still alive
+REPODATA_WORKER_POLL_TIMEOUT = 1
+
+# used by the lazy mode to find a package's unit key in filelists.xml and
+# other.xml without parsing its XML
+PACKAGE_ATTRIBUTE_RE = re.compile(r'''\s(name|arch)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+VERSION_TAG_RE = re.compile(r'<(?:\w+:)?version\s[^>]*>')
+VERSION_ATTRIBUTE_RE = re.compile(r'''\s(epoch|ver|rel)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+VERSION_ATTRIBUTE_NAMES = {'epoch': 'epoch', 'ver': 'version', 'rel': 'release'}
+
+# size of each chunk read while decompressing a metadata file into the cache
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
 # metadata files downloader, parser, and validator -----------------------------
 
 class MetadataFiles(object):
@@ -75,7 +117,7 @@ class MetadataFiles(object):
     2. call `download_repomd` method
     3. call `parse_repomd` method
     4. call `download_metadata_files` method
-    5. optionally call `validate_metadata_files` method
+    5. optionally call `verify_metadata_files` method
 
     If all goes well, the instance will have have populated its `metadata` dict
     with `key` -> file path information
@@ -105,7 +147,7 @@ class MetadataFiles(object):
                    'primary', 'primary_db',
                    'updateinfo', 'updateinfo_db'])
 
-    def __init__(self, repo_url, dst_dir, nectar_config):
+    def __init__(self, repo_url, dst_dir, nectar_config, downloader_pool=None):
         """
         :param repo_url:        URL for the base of a yum repository
         :type  repo_url:        basestring
@@ -114,18 +156,50 @@ class MetadataFiles(object):
         :type  dst_dir:         basestring
         :param nectar_config:   download config for nectar
         :type  nectar_config:   nectar.config.DownloaderConfig
+        :param downloader_pool: if given, the downloader is borrowed from this
+                                pool, and the caller should release it once
+                                the metadata files have been downloaded
+        :type  downloader_pool: pulp_rpm.plugins.importers.yum.repomd.nectar_factory.DownloaderPool
         """
         super(MetadataFiles, self).__init__()
         self.repo_url = repo_url
         self.dst_dir = dst_dir
         self.event_listener = AggregatingEventListener()
 
-        self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
-                                                           self.event_listener)
+        if downloader_pool is not None:
+            self.downloader = downloader_pool.get(repo_url, self.event_listener)
+        else:
+            self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
+                                                               self.event_listener)
 
         self.revision = None
         self.metadata = {}
         self.dbs = {}
+        # open, read-only connections to the files in self.dbs. These are
+        # shared by every thread that calls add_repodata for the whole sync.
+        self.db_connections = {}
+        self.db_lock = threading.Lock()
+        # used instead of self.dbs when index_repodata is called, where keys
+        # are metadata file names and values are LazyRepodata instances
+        self.lazy_repodata = {}
+        # keys are metadata file names, values are the destinations they were
+        # downloaded to, which are HashingFiles if they were hashed
+        self.destinations = {}
+        # set by verify_metadata_files, after which each compressed file is
+        # also verified against its open checksum and size as it is read
+        self.verify_open = False
+        # names of files whose decompressed content has been verified
+        self.open_verified = set()
+        # if True, each compressed file is decompressed into dst_dir the first
+        # time it is read, and every handle to it after that maps the
+        # decompressed copy into memory
+        self.cache_decompressed = False
+        # keys are metadata file names, values are paths to decompressed copies
+        self.decompressed = {}
+        # keys are metadata file names, values are the number of seconds it
+        # took to decompress each into the cache
+        self.decompression_times = {}
+        self.decompress_lock = threading.Lock()
 
     def download_repomd(self):
         """
@@ -173,9 +247,18 @@ class MetadataFiles(object):
                 file_info = process_repomd_data_element(element)
                 self.metadata[file_info['name']] = file_info
 
-    def download_metadata_files(self):
+    def download_metadata_files(self, hash_downloads=False, reuse_existing=False):
         """
         Download the remaining metadata files.
+
+        :param hash_downloads:  if True, each file is hashed as it is downloaded,
+                                so that verify_metadata_files need not read it
+                                again
+        :type  hash_downloads:  bool
+        :param reuse_existing:  if True, a file that is already in the
+                                destination directory with the size listed in
+                                repomd.xml is not downloaded again
+        :type  reuse_existing:  bool
         """
         if not self.metadata:
             raise RuntimeError('%s has not been parsed' % REPOMD_FILE_NAME)
@@ -190,41 +273,63 @@ class MetadataFiles(object):
             dst = os.path.join(self.dst_dir, file_info['relative_path'].rsplit('/', 1)[-1])
 
             file_info['local_path'] = dst
+            if reuse_existing and file_info['size'] is not None and os.path.isfile(dst) and \
+                    os.path.getsize(dst) == file_info['size']:
+                _LOGGER.debug('reusing %s' % dst)
+                self.destinations[file_name] = dst
+                continue
+            if hash_downloads:
+                dst = hashing.HashingFile(dst, file_info['checksum']['algorithm'])
+            self.destinations[file_name] = dst
 
             request = DownloadRequest(url, dst)
             download_request_list.append(request)
 
-        self.downloader.download(download_request_list)
+        try:
+            self.downloader.download(download_request_list)
+        finally:
+            for destination in self.destinations.itervalues():
+                hashing.close_destination(destination)
 
     def verify_metadata_files(self):
         """
-        Optionally verify the metadata files using both reported size and checksum.
-        """
-        # TODO: vet this method and determine if it should be used
-        for md in self.metadata.values():
-            if 'local_path' not in md:
-                raise RuntimeError('%s has not been downloaded' % md['relative_path'].rsplit('/', 1)[-1])
+        Verify the downloaded metadata files against the size and checksum
+        listed for each in repomd.xml. Files that were hashed as they were
+        downloaded are not read again, and others are read in chunks.
 
-            if md['size'] is None:
-                raise RuntimeError('%s cannot be verified, no file size' % md['local_path'])
+        Once this has been called, each compressed file is also verified
+        against its open size and open checksum when it is next read through
+        get_metadata_file_handle, while it is decompressed for parsing.
 
-            local_file_size = os.path.getsize(md['local_path'])
-            # prevents the rounding errors better than: md['size'] * 1024
-            if local_file_size / 1024 != md['size']:
-                raise RuntimeError('%s failed verification, file size mismatch' % md['local_path'])
+        :raises RuntimeError:   if a file fails verification
+        """
+        for name, md in self.metadata.iteritems():
+            if name not in self.destinations:
+                continue
+            destination = self.destinations[name]
+            path = hashing.destination_path(destination)
+            if not os.path.exists(path):
+                raise RuntimeError('%s has not been downloaded' % path)
 
-            if md['checksum']['algorithm'] is None:
-                raise RuntimeError('%s cannot be verified, no checksum' % md['local_path'])
+            if md['size'] is not None:
+                try:
+                    hashing.verify_size(destination, md['size'])
+                except verification.VerificationException:
+                    raise RuntimeError('%s failed verification, file size mismatch' % path)
 
-            hash_constructor = getattr(hashlib, md['checksum']['algorithm'], None)
-            if hash_constructor is None:
-                raise RuntimeError('%s failed verification, unsupported hash algorithm: %s' % (md['local_path'], md['checksum']['algorithm']))
+            if md['checksum']['algorithm'] is None:
+                _LOGGER.debug('%s cannot be verified, no checksum' % path)
+                continue
+            try:
+                hashing.verify_checksum(destination, md['checksum']['algorithm'],
+                                        md['checksum']['hex_digest'])
+            except verification.InvalidChecksumType:
+                _LOGGER.warning('%s cannot be verified, unsupported hash algorithm: %s' %
+                                (path, md['checksum']['algorithm']))
+            except verification.VerificationException:
+                raise RuntimeError('%s failed verification, checksum mismatch' % path)
 
-            hash_obj = hash_constructor()
-            with open(md['local_path'], 'rb') as file_handle:
-                hash_obj.update(file_handle.read())
-            if hash_obj.hexdigest() != md['checksum']['hex_digest']:
-                raise RuntimeError('%s failed verification, checksum mismatch' % md['local_path'])
+        self.verify_open = True
 
     def get_metadata_file_handle(self, name):
         """
@@ -240,18 +345,75 @@ class MetadataFiles(object):
         :rtype:  file
         """
         try:
-            file_path = self.metadata[name]['local_path']
+            file_info = self.metadata[name]
+            file_path = file_info['local_path']
         except KeyError:
             return
 
-        if file_path.endswith('.gz'):
-            file_handle = gzip.open(file_path, 'r')
-        elif file_path.endswith('.xz'):
-            file_handle = lzma.LZMAFile(file_path, 'r')
-        else:
-            file_handle = open(file_path, 'r')
+        if self.cache_decompressed and file_path.endswith(('.gz', '.xz')):
+            with self.decompress_lock:
+                if name not in self.decompressed:
+                    self.decompressed[name] = self._decompress(name, file_info)
+            return open_mapped_file(self.decompressed[name])
+
+        return self._open_metadata_file(name, file_info)
+
+    def _open_metadata_file(self, name, file_info):
+        """
+        :param name:        name of a metadata file
+        :type  name:        basestring
+        :param file_info:   file information dictionary of that file
+        :type  file_info:   dict
+
+        :return:    open handle from which the decompressed file can be read,
+                    which verifies it if verify_metadata_files has been called
+        :rtype:     file-like object
+        """
+        file_path = file_info['local_path']
+        file_handle = open_metadata_file(file_path)
+        # an uncompressed file's open checksum is the one already verified
+        if self.verify_open and name not in self.open_verified and \
+                file_path.endswith(('.gz', '.xz')):
+            file_handle = _VerifyingReader(file_handle, file_info,
+                                           lambda: self.open_verified.add(name))
         return file_handle
 
+    def _decompress(self, name, file_info):
+        """
+        Decompress a metadata file into dst_dir, verifying it on the way if
+        verify_metadata_files has been called, and record how long it took in
+        self.decompression_times.
+
+        :param name:        name of a compressed metadata file
+        :type  name:        basestring
+        :param file_info:   file information dictionary of that file
+        :type  file_info:   dict
+
+        :return:    full path to the decompressed copy
+        :rtype:     basestring
+
+        :raises RuntimeError:   if the file fails verification
+        """
+        plain_path = os.path.join(self.dst_dir, '%s.xml.decompressed' % name)
+        start = time.time()
+        source = self._open_metadata_file(name, file_info)
+        try:
+            with open(plain_path, 'wb') as plain_file:
+                while True:
+                    chunk = source.read(DECOMPRESS_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    plain_file.write(chunk)
+        except Exception:
+            if os.path.exists(plain_path):
+                os.remove(plain_path)
+            raise
+        finally:
+            source.close()
+        self.decompression_times[name] = time.time() - start
+        _LOGGER.debug('decompressed %s in %.2f seconds' % (name, self.decompression_times[name]))
+        return plain_path
+
     def get_group_file_handle(self):
         """
         return an open file handle from which the group XML can be read.
@@ -264,35 +426,240 @@ class MetadataFiles(object):
             group_file_handle = self.get_metadata_file_handle('group')
         return group_file_handle
 
-    def generate_dbs(self):
+    def generate_dbs(self, progress_callback=None, wanted_db_keys=None, processes=None):
         """
         For repo data files that contain data we need to access later for each
         unit in the repo, generate a local db file that gives us quick read
         access to each unit's data.
+
+        Each entry stores both the raw XML snippet and the data parsed out of
+        it, so nothing needs to be parsed again when the entry is read. By
+        default the files are processed one after the other in this process.
+
+        :param progress_callback:   optional function that will be called with
+                                    two arguments, the name of a metadata file
+                                    and the number of packages processed from
+                                    it so far. It is called from this process.
+        :type  progress_callback:   function
+        :param wanted_db_keys:      optional set of keys as generated by
+                                    generate_db_key. If provided, only packages
+                                    with one of these keys are written to the
+                                    dbs. This is useful when it is already known
+                                    which packages will be downloaded.
+        :type  wanted_db_keys:      set
+        :param processes:           experimental; if greater than 1, each file
+                                    is processed in its own worker process, so
+                                    they are generated concurrently. This forks
+                                    the process running the sync.
+        :type  processes:           int
+
+        :raises RuntimeError:   if generating any of the dbs fails, including
+                                when a metadata file fails verification
+        """
+        if processes > 1:
+            self._generate_dbs_in_workers(progress_callback, wanted_db_keys)
+            return
+
+        for filename, tag, process_func in REPODATA_DB_FILES:
+            db_filename = os.path.join(self.dst_dir, '%s.db' % filename)
+            if progress_callback is not None:
+                report_progress = lambda count: progress_callback(filename, count)
+            else:
+                report_progress = None
+            xml_file_handle = self._open_repodata_file(filename)
+            try:
+                count = _write_db(xml_file_handle, db_filename, tag, process_func,
+                                  wanted_db_keys, report_progress)
+            finally:
+                xml_file_handle.close()
+            self.dbs[filename] = db_filename
+            if progress_callback is not None:
+                progress_callback(filename, count)
+
+    def _generate_dbs_in_workers(self, progress_callback, wanted_db_keys):
+        """
+        Generate each db in its own worker process. The workers are always
+        terminated and joined before this returns, including when it fails or
+        the progress callback raises an exception.
+
+        :param progress_callback:   optional function, see generate_dbs
+        :type  progress_callback:   function
+        :param wanted_db_keys:      optional set of keys, see generate_dbs
+        :type  wanted_db_keys:      set
+
+        :raises RuntimeError:   if generating any of the dbs fails
+        """
+        progress_queue = multiprocessing.Queue()
+        workers = {}
+        xml_file_handles = []
+        try:
+            for filename, tag, process_func in REPODATA_DB_FILES:
+                # opened here, so the worker reads the file through the same
+                # verification and decompressed cache as everything else
+                xml_file_handle = self._open_repodata_file(filename)
+                xml_file_handles.append(xml_file_handle)
+                db_filename = os.path.join(self.dst_dir, '%s.db' % filename)
+                worker = multiprocessing.Process(
+                    target=_generate_db,
+                    args=(filename, xml_file_handle, db_filename, tag,
+                          process_func, wanted_db_keys, progress_queue))
+                worker.start()
+                workers[filename] = worker
+                self.dbs[filename] = db_filename
+
+            unfinished = set(workers)
+            while unfinished:
+                try:
+                    filename, count, finished, error = progress_queue.get(
+                        timeout=REPODATA_WORKER_POLL_TIMEOUT)
+                except Queue.Empty:
+                    # a worker's final message is always sent before it exits
+                    dead = [name for name in unfinished if not workers[name].is_alive()]
+                    if dead and progress_queue.empty():
+                        raise RuntimeError('worker generating the %s db exited unexpectedly'
+                                           % dead[0])
+                    continue
+                if error is not None:
+                    raise RuntimeError('failed to generate the %s db: %s' % (filename, error))
+                if progress_callback is not None:
+                    progress_callback(filename, count)
+                if finished:
+                    unfinished.discard(filename)
+        finally:
+            for worker in workers.itervalues():
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            for xml_file_handle in xml_file_handles:
+                xml_file_handle.close()
+
+    def _open_repodata_file(self, filename):
+        """
+        :param filename:    name of a metadata file that a db is generated from
+        :type  filename:    basestring
+
+        :return:    open handle from which the file can be read, as returned
+                    by get_metadata_file_handle
+        :rtype:     file-like object
+
+        :raises RuntimeError:   if the file cannot be opened
+        """
+        try:
+            return self.get_metadata_file_handle(filename)
+        except (IOError, OSError), e:
+            raise RuntimeError('failed to generate the %s db: %s' % (filename, e))
+
+    def index_repodata(self, progress_callback=None):
+        """
+        Lazy alternative to generate_dbs. Rather than parsing every package in
+        the filelists and other files, this scans them once without parsing
+        any XML, remembering where each package's data is. A package's data is
+        then read and parsed only when it is looked up, such as by
+        add_repodata. This is much faster when only a small number of packages
+        will be downloaded.
+
+        :param progress_callback:   optional function that will be called with
+                                    two arguments, the name of a metadata file
+                                    and the number of packages indexed from it
+                                    so far.
+        :type  progress_callback:   function
         """
         for filename, tag, process_func in (
             (filelists.METADATA_FILE_NAME, filelists.PACKAGE_TAG, filelists.process_package_element),
             (other.METADATA_FILE_NAME, other.PACKAGE_TAG, other.process_package_element),
         ):
+            plain_path = os.path.join(self.dst_dir, '%s.xml.plain' % filename)
+            lazy_repodata = LazyRepodata(plain_path, tag, process_func)
             xml_file_handle = self.get_metadata_file_handle(filename)
             try:
-                generator = package_list_generator(xml_file_handle, tag)
-                db_filename = os.path.join(self.dst_dir, '%s.db' % filename)
-                # always a New file, and open with Fast writing mode.
-                db_file_handle = gdbm.open(db_filename, 'nf')
-                try:
-                    for element in generator:
-                        utils.strip_ns(element)
-                        raw_xml = utils.element_to_raw_xml(element)
-                        unit_key, _ = process_func(element)
-                        db_key = self.generate_db_key(unit_key)
-                        db_file_handle[db_key] = raw_xml
-                    db_file_handle.sync()
-                finally:
-                    db_file_handle.close()
+                lazy_repodata.index(xml_file_handle, filename, progress_callback)
             finally:
                 xml_file_handle.close()
-            self.dbs[filename] = db_filename
+            self.lazy_repodata[filename] = lazy_repodata
+
+    def _get_db_connection(self, filename):
+        """
+        Return the shared connection to the db for the given metadata file,
+        opening it the first time it is requested. The caller must hold
+        self.db_lock.
+
+        :param filename:    name of a metadata file for which a db was generated
+        :type  filename:    basestring
+
+        :return:    open connection
+        :rtype:     sqlite3.Connection
+        """
+        connection = self.db_connections.get(filename)
+        if connection is None:
+            # callbacks from the downloader arrive on its own threads; access
+            # is serialized by self.db_lock
+            connection = sqlite3.connect(self.dbs[filename], check_same_thread=False)
+            connection.text_factory = str
+            self.db_connections[filename] = connection
+        return connection
+
+    def close_dbs(self):
+        """
+        Close any db connections that were opened during the sync. This is
+        safe to call more than once.
+        """
+        with self.db_lock:
+            for connection in self.db_connections.itervalues():
+                connection.close()
+            self.db_connections = {}
+            for lazy_repodata in self.lazy_repodata.itervalues():
+                lazy_repodata.close()
+
+    def get_repodata(self, filename, db_keys):
+        """
+        Look up the entries for many packages at once in the db for a given
+        metadata file.
+
+        :param filename:    name of a metadata file for which a db was
+                            generated, such as "filelists"
+        :type  filename:    basestring
+        :param db_keys:     iterable of keys as generated by generate_db_key
+        :type  db_keys:     iterable
+
+        :return:    dict where keys are db keys, and values are tuples of
+                    (raw XML, parsed items). Keys that were not found in the
+                    db are not included.
+        :rtype:     dict
+        """
+        ret = {}
+        with self.db_lock:
+            if filename in self.lazy_repodata:
+                return self.lazy_repodata[filename].get(db_keys)
+            connection = self._get_db_connection(filename)
+            for page in utils.paginate(db_keys, REPODATA_LOOKUP_PAGE_SIZE):
+                query = REPODATA_SELECT % ','.join('?' * len(page))
+                for db_key, raw_xml, items in connection.execute(query, page):
+                    ret[db_key] = (raw_xml, cPickle.loads(str(items)))
+        return ret
+
+    def repodata_generator(self, filename):
+        """
+        Iterate over every entry in the db for a given metadata file, sorted by
+        db key.
+
+        :param filename:    name of a metadata file for which a db was
+                            generated, such as "filelists"
+        :type  filename:    basestring
+
+        :return:    generator of (db key, raw XML, parsed items) tuples
+        :rtype:     generator
+        """
+        if filename in self.lazy_repodata:
+            for row in self.lazy_repodata[filename].generator():
+                yield row
+            return
+        connection = sqlite3.connect(self.dbs[filename])
+        connection.text_factory = str
+        try:
+            for db_key, raw_xml, items in connection.execute(REPODATA_SELECT_ALL):
+                yield db_key, raw_xml, cPickle.loads(str(items))
+        finally:
+            connection.close()
 
     @staticmethod
     def generate_db_key(unit_key):
@@ -320,27 +687,513 @@ class MetadataFiles(object):
 
         :param model:   model instance to manipulate
         :type  model:   pulp_rpm.common.models.RPM
+
+        :raises KeyError:   if the model does not have an entry in the dbs
         """
-        repodata = model.metadata.setdefault('repodata',{})
         db_key = self.generate_db_key(model.unit_key)
-        for filename, metadata_key, process_func in (
-            (filelists.METADATA_FILE_NAME, 'files', filelists.process_package_element),
-            (other.METADATA_FILE_NAME, 'changelog', other.process_package_element)
+        if self.add_repodata_batch([model]):
+            raise KeyError(db_key)
+
+    def add_repodata_batch(self, models):
+        """
+        Same as add_repodata, but looks up the data for all of the given models
+        with one query per db. A model that does not have an entry in every db
+        is left without its repodata, and is returned, so that one missing
+        package does not prevent the rest from being saved.
+
+        :param models:  list of model instances to manipulate
+        :type  models:  list of pulp_rpm.common.models.RPM
+
+        :return:    list of the models that do not have an entry in the dbs
+        :rtype:     list
+        """
+        db_keys = [self.generate_db_key(model.unit_key) for model in models]
+        missing_keys = set()
+        for filename, metadata_key in (
+            (filelists.METADATA_FILE_NAME, 'files'),
+            (other.METADATA_FILE_NAME, 'changelog'),
         ):
-            try:
-                db_file = gdbm.open(self.dbs[filename], 'r')
-                raw_xml = db_file[db_key]
-            finally:
-                db_file.close()
-            repodata[filename] = raw_xml
-            element = ElementTree.fromstring(raw_xml)
-            unit_key, items = process_func(element)
-            model.metadata[metadata_key] = items
+            results = self.get_repodata(filename, db_keys)
+            for model, db_key in zip(models, db_keys):
+                result = results.get(db_key)
+                if result is None:
+                    missing_keys.add(db_key)
+                    continue
+                raw_xml, items = result
+                model.metadata.setdefault('repodata', {})[filename] = raw_xml
+                model.metadata[metadata_key] = items
+
+        missing = []
+        for model, db_key in zip(models, db_keys):
+            if db_key in missing_keys:
+                missing.append(model)
+            else:
+                model.metadata['repodata']['primary'] = model.raw_xml
+        return missing
+
+# lazy repodata ----------------------------------------------------------------
+
+class LazyRepodata(object):
+    """
+    Locations of each package's data within one decompressed filelists or
+    other file, so that each package can be read and parsed on demand.
+
+    :ivar path:         path to the decompressed copy of the metadata file
+    :type path:         basestring
+    :ivar locations:    dict where keys are db keys as generated by
+                        MetadataFiles.generate_db_key, and values are tuples of
+                        (offset, length) locating that package's XML
+    :type locations:    dict
+    """
+
+    def __init__(self, path, package_tag, process_func):
+        """
+        :param path:            path where a decompressed copy of the metadata
+                                file should be written
+        :type  path:            basestring
+        :param package_tag:     XML tag that identifies each package
+        :type  package_tag:     basestring
+        :param process_func:    function that takes an element and returns a
+                                tuple of (unit key, items)
+        :type  process_func:    function
+        """
+        self.path = path
+        self.package_tag = package_tag
+        self.process_func = process_func
+        self.locations = {}
+        self.namespace_declarations = ''
+        self._snippets = None
+
+    def index(self, xml_file_handle, filename, progress_callback=None):
+        """
+        Scan the metadata file, recording the location of each package and
+        writing a decompressed copy of the file to self.path.
+
+        :param xml_file_handle:     open handle to the metadata file
+        :type  xml_file_handle:     file-like object
+        :param filename:            name of the metadata file, which is passed
+                                    to the progress callback
+        :type  filename:            basestring
+        :param progress_callback:   optional function that will be called with
+                                    two arguments, filename and the number of
+                                    packages indexed so far.
+        :type  progress_callback:   function
+        """
+        count = 0
+        with open(self.path, 'w') as plain_file:
+            snippets = packages.PackageSnippets(_TeeReader(xml_file_handle, plain_file),
+                                                self.package_tag)
+            for offset, snippet in snippets:
+                self.namespace_declarations = snippets.namespace_declarations
+                unit_key = _snippet_unit_key(snippet)
+                if unit_key is None:
+                    # something unusual such as an escaped character; let
+                    # the parser sort it out
+                    element, _ = _parse_repodata_snippet(snippets, snippet)
+                    unit_key, _ = self.process_func(element)
+                self.locations[MetadataFiles.generate_db_key(unit_key)] = (offset, len(snippet))
+                count += 1
+                if progress_callback is not None and count % REPODATA_PROGRESS_INTERVAL == 0:
+                    progress_callback(filename, count)
+        if progress_callback is not None:
+            progress_callback(filename, count)
+
+    def get(self, db_keys):
+        """
+        Read and parse the data for the given packages.
+
+        :param db_keys:     iterable of keys as generated by generate_db_key
+        :type  db_keys:     iterable
+
+        :return:    dict where keys are db keys, and values are tuples of
+                    (raw XML, parsed items). Keys that were not found are not
+                    included.
+        :rtype:     dict
+        """
+        # reading in file order keeps the reads moving forward
+        found = sorted((self.locations[db_key], db_key) for db_key in db_keys
+                       if db_key in self.locations)
+        return dict((db_key, self._read(location)) for location, db_key in found)
+
+    def generator(self):
+        """
+        :return:    generator of (db key, raw XML, parsed items) tuples for
+                    every package, sorted by db key
+        :rtype:     generator
+        """
+        for db_key in sorted(self.locations):
+            raw_xml, items = self._read(self.locations[db_key])
+            yield db_key, raw_xml, items
+
+    def close(self):
+        """
+        Close the decompressed file if it was opened. It is opened again if
+        needed.
+        """
+        if self._snippets is not None:
+            self._snippets.xml_handle.close()
+            self._snippets = None
+
+    def _read(self, location):
+        """
+        :param location:    tuple of (offset, length)
+        :type  location:    tuple
+
+        :return:    tuple of (raw XML, parsed items)
+        :rtype:     tuple
+        """
+        if self._snippets is None:
+            self._snippets = packages.PackageSnippets(open(self.path, 'r'), self.package_tag)
+            self._snippets.namespace_declarations = self.namespace_declarations
+        element, raw_xml = _parse_repodata_snippet(self._snippets,
+                                                   self._snippets.read(*location))
+        unit_key, items = self.process_func(element)
+        return raw_xml, items
+
+
+class _TeeReader(object):
+    """
+    File-like wrapper that writes everything read from a file handle to
+    another file.
+    """
+
+    def __init__(self, source, destination):
+        self.source = source
+        self.destination = destination
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.destination.write(data)
+        return data
+
+
+class _VerifyingReader(object):
+    """
+    File-like wrapper around a decompressed metadata file, which computes the
+    open size and open checksum of everything read, and verifies them against
+    the values from repomd.xml once the end of the file is reached. Nothing is
+    verified if the file is not read to the end, or if it is read out of order.
+    """
+
+    def __init__(self, source, file_info, verified_callback):
+        """
+        :param source:              open handle to the decompressed file
+        :type  source:              file-like object
+        :param file_info:           file information dictionary, as returned by
+                                    process_repomd_data_element
+        :type  file_info:           dict
+        :param verified_callback:   function that takes no arguments, called
+                                    once the file has passed verification
+        :type  verified_callback:   function
+        """
+        self.source = source
+        self.file_info = file_info
+        self.verified_callback = verified_callback
+        self.size = 0
+        self.valid = True
+        hash_func = verification.CHECKSUM_FUNCTIONS.get(file_info['open_checksum']['algorithm'])
+        self._hasher = hash_func() if hash_func is not None else None
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.size += len(data)
+            if self._hasher is not None:
+                self._hasher.update(data)
+        elif size != 0 and self.valid:
+            self._verify()
+        return data
+
+    def seek(self, offset, whence=0):
+        self.valid = False
+        self.source.seek(offset, whence)
+
+    def tell(self):
+        return self.source.tell()
+
+    def close(self):
+        self.source.close()
+
+    @property
+    def closed(self):
+        return self.source.closed
+
+    def _verify(self):
+        """
+        :raises RuntimeError:   if the open size or open checksum is incorrect
+        """
+        # only verify once, even if read is called again at the end
+        self.valid = False
+        path = self.file_info['local_path']
+        open_size = self.file_info['open_size']
+        if open_size is not None and self.size != open_size:
+            raise RuntimeError('%s failed verification, open size mismatch' % path)
+        if self._hasher is not None and \
+                self._hasher.hexdigest() != self.file_info['open_checksum']['hex_digest']:
+            raise RuntimeError('%s failed verification, open checksum mismatch' % path)
+        self.verified_callback()
+
+
+class _MappedFile(object):
+    """
+    File-like wrapper around a read-only memory map. mmap objects are not
+    quite files: on python 2 their read method requires a size, and they have
+    no "closed" attribute.
+    """
+
+    def __init__(self, mapped):
+        """
+        :param mapped:  memory map of a whole file
+        :type  mapped:  mmap.mmap
+        """
+        self.mapped = mapped
+        self.closed = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.mapped) - self.mapped.tell()
+        return self.mapped.read(size)
+
+    def readline(self, size=-1):
+        line = self.mapped.readline()
+        if size is not None and 0 <= size < len(line):
+            self.mapped.seek(size - len(line), os.SEEK_CUR)
+            line = line[:size]
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def seek(self, offset, whence=0):
+        self.mapped.seek(offset, whence)
+
+    def tell(self):
+        return self.mapped.tell()
+
+    def close(self):
+        if not self.closed:
+            self.mapped.close()
+            self.closed = True
+
+
+def _snippet_unit_key(snippet):
+    """
+    Find the unit key of a package in filelists.xml or other.xml using regular
+    expressions rather than an XML parser.
+
+    :param snippet: raw XML for one package element
+    :type  snippet: str
+
+    :return:    unit key, or None if it could not be determined this way
+    :rtype:     dict or None
+    """
+    unit_key = {}
+    start_tag_end = snippet.find('>')
+    for match in PACKAGE_ATTRIBUTE_RE.finditer(snippet, 0, start_tag_end):
+        unit_key[match.group(1)] = match.group(2) if match.group(2) is not None else match.group(3)
+    version_match = VERSION_TAG_RE.search(snippet, start_tag_end)
+    if version_match is None:
+        return
+    for match in VERSION_ATTRIBUTE_RE.finditer(version_match.group(0)):
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        unit_key[VERSION_ATTRIBUTE_NAMES[match.group(1)]] = value
+    if len(unit_key) != 5 or any('&' in value for value in unit_key.itervalues()):
+        return
+    return unit_key
+
+
+def _parse_repodata_snippet(snippets, snippet):
+    """
+    Parse a package's snippet from a filelists or other file into an element
+    whose tags have no namespace, along with the raw XML to save for the
+    package. Whenever it can be, the snippet itself is used as the raw XML,
+    which is much cheaper than stripping the namespace from each element and
+    serializing them all again.
+
+    :param snippets:    package snippets of the file
+    :type  snippets:    pulp_rpm.plugins.importers.yum.repomd.packages.PackageSnippets
+    :param snippet:     raw XML for one package element
+    :type  snippet:     str
+
+    :return:    tuple of (element, raw XML)
+    :rtype:     tuple
+    """
+    raw_xml = utils.snippet_to_raw_xml(snippet, snippets.namespace_declarations)
+    if raw_xml is not None:
+        # without the document's namespace declarations, the tags have no
+        # namespace to strip
+        return ElementTree.fromstring(raw_xml), raw_xml
+    element = snippets.parse(snippet)
+    utils.strip_ns(element)
+    return element, utils.element_to_raw_xml(element)
+
+
+# db generation ----------------------------------------------------------------
+
+def _generate_db(filename, xml_file_handle, db_filename, tag, process_func, wanted_db_keys,
+                 progress_queue):
+    """
+    Generate the db for one metadata file. This runs in a worker process and
+    reports back to the parent process only through the queue. Each message is
+    a tuple of (filename, number of packages processed or None if it failed,
+    whether the db is finished, error message or None).
+
+    :param filename:        name of the metadata file, such as "filelists"
+    :type  filename:        basestring
+    :param xml_file_handle: open handle from which the metadata file can be
+                            read, as returned by get_metadata_file_handle.
+                            It is closed when the db is finished.
+    :type  xml_file_handle: file-like object
+    :param db_filename:     full path to the db file that should be created
+    :type  db_filename:     basestring
+    :param tag:             XML tag that identifies each package
+    :type  tag:             basestring
+    :param process_func:    function that takes an element and returns a
+                            tuple of (unit key, items)
+    :type  process_func:    function
+    :param wanted_db_keys:  optional set of keys; packages with any other key
+                            will not be written to the db
+    :type  wanted_db_keys:  set
+    :param progress_queue:  queue on which to report progress
+    :type  progress_queue:  multiprocessing.Queue
+    """
+    def report_progress(count):
+        progress_queue.put((filename, count, False, None))
+
+    try:
+        try:
+            count = _write_db(xml_file_handle, db_filename, tag, process_func, wanted_db_keys,
+                              report_progress)
+        finally:
+            xml_file_handle.close()
+    except Exception:
+        progress_queue.put((filename, None, True, traceback.format_exc()))
+    else:
+        progress_queue.put((filename, count, True, None))
+
+
+def _write_db(xml_file_handle, db_filename, tag, process_func, wanted_db_keys,
+              progress_func=None):
+    """
+    Write the db for one metadata file, replacing any that already exists.
+
+    :param xml_file_handle: open handle from which the metadata file can be read
+    :type  xml_file_handle: file-like object
+    :param db_filename:     full path to the db file that should be created
+    :type  db_filename:     basestring
+    :param tag:             XML tag that identifies each package
+    :type  tag:             basestring
+    :param process_func:    function that takes an element and returns a
+                            tuple of (unit key, items)
+    :type  process_func:    function
+    :param wanted_db_keys:  optional set of keys; packages with any other key
+                            will not be written to the db
+    :type  wanted_db_keys:  set
+    :param progress_func:   optional function that will be called with the
+                            number of packages processed so far, every
+                            REPODATA_PROGRESS_INTERVAL packages
+    :type  progress_func:   function
+
+    :return:    number of packages processed
+    :rtype:     int
+    """
+    progress = {'count': 0}
+
+    def report_progress(count):
+        progress['count'] = count
+        if progress_func is not None and count % REPODATA_PROGRESS_INTERVAL == 0:
+            progress_func(count)
+
+    snippets = packages.PackageSnippets(xml_file_handle, tag)
+    # always a new file
+    if os.path.exists(db_filename):
+        os.remove(db_filename)
+    connection = sqlite3.connect(db_filename)
+    try:
+        # the db is disposable, so trade durability for speed
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.text_factory = str
+        connection.execute(REPODATA_TABLE_SCHEMA)
+        connection.executemany(REPODATA_INSERT,
+                               _repodata_row_generator(snippets, process_func,
+                                                       wanted_db_keys, report_progress))
+        connection.commit()
+    finally:
+        connection.close()
+    return progress['count']
+
+
+def _repodata_row_generator(snippets, process_func, wanted_db_keys=None, progress_func=None):
+    """
+    Turn each package in a filelists or other file into a row for the
+    repodata table.
+
+    :param snippets:            package snippets of the file
+    :type  snippets:            pulp_rpm.plugins.importers.yum.repomd.packages.PackageSnippets
+    :param process_func:        function that takes an element and returns
+                                a tuple of (unit key, items)
+    :type  process_func:        function
+    :param wanted_db_keys:      optional set of keys; elements with any other
+                                key will be skipped
+    :type  wanted_db_keys:      set
+    :param progress_func:       optional function that will be called with the
+                                number of elements processed so far
+    :type  progress_func:       function
+
+    :return:    generator of (db_key, raw_xml, pickled items) tuples
+    :rtype:     generator
+    """
+    for count, (offset, snippet) in enumerate(snippets, 1):
+        if progress_func is not None:
+            progress_func(count)
+        element, raw_xml = _parse_repodata_snippet(snippets, snippet)
+        unit_key, items = process_func(element)
+        db_key = MetadataFiles.generate_db_key(unit_key)
+        if wanted_db_keys is not None and db_key not in wanted_db_keys:
+            continue
+        yield db_key, raw_xml, sqlite3.Binary(cPickle.dumps(items, cPickle.HIGHEST_PROTOCOL))
 
-        repodata['primary'] = model.raw_xml
 
 # utilities --------------------------------------------------------------------
 
+def open_metadata_file(file_path):
+    """
+    Open a metadata file for reading, decompressing it if necessary based on
+    its extension.
+
+    :param file_path:   full path to a metadata file
+    :type  file_path:   basestring
+
+    :return: open file handle to a file containing XML
+    :rtype:  file
+    """
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'r')
+    elif file_path.endswith('.xz'):
+        return lzma.LZMAFile(file_path, 'r')
+    else:
+        return open(file_path, 'r')
+
+
+def open_mapped_file(file_path):
+    """
+    Open a file for reading by mapping it into memory, so that reading it
+    again, or seeking within it, costs no more than reading it once.
+
+    :param file_path:   full path to an uncompressed file
+    :type  file_path:   basestring
+
+    :return: file-like object from which the file can be read
+    :rtype:  _MappedFile or file
+    """
+    with open(file_path, 'rb') as file_handle:
+        # an empty file cannot be mapped
+        if os.fstat(file_handle.fileno()).st_size == 0:
+            return open(file_path, 'r')
+        return _MappedFile(mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ))
+
+
 def process_repomd_data_element(data_element):
     """
     Process the data elements of the repomd.xml file.
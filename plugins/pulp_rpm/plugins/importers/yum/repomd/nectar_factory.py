@@ -14,10 +14,14 @@
 Contains logic surrounding which nectar downloader implementation to use.
 """
 
+import threading
 import urlparse
 
 from nectar.downloaders.curl import HTTPCurlDownloader
 from nectar.downloaders.threaded import HTTPThreadedDownloader
+from nectar.listener import DownloadEventListener
+
+from pulp_rpm.plugins.importers.yum.repomd.local import LocalLinkDownloader
 
 
 # Mapping from scheme string to downloader class to instantiate
@@ -28,7 +32,7 @@ SCHEME_DOWNLOADERS = {
 }
 
 
-def create_downloader(repo_url, nectar_config, event_listener):
+def create_downloader(repo_url, nectar_config, event_listener, link_local=False):
     """
     Returns an appropriate downloader instance for the given repository location.
 
@@ -41,6 +45,9 @@ def create_downloader(repo_url, nectar_config, event_listener):
     :type  nectar_config:   nectar.config.DownloaderConfig
     :param event_listener:  listener that will receive reports of download completion
     :type  event_listener:  nectar.listener.DownloadEventListener
+    :param link_local:      if True, files from a file:// location are linked
+                            to their destinations instead of being copied
+    :type  link_local:      bool
 
     :return:    a new nectar downloader instance
     :rtype:     nectar.downloaders.base.Downloader
@@ -50,5 +57,89 @@ def create_downloader(repo_url, nectar_config, event_listener):
     if parsed.scheme not in SCHEME_DOWNLOADERS:
         raise ValueError('Unsupported scheme: %s' % parsed.scheme)
 
+    if link_local and parsed.scheme == 'file':
+        return LocalLinkDownloader(nectar_config, event_listener=event_listener)
+
     return SCHEME_DOWNLOADERS[parsed.scheme](nectar_config, event_listener=event_listener)
 
+
+
+class DownloaderPool(object):
+    """
+    Lends downloaders to each phase of a sync. A downloader that has been
+    given back is lent again, with a new event listener, to the next phase that
+    downloads from the same host, so its open connections are kept alive and
+    reused instead of being set up again, which is costly over SSL.
+
+    Each downloader limits how many connections it opens to its host to the
+    config's max_concurrent, and a downloader is only lent to one phase at a
+    time, so phases that take turns never open more than that between them.
+
+    Downloaders are bound to the nectar config, which is finalized at the end
+    of each sync, so a pool must not outlive the sync that created it.
+    """
+
+    def __init__(self, nectar_config, link_local=False):
+        """
+        :param nectar_config:   download config to be used by every downloader
+        :type  nectar_config:   nectar.config.DownloaderConfig
+        :param link_local:      if True, files from a file:// location are
+                                linked to their destinations instead of being
+                                copied
+        :type  link_local:      bool
+        """
+        self.nectar_config = nectar_config
+        self.link_local = link_local
+        # keys are (scheme, host), values are lists of downloaders not in use
+        self._idle = {}
+        # keys are downloaders that have been lent, values are their keys in self._idle
+        self._lent = {}
+        self._lock = threading.Lock()
+
+    def get(self, repo_url, event_listener):
+        """
+        Lend a downloader for the given location, which should be given back
+        with release() once the caller is done downloading.
+
+        :param repo_url:        where files will be downloaded from
+        :type  repo_url:        str
+        :param event_listener:  listener that will receive reports of download completion
+        :type  event_listener:  nectar.listener.DownloadEventListener
+
+        :return:    a nectar downloader instance that may have been used before
+        :rtype:     nectar.downloaders.base.Downloader
+        """
+        parsed = urlparse.urlparse(repo_url)
+        key = (parsed.scheme, parsed.netloc)
+        with self._lock:
+            idle = self._idle.get(key)
+            downloader = idle.pop() if idle else None
+        if downloader is None:
+            downloader = create_downloader(repo_url, self.nectar_config, event_listener,
+                                           self.link_local)
+        else:
+            downloader.event_listener = event_listener or DownloadEventListener()
+        with self._lock:
+            self._lent[downloader] = key
+        return downloader
+
+    def release(self, downloader):
+        """
+        Take back a downloader that was lent by get(), so it can be lent again.
+        A downloader that has been cancelled is dropped instead.
+
+        :param downloader:  a downloader returned by get()
+        :type  downloader:  nectar.downloaders.base.Downloader
+        """
+        with self._lock:
+            key = self._lent.pop(downloader, None)
+            if key is None or downloader.is_canceled:
+                return
+            self._idle.setdefault(key, []).append(downloader)
+
+    def clear(self):
+        """
+        Drop every downloader that is not in use, along with its connections.
+        """
+        with self._lock:
+            self._idle = {}
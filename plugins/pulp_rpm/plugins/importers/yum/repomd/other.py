@@ -23,7 +23,19 @@ def process_package_element(element):
     :type  element: xml.etree.ElementTree.Element
     :return:
     """
-    version_element = element.find('version')
+    version_element = None
+    changelogs = []
+    # one pass over the children, rather than a find() and a findall()
+    for child in element:
+        tag = child.tag
+        if tag == 'changelog':
+            author = child.attrib['author']
+            date = int(child.attrib['date'])
+            # this is the format the original importer used, so I'm blindly sticking with it.
+            changelogs.append([date, author, child.text])
+        elif tag == 'version' and version_element is None:
+            version_element = child
+
     unit_key = {
         'name': element.attrib['name'],
         'epoch': version_element.attrib['epoch'],
@@ -31,17 +43,5 @@ def process_package_element(element):
         'release': version_element.attrib['rel'],
         'arch': element.attrib['arch'],
     }
-    changelogs = _parse_changelogs(element.findall('changelog'))
 
     return unit_key, changelogs
-
-def _parse_changelogs(elements):
-    ret = []
-    for element in elements:
-        author = element.attrib['author']
-        date = int(element.attrib['date'])
-        text = element.text
-        # this is the format the original importer used, so I'm blindly sticking with it.
-        ret.append([date, author, text])
-
-    return ret
@@ -11,14 +11,23 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
+import collections
 import logging
+import multiprocessing
 import os
 import re
 from urlparse import urljoin
+from xml.etree import cElementTree as ElementTree
 from xml.etree.cElementTree import iterparse
 
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+from nectar.report import DownloadReport
 from nectar.request import DownloadRequest
 
+from pulp_rpm.plugins.importers.yum.hashing import HashingFile, destination_path
 from pulp_rpm.plugins.importers.yum.repomd import nectar_factory
 
 
@@ -26,8 +35,19 @@ _LOGGER = logging.getLogger(__name__)
 
 NS_STRIP_RE = re.compile('{.*?}')
 
+# used when scanning for package snippets without parsing the XML
+SNIPPET_READ_SIZE = 64 * 1024
+TAG_NAME_TERMINATORS = frozenset(' \t\r\n/>')
+XMLNS_RE = re.compile(r'''xmlns(?::[\w.-]+)?\s*=\s*(?:"[^"]*"|'[^']*')''')
 
-def package_list_generator(xml_handle, package_tag, process_func=None):
+# used when packages are parsed by worker processes: the approximate size in
+# bytes of the chunk of packages sent to a worker at a time, and how many
+# chunks per worker may be waiting to be consumed
+PARALLEL_CHUNK_SIZE = 256 * 1024
+PARALLEL_CHUNKS_PER_PROCESS = 2
+
+
+def package_list_generator(xml_handle, package_tag, process_func=None, processes=None):
     """
     Parser for primary.xml file that is implemented as a generator.
 
@@ -35,20 +55,59 @@ def package_list_generator(xml_handle, package_tag, process_func=None):
     single package's information. It then yields a corresponding package
     information dictionary. Then repeats.
 
+    lxml is used if it is installed, since it can be told to report only the
+    package elements. Otherwise cElementTree is used, and each tag it reports
+    is compared with the package tag only once.
+
     :param xml_handle:      open file handle pointing to the beginning of a primary.xml file
     :type  xml_handle:      file-like object
+    :param package_tag:     tag that identifies each package element. A tag
+                            without a namespace matches in any namespace.
+    :type  package_tag:     basestring
     :param process_func:    function that takes one argument, of type
                             xml.etree.ElementTree.Element, or the cElementTree
                             equivalent, and returns a dictionary containing
                             metadata about the unit. Default is to return the
                             Element object.
     :type  process_func:    function
+    :param processes:       experimental; if greater than 1, packages are
+                            parsed and processed by this many worker
+                            processes forked from this one. See
+                            _parallel_package_list.
+    :type  processes:       int
 
     :return: generator of package information; the object type depends on the processor
     :rtype: generator
     """
+    if processes > 1 and process_func is not None:
+        for package_info in _parallel_package_list(xml_handle, package_tag, process_func,
+                                                   processes):
+            yield package_info
+        return
+
     if process_func is None:
         process_func = lambda x: x
+    if lxml_etree is not None:
+        elements = _lxml_package_elements(xml_handle, package_tag)
+    else:
+        elements = _etree_package_elements(xml_handle, package_tag)
+
+    for element in elements:
+        yield process_func(element)
+
+
+def _etree_package_elements(xml_handle, package_tag):
+    """
+    Find each package element with cElementTree.
+
+    :param xml_handle:  open file handle pointing to the beginning of an XML file
+    :type  xml_handle:  file-like object
+    :param package_tag: tag that identifies each package element
+    :type  package_tag: basestring
+
+    :return:    generator of package elements
+    :rtype:     generator
+    """
     parser = iterparse(xml_handle, events=('start', 'end'))
     xml_iterator = iter(parser)
 
@@ -61,18 +120,294 @@ def package_list_generator(xml_handle, package_tag, process_func=None):
         _LOGGER.error('failed to parse XML metadata file')
         return
 
+    # maps each tag seen so far to whether it is the package tag, so that the
+    # namespace is stripped from each distinct tag only once
+    is_package_tag = {}
     for event, element in xml_iterator:
         # if we're not at a fully parsed package element, keep going
         if event != 'end':
             continue
-        # make this work whether the file has namespace as part of the tag or not
-        if not (element.tag == package_tag or re.sub(NS_STRIP_RE, '', element.tag) == package_tag):
+        tag = element.tag
+        try:
+            matches = is_package_tag[tag]
+        except KeyError:
+            # make this work whether the file has namespace as part of the tag or not
+            matches = is_package_tag[tag] = (tag == package_tag or
+                                             re.sub(NS_STRIP_RE, '', tag) == package_tag)
+        if not matches:
             continue
 
         root_element.clear() # clear all previously parsed ancestors of the root
 
-        package_info = process_func(element)
-        yield package_info
+        yield element
+
+
+def _lxml_package_elements(xml_handle, package_tag):
+    """
+    Find each package element with lxml, which only reports the end of each
+    package element.
+
+    :param xml_handle:  open file handle pointing to the beginning of an XML file
+    :type  xml_handle:  file-like object
+    :param package_tag: tag that identifies each package element
+    :type  package_tag: basestring
+
+    :return:    generator of package elements
+    :rtype:     generator
+    """
+    if not package_tag.startswith('{'):
+        # matches the tag in any namespace, or in none
+        package_tag = '{*}' + package_tag
+    # comments and processing instructions are dropped, as cElementTree does.
+    # Entities are never resolved, so that a document can not pull in local
+    # files or anything from the network, and libxml2's limits on document
+    # size and depth are left in place.
+    parser = lxml_etree.iterparse(xml_handle, events=('end',), tag=package_tag,
+                                  remove_comments=True, remove_pis=True,
+                                  resolve_entities=False, no_network=True)
+
+    found = False
+    has_dtd = None
+    try:
+        for event, element in parser:
+            if has_dtd is None:
+                has_dtd = element.getroottree().docinfo.internalDTD is not None
+            # only a document with a DTD can declare entities. cElementTree
+            # rejects references to them, so they are rejected here too rather
+            # than being left unexpanded in the package's metadata.
+            if has_dtd:
+                for entity in element.iter(lxml_etree.Entity):
+                    raise ElementTree.ParseError('undefined entity %s' % entity)
+            found = True
+            # remove the packages that were already processed, along with
+            # anything else that came before this one, so that the parsed
+            # document does not build up in memory. The current element is left
+            # alone because the process function may hold on to it.
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            yield element
+    except lxml_etree.XMLSyntaxError:
+        # a document that is broken part way through must not look complete
+        if found:
+            raise
+        _LOGGER.error('failed to parse XML metadata file')
+
+
+def _parallel_package_list(xml_handle, package_tag, process_func, processes):
+    """
+    Split the document into chunks of whole package elements, and parse and
+    process each chunk in a pool of worker processes. Results are yielded in
+    document order, and only a few chunks are read ahead of the results that
+    have been consumed, so memory use stays bounded.
+
+    process_func must be a module-level function, or a functools.partial of
+    one, and what it returns must be picklable, since both are sent between
+    processes.
+
+    The pool is terminated and joined when the generator finishes, raises, or
+    is closed, so callers that may stop consuming it early should close it.
+
+    :param xml_handle:      open file handle pointing to the beginning of an XML file
+    :type  xml_handle:      file-like object
+    :param package_tag:     tag that identifies each package element
+    :type  package_tag:     basestring
+    :param process_func:    function that takes a package element and returns
+                            information about the package
+    :type  process_func:    function
+    :param processes:       number of worker processes
+    :type  processes:       int
+
+    :return:    generator of package information in document order
+    :rtype:     generator
+    """
+    snippets = PackageSnippets(xml_handle, package_tag)
+    chunks = _chunk_snippets(snippets)
+    pool = multiprocessing.Pool(processes)
+    try:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(
+                _process_chunk, (snippets.namespace_declarations, chunk, process_func)))
+            if len(pending) >= processes * PARALLEL_CHUNKS_PER_PROCESS:
+                for package_info in pending.popleft().get():
+                    yield package_info
+        while pending:
+            for package_info in pending.popleft().get():
+                yield package_info
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _chunk_snippets(snippets):
+    """
+    :param snippets:    PackageSnippets for the document
+    :type  snippets:    PackageSnippets
+
+    :return:    generator of strings, each the raw XML of one or more whole
+                package elements adding up to about PARALLEL_CHUNK_SIZE bytes
+    :rtype:     generator
+    """
+    chunk = []
+    size = 0
+    for offset, snippet in snippets:
+        chunk.append(snippet)
+        size += len(snippet)
+        if size >= PARALLEL_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _process_chunk(namespace_declarations, chunk, process_func):
+    """
+    Run in a worker process to parse and process one chunk of package elements.
+
+    :param namespace_declarations:  "xmlns" attributes from the document's root
+                                    element
+    :type  namespace_declarations:  str
+    :param chunk:                   raw XML of whole package elements
+    :type  chunk:                   str
+    :param process_func:            function that takes a package element
+    :type  process_func:            function
+
+    :return:    what process_func returned for each element, in order
+    :rtype:     list
+    """
+    wrapper = ElementTree.fromstring('<chunk %s>%s</chunk>' % (namespace_declarations, chunk))
+    return [process_func(element) for element in wrapper]
+
+
+class PackageSnippets(object):
+    """
+    Scanner that finds the location of each package element in an XML metadata
+    file without building any XML elements.
+
+    Iterating over an instance yields a tuple of (offset, snippet) for each
+    package element, where "offset" is the position in bytes of the element's
+    start tag from the beginning of the (decompressed) stream and "snippet"
+    is the raw XML of the element. Snippets can be turned back into elements
+    with the `parse` method, which makes it cheap to record where a package
+    lives during one pass and only parse it again when it is actually needed.
+
+    :ivar namespace_declarations:   the "xmlns" attributes found on the root
+                                    element, which are required to parse a
+                                    snippet on its own. This is populated once
+                                    iteration reaches the first package.
+    :type namespace_declarations:   str
+    """
+
+    def __init__(self, xml_handle, package_tag):
+        """
+        :param xml_handle:  open file handle pointing to the beginning of an XML
+                            metadata file
+        :type  xml_handle:  file-like object
+        :param package_tag: tag that identifies each package element, with or
+                            without a namespace.
+        :type  package_tag: basestring
+        """
+        self.xml_handle = xml_handle
+        local_name = re.sub(NS_STRIP_RE, '', package_tag)
+        self.start_token = '<%s' % local_name
+        self.end_token = '</%s>' % local_name
+        self.namespace_declarations = ''
+
+    def __iter__(self):
+        buf = ''
+        # absolute position in the stream of the first character in buf
+        buf_offset = 0
+        position = 0
+        root_found = False
+
+        while True:
+            chunk = self.xml_handle.read(SNIPPET_READ_SIZE)
+            if chunk:
+                buf += chunk
+            elif not buf:
+                return
+
+            while True:
+                start = buf.find(self.start_token, position)
+                if start == -1:
+                    if root_found:
+                        # keep just enough of the buffer to match a start token
+                        # that is split across reads
+                        position = max(0, len(buf) - len(self.start_token))
+                    break
+                token_end = start + len(self.start_token)
+                if token_end >= len(buf):
+                    position = start
+                    break
+                if buf[token_end] not in TAG_NAME_TERMINATORS:
+                    # a longer tag that happens to start with the same name,
+                    # such as "packager"
+                    position = start + 1
+                    continue
+
+                if not root_found:
+                    self.namespace_declarations = ' '.join(
+                        match.group(0) for match in XMLNS_RE.finditer(buf, 0, start))
+                    root_found = True
+
+                start_tag_end = buf.find('>', token_end)
+                if start_tag_end == -1:
+                    position = start
+                    break
+                if buf[start_tag_end - 1] == '/':
+                    end = start_tag_end + 1
+                else:
+                    end = buf.find(self.end_token, start_tag_end)
+                    if end == -1:
+                        position = start
+                        break
+                    end += len(self.end_token)
+
+                yield buf_offset + start, buf[start:end]
+                position = end
+
+            if not chunk:
+                return
+            if root_found:
+                # drop everything that has already been scanned
+                buf = buf[position:]
+                buf_offset += position
+                position = 0
+
+    def parse(self, snippet):
+        """
+        Parse a snippet yielded by this object into an Element that is the same
+        as what package_list_generator would have passed to a process function,
+        including fully-qualified tags.
+
+        :param snippet: raw XML for one package element
+        :type  snippet: str
+
+        :return:    parsed package element
+        :rtype:     xml.etree.ElementTree.Element
+        """
+        wrapper = ElementTree.fromstring('<snippet %s>%s</snippet>' %
+                                         (self.namespace_declarations, snippet))
+        return wrapper[0]
+
+    def read(self, offset, length):
+        """
+        Read one snippet from the underlying file handle, given the location
+        that was previously yielded during iteration. This is most efficient
+        when called with increasing offsets, since compressed streams can only
+        seek forward cheaply.
+
+        :param offset:  position of the snippet from the beginning of the stream
+        :type  offset:  int
+        :param length:  length of the snippet
+        :type  length:  int
+
+        :return:    raw XML for one package element
+        :rtype:     str
+        """
+        self.xml_handle.seek(offset)
+        return self.xml_handle.read(length)
 
 
 # TODO: maybe this class shouldn't be a class
@@ -88,16 +423,32 @@ class Packages(object):
     :ivar dst_dir: Directory to store downloaded packages in
     :ivar event_listener: nectar.listener.DownloadEventListener instance
     :ivar downloader: nectar.downloaders.base.Downloader instance
+    :ivar hash_downloads: if True, each package is written through a HashingFile,
+                          so its size and checksum are known once it is downloaded
+
+    If a downloader_pool is given, the downloader is borrowed from it, and the
+    caller should release it once the packages have been downloaded.
+
+    If skip_complete is True, packages that are already in dst_dir with the
+    right size are reported to the event listener as downloaded, without
+    being downloaded again.
     """
 
     def __init__(self, repo_url, nectar_config, package_model_iterator, dst_dir,
-                 event_listener=None):
+                 event_listener=None, hash_downloads=False, downloader_pool=None,
+                 skip_complete=False):
         self.repo_url = repo_url
         self.package_model_iterator = package_model_iterator
         self.dst_dir = dst_dir
+        self.hash_downloads = hash_downloads
+        self.event_listener = event_listener
+        self.skip_complete = skip_complete
 
-        self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
-                                                           event_listener)
+        if downloader_pool is not None:
+            self.downloader = downloader_pool.get(repo_url, event_listener)
+        else:
+            self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
+                                                               event_listener)
 
     def download_packages(self):
         """
@@ -113,11 +464,68 @@ class Packages(object):
         :return: download request generator
         :rtype: generator
         """
-        for model in self.package_model_iterator:
-            url = urljoin(self.repo_url, model.download_path)
+        requests = package_requests(self.repo_url, self.package_model_iterator, self.dst_dir,
+                                    self.hash_downloads)
+        if self.skip_complete:
+            requests = skip_complete_requests(requests, self.event_listener)
+        return requests
+
 
-            file_name = model.relative_path.rsplit('/', 1)[-1]
-            destination = os.path.join(self.dst_dir, file_name)
+def package_requests(repo_url, package_model_iterator, dst_dir, hash_downloads=False):
+    """
+    Generate a download request for each package, on demand.
 
-            request = DownloadRequest(url, destination, model)
+    :param repo_url:                Yum repository's URL
+    :type  repo_url:                basestring
+    :param package_model_iterator:  iterator of package models
+    :type  package_model_iterator:  iterator
+    :param dst_dir:                 directory to store downloaded packages in
+    :type  dst_dir:                 basestring
+    :param hash_downloads:          if True, each package is written through a
+                                    HashingFile
+    :type  hash_downloads:          bool
+
+    :return: download request generator
+    :rtype: generator
+    """
+    for model in package_model_iterator:
+        url = urljoin(repo_url, model.download_path)
+
+        file_name = model.relative_path.rsplit('/', 1)[-1]
+        destination = os.path.join(dst_dir, file_name)
+        if hash_downloads:
+            destination = HashingFile(destination, model.unit_key['checksumtype'])
+
+        request = DownloadRequest(url, destination, model)
+        yield request
+
+
+def skip_complete_requests(requests, event_listener):
+    """
+    Filter out the requests for packages that are already at their destination
+    with the size listed in the metadata, such as those downloaded by an
+    earlier, interrupted sync. Each one is reported to the event listener as a
+    successful download instead. Any other file at a destination is downloaded
+    again from the start.
+
+    :param requests:        download requests whose data are package models
+    :type  requests:        iterable of nectar.request.DownloadRequest
+    :param event_listener:  listener that should receive the reports for the
+                            packages that are skipped
+    :type  event_listener:  nectar.listener.DownloadEventListener
+
+    :return:    generator of the requests that must be downloaded
+    :rtype:     generator
+    """
+    for request in requests:
+        path = destination_path(request.destination)
+        size = request.data.metadata.get('size')
+        if size is None or not os.path.isfile(path) or os.path.getsize(path) != size:
             yield request
+            continue
+        # the file was not written through a HashingFile this time, so it is
+        # reported with its path, and will be read if it needs to be verified
+        report = DownloadReport(request.url, path, request.data)
+        report.bytes_downloaded = size
+        event_listener.download_started(report)
+        event_listener.download_succeeded(report)
@@ -12,6 +12,7 @@
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
 from pulp_rpm.common import models
+from pulp_rpm.plugins.importers.yum import utils
 
 METADATA_FILE_NAME = 'prestodelta'
 
@@ -29,12 +30,7 @@ def process_package_element(element):
     :rtype:     pulp_rpm.common.models.DRPM
     """
     delta = element.find('delta')
-    filename = delta.find('filename')
-    sequence = delta.find('sequence')
-    size = delta.find('size')
-    checksum = delta.find('checksum')
-
-    return models.DRPM.from_package_info({
+    package_info = {
         'type': 'drpm',
         'new_package': element.attrib['name'],
         'epoch': element.attrib['epoch'],
@@ -44,9 +40,39 @@ def process_package_element(element):
         'oldepoch': delta.attrib['oldepoch'],
         'oldversion': delta.attrib['oldversion'],
         'oldrelease': delta.attrib['oldrelease'],
-        'filename': filename.text,
-        'sequence': sequence.text,
-        'size': int(size.text),
-        'checksum': checksum.text,
-        'checksumtype': checksum.attrib['type'],
-    })
+    }
+    remaining = utils.dispatch_children(delta, package_info, _DELTA_HANDLERS)
+    if remaining:
+        raise ValueError('delta for %s has no %s element' %
+                         (package_info['new_package'], ', '.join(sorted(remaining))))
+
+    return models.DRPM.from_package_info(package_info)
+
+
+# child element handlers -------------------------------------------------------
+
+# each handler takes the dictionary being built and a child element of the
+# delta element, and is called by utils.dispatch_children for the first child
+# with its tag
+
+def _text_handler(key):
+    def handler(package_info, element):
+        package_info[key] = element.text
+    return handler
+
+
+def _handle_size(package_info, size_element):
+    package_info['size'] = int(size_element.text)
+
+
+def _handle_checksum(package_info, checksum_element):
+    package_info['checksum'] = checksum_element.text
+    package_info['checksumtype'] = checksum_element.attrib['type']
+
+
+_DELTA_HANDLERS = {
+    'filename': _text_handler('filename'),
+    'sequence': _text_handler('sequence'),
+    'size': _handle_size,
+    'checksum': _handle_checksum,
+}
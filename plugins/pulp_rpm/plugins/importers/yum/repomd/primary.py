@@ -11,8 +11,8 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
-from copy import deepcopy
 import os
+import re
 
 from pulp_rpm.common import models
 from pulp_rpm.plugins.importers.yum import utils
@@ -52,136 +52,133 @@ RPM_PROVIDES_TAG = '{%s}provides' % RPM_SPEC_URL
 RPM_REQUIRES_TAG = '{%s}requires' % RPM_SPEC_URL
 RPM_ENTRY_TAG = '{%s}entry' % RPM_SPEC_URL
 
+# the href attribute of the location element in a package's raw XML
+LOCATION_HREF_RE = re.compile(r'''(<location\s[^>]*?\bhref\s*=\s*)("[^"]*"|'[^']*')''')
+
 
 # package information dictionary -----------------------------------------------
 
-# the package information dictionary is a combination of the PACKAGE_INFO_SKEL
-# and PACKAGE_FORMAT_SKEL dictionaries
+# the package information dictionary is a combination of the package fields and
+# the package format fields, built by process_package_element and
+# _process_format_element
 # all fields, along with their default values, are guaranteed to be there
 
-PACKAGE_INFO_SKEL = {'type': None,
-                     'name': None,
-                     'arch': None,
-                     'version': None,
-                     'release': None,
-                     'epoch': None,
-                     'checksum': None,
-                     'checksumtype': None,
-                     'summary': None,
-                     'description': None,
-                     'changelog': None,
-                     'build_time': None,
-                     'url': None,
-                     'time': None,
-                     'size': None,
-                     'filename': None,
-                     'relative_url_path': None}
-
-PACKAGE_FORMAT_SKEL = {'vendor': None,
-                       'license': None,
-                       'group': None,
-                       'header_range': {'start': None, 'end': None},
-                       'buildhost': None,
-                       'requires': [],
-                       'provides': [],
-                       'sourcerpm': None,
-                       'files': []}
-
-# RPM entry dictionary ---------------------------------------------------------
-
-# RPM entry dictionaries will make up the values in the requires and provides lists
-
-RPM_ENTRY_SKEL = {'name': None,
-                  'version': None,
-                  'release': None,
-                  'epoch': None,
-                  'flags': None}
-
-# file information dictionary --------------------------------------------------
-
-# file information dictionaries will make up the values in the files lists
-
-FILE_INFO_SKEL = {'path': None}
-
 # element processing methods ---------------------------------------------------
 
-def process_package_element(package_element):
+def process_package_element(package_element, raw_xml=None):
     """
     Process a parsed primary.xml package element into a package information
     dictionary.
 
     :param package_element: parsed primary.xml package element
+    :param raw_xml: raw XML for the package, if it is already known. Otherwise
+                    it is produced from the element.
+    :type  raw_xml: str
     :return: package information dictionary
     :rtype: pulp_rpm.common.models.RPM
     """
-    # NOTE the use of deepcopy relies on cpython's very sensible policy of never
-    # duplicating string literals, this may not hold up in other implementations
-    # the python interpreter.
-    package_info = deepcopy(PACKAGE_INFO_SKEL)
-    package_info['type'] = package_element.attrib['type']
+    package_info = {'type': package_element.attrib['type'],
+                    'name': None,
+                    'arch': None,
+                    'version': None,
+                    'release': None,
+                    'epoch': None,
+                    'checksum': None,
+                    'checksumtype': None,
+                    'summary': None,
+                    'description': None,
+                    'changelog': None,
+                    'build_time': None,
+                    'url': None,
+                    'time': None,
+                    'size': None,
+                    'filename': None,
+                    'relative_url_path': None}
+
+    remaining = utils.dispatch_children(package_element, package_info, _PACKAGE_HANDLERS)
+    if FORMAT_TAG in remaining:
+        package_info.update(_process_format_element(None))
 
-    name_element = package_element.find(NAME_TAG)
-    if name_element is not None:
-        package_info['name'] = name_element.text
+    if package_info['arch'].lower() == 'src':
+        model = models.SRPM.from_package_info(package_info)
+    else:
+        model = models.RPM.from_package_info(package_info)
+    # add the raw XML so it can be saved in the database later
+    if raw_xml is None:
+        rpm_namespace = utils.Namespace('rpm', RPM_SPEC_URL)
+        raw_xml = utils.element_to_raw_xml(package_element, [rpm_namespace], COMMON_SPEC_URL)
+    model.raw_xml = raw_xml
+    return model
 
-    arch_element = package_element.find(ARCH_TAG)
-    if arch_element is not None:
-        package_info['arch'] = arch_element.text
 
-    version_element = package_element.find(VERSION_TAG)
-    if version_element is not None:
-        package_info['version'] = version_element.attrib['ver']
-        package_info['release'] = version_element.attrib.get('rel', None)
-        package_info['epoch'] = version_element.attrib.get('epoch', None)
+def process_package_snippet(snippets, snippet):
+    """
+    Process a package's raw XML from primary.xml into a model. The raw XML is
+    used as the model's raw_xml whenever it can be, instead of serializing the
+    parsed element again.
+
+    :param snippets:    package snippets of the primary.xml file
+    :type  snippets:    pulp_rpm.plugins.importers.yum.repomd.packages.PackageSnippets
+    :param snippet:     raw XML for one package element
+    :type  snippet:     str
+    :return: package information dictionary
+    :rtype: pulp_rpm.common.models.RPM
+    """
+    rpm_namespace = utils.Namespace('rpm', RPM_SPEC_URL)
+    raw_xml = utils.snippet_to_raw_xml(snippet, snippets.namespace_declarations,
+                                       [rpm_namespace], COMMON_SPEC_URL)
+    if raw_xml is not None:
+        # make the same change that _handle_location makes to the element
+        raw_xml = LOCATION_HREF_RE.sub(_location_basename, raw_xml, 1)
+    return process_package_element(snippets.parse(snippet), raw_xml)
 
-    checksum_element = package_element.find(CHECKSUM_TAG)
-    if checksum_element is not None:
-        package_info['checksumtype'] = checksum_element.attrib['type']
-        package_info['checksum'] = checksum_element.text
 
-    summary_element = package_element.find(SUMMARY_TAG)
-    if summary_element is not None:
-        package_info['summary'] = summary_element.text
+def _location_basename(match):
+    quote = match.group(2)[0]
+    return '%s%s%s%s' % (match.group(1), quote, os.path.basename(match.group(2)[1:-1]), quote)
 
-    description_element = package_element.find(DESCRIPTION_TAG)
-    if description_element is not None:
-        package_info['description'] = description_element.text
 
-    url_element = package_element.find(URL_TAG)
-    if url_element is not None:
-        package_info['url'] = url_element.text
+def process_package_record(package_element):
+    """
+    Process a parsed primary.xml package element into a lightweight record
+    holding only the package's unit key and size. The full model can be
+    created later with the record's to_model method.
 
-    time_element = package_element.find(TIME_TAG)
-    if time_element is not None:
-        package_info['time'] = int(time_element.attrib['file'])
-        package_info['build_time'] = int(time_element.attrib['build'])
+    :param package_element: parsed primary.xml package element
+    :return: record of the package
+    :rtype: pulp_rpm.common.models.PackageRecord
+    """
+    arch = package_element.findtext(ARCH_TAG)
+    if arch.lower() == 'src':
+        model_class = models.SRPM
+    else:
+        model_class = models.RPM
+
+    version_element = package_element.find(VERSION_TAG)
+    if version_element is not None:
+        version = version_element.attrib['ver']
+        release = version_element.attrib.get('rel', None)
+        epoch = version_element.attrib.get('epoch', None)
+    else:
+        version = release = epoch = None
+
+    checksum_element = package_element.find(CHECKSUM_TAG)
+    if checksum_element is not None:
+        checksumtype = checksum_element.attrib['type']
+        checksum = checksum_element.text
+    else:
+        checksumtype = checksum = None
 
     size_element = package_element.find(SIZE_TAG)
     if size_element is not None:
-        package_info['size'] = int(size_element.attrib['package'])
-
-    location_element = package_element.find(LOCATION_TAG)
-    if location_element is not None:
-        href = location_element.attrib['href']
-        filename = os.path.basename(href)
-        package_info['relativepath'] = href
-        package_info['filename'] = filename
-        # we don't make any attempt to preserve the original directory structure
-        # this element will end up being converted back to XML and stuffed into
-        # the DB on the unit object, so this  is our chance to modify it.
-        location_element.attrib['href'] = filename
-
-    format_element = package_element.find(FORMAT_TAG)
-    package_info.update(_process_format_element(format_element))
-
-    if package_info['arch'].lower() == 'src':
-        model = models.SRPM.from_package_info(package_info)
+        size = int(size_element.attrib['package'])
     else:
-        model = models.RPM.from_package_info(package_info)
-    # add the raw XML so it can be saved in the database later
-    rpm_namespace = utils.Namespace('rpm', RPM_SPEC_URL)
-    model.raw_xml = utils.element_to_raw_xml(package_element, [rpm_namespace], COMMON_SPEC_URL)
-    return model
+        size = None
+
+    unit_key = model_class.NAMEDTUPLE(package_element.findtext(NAME_TAG), epoch, version,
+                                      release, arch, checksumtype, checksum)
+    return models.PackageRecord(model_class, unit_key, size, package_element,
+                                process_package_element)
 
 
 def _process_format_element(format_element):
@@ -193,49 +190,21 @@ def _process_format_element(format_element):
     :return: package format dictionary
     :rtype: dict
     """
-    # NOTE the use of deepcopy relies on cpython's very sensible policy of never
-    # duplicating string literals, this may not hold up in other implementations
-    # the python interpreter.
-    package_format = deepcopy(PACKAGE_FORMAT_SKEL)
+    package_format = {'vendor': None,
+                      'license': None,
+                      'group': None,
+                      'header_range': {'start': None, 'end': None},
+                      'buildhost': None,
+                      'requires': [],
+                      'provides': [],
+                      'sourcerpm': None,
+                      'files': []}
 
     if format_element is None:
         return package_format
 
-    vendor_element = format_element.find(RPM_VENDOR_TAG)
-    if vendor_element is not None:
-        package_format['vendor'] = None # XXX figure out which attrib this is
-
-    license_element = format_element.find(RPM_LICENSE_TAG)
-    if license_element is not None:
-        package_format['license'] = license_element.text
-
-    group_element = format_element.find(RPM_GROUP_TAG)
-    if group_element is not None:
-        package_format['group'] = group_element.text
-
-    header_range_element = format_element.find(RPM_HEADER_RANGE_TAG)
-    if header_range_element is not None:
-        package_format['header_range']['start'] = int(header_range_element.attrib['start'])
-        package_format['header_range']['end'] = int(header_range_element.attrib['end'])
-
-    build_host_element = format_element.find(RPM_BUILDHOST_TAG)
-    if build_host_element is not None:
-        package_format['buildhost'] = build_host_element.text
-
-    sourcerpm_element = format_element.find(RPM_SOURCERPM_TAG)
-    if sourcerpm_element is not None:
-        package_format['sourcerpm'] = sourcerpm_element.text
-
-    provides_element = format_element.find(RPM_PROVIDES_TAG)
-    if provides_element is not None:
-        package_format['provides'].extend(_process_rpm_entry_element(e) for e in provides_element.findall(RPM_ENTRY_TAG))
-
-    requires_element = format_element.find(RPM_REQUIRES_TAG)
-    if requires_element is not None:
-        package_format['requires'].extend(_process_rpm_entry_element(e) for e in requires_element.findall(RPM_ENTRY_TAG))
-
-    package_format['files'].extend(_process_file_element(e) for e in format_element.findall(FILE_TAG))
-
+    utils.dispatch_children(format_element, package_format, _FORMAT_HANDLERS,
+                            _FORMAT_REPEATED_HANDLERS)
     return package_format
 
 
@@ -248,18 +217,12 @@ def _process_rpm_entry_element(rpm_entry_element):
     :return: RPM entry dictionary
     :rtype: dict
     """
-    # NOTE the use of deepcopy relies on cpython's very sensible policy of never
-    # duplicating string literals, this may not hold up in other implementations
-    # the python interpreter.
-    rpm_entry = deepcopy(RPM_ENTRY_SKEL)
-
-    rpm_entry['name'] = rpm_entry_element.attrib['name']
-    rpm_entry['version'] = rpm_entry_element.attrib.get('ver', None)
-    rpm_entry['release'] = rpm_entry_element.attrib.get('rel', None)
-    rpm_entry['epoch'] = rpm_entry_element.attrib.get('epoch', None)
-    rpm_entry['flags'] = rpm_entry_element.attrib.get('flags', None)
-
-    return rpm_entry
+    attrib = rpm_entry_element.attrib
+    return {'name': attrib['name'],
+            'version': attrib.get('ver', None),
+            'release': attrib.get('rel', None),
+            'epoch': attrib.get('epoch', None),
+            'flags': attrib.get('flags', None)}
 
 
 def _process_file_element(file_element):
@@ -271,11 +234,109 @@ def _process_file_element(file_element):
     :return: file information dictionary
     :rtype: dict
     """
-    # NOTE the use of deepcopy relies on cpython's very sensible policy of never
-    # duplicating string literals, this may not hold up in other implementations
-    # the python interpreter.
-    file_info = deepcopy(FILE_INFO_SKEL)
+    return {'path': file_element.text}
+
+
+# child element handlers -------------------------------------------------------
+
+# each handler takes the dictionary being built and a child element, and is
+# called by utils.dispatch_children for the first child with its tag
+
+def _text_handler(key):
+    """
+    :return: handler that stores the text of the element under the given key
+    :rtype: function
+    """
+    def handler(info, element):
+        info[key] = element.text
+    return handler
+
 
-    file_info['path'] = file_element.text
+def _handle_version(package_info, version_element):
+    package_info['version'] = version_element.attrib['ver']
+    package_info['release'] = version_element.attrib.get('rel', None)
+    package_info['epoch'] = version_element.attrib.get('epoch', None)
 
-    return file_info
+
+def _handle_checksum(package_info, checksum_element):
+    package_info['checksumtype'] = checksum_element.attrib['type']
+    package_info['checksum'] = checksum_element.text
+
+
+def _handle_time(package_info, time_element):
+    package_info['time'] = int(time_element.attrib['file'])
+    package_info['build_time'] = int(time_element.attrib['build'])
+
+
+def _handle_size(package_info, size_element):
+    package_info['size'] = int(size_element.attrib['package'])
+
+
+def _handle_location(package_info, location_element):
+    href = location_element.attrib['href']
+    filename = os.path.basename(href)
+    package_info['relativepath'] = href
+    package_info['filename'] = filename
+    # we don't make any attempt to preserve the original directory structure
+    # this element will end up being converted back to XML and stuffed into
+    # the DB on the unit object, so this  is our chance to modify it.
+    location_element.attrib['href'] = filename
+
+
+def _handle_format(package_info, format_element):
+    package_info.update(_process_format_element(format_element))
+
+
+def _handle_vendor(package_format, vendor_element):
+    package_format['vendor'] = None # XXX figure out which attrib this is
+
+
+def _handle_header_range(package_format, header_range_element):
+    package_format['header_range'] = {'start': int(header_range_element.attrib['start']),
+                                      'end': int(header_range_element.attrib['end'])}
+
+
+def _entries_handler(key):
+    """
+    :return: handler that stores the RPM entries of a provides or requires
+             element under the given key
+    :rtype: function
+    """
+    def handler(package_format, element):
+        package_format[key] = [_process_rpm_entry_element(e) for e in element
+                               if e.tag == RPM_ENTRY_TAG]
+    return handler
+
+
+def _handle_file(package_format, file_element):
+    package_format['files'].append(_process_file_element(file_element))
+
+
+_PACKAGE_HANDLERS = {
+    NAME_TAG: _text_handler('name'),
+    ARCH_TAG: _text_handler('arch'),
+    VERSION_TAG: _handle_version,
+    CHECKSUM_TAG: _handle_checksum,
+    SUMMARY_TAG: _text_handler('summary'),
+    DESCRIPTION_TAG: _text_handler('description'),
+    URL_TAG: _text_handler('url'),
+    TIME_TAG: _handle_time,
+    SIZE_TAG: _handle_size,
+    LOCATION_TAG: _handle_location,
+    FORMAT_TAG: _handle_format,
+}
+
+_FORMAT_HANDLERS = {
+    RPM_VENDOR_TAG: _handle_vendor,
+    RPM_LICENSE_TAG: _text_handler('license'),
+    RPM_GROUP_TAG: _text_handler('group'),
+    RPM_HEADER_RANGE_TAG: _handle_header_range,
+    RPM_BUILDHOST_TAG: _text_handler('buildhost'),
+    RPM_SOURCERPM_TAG: _text_handler('sourcerpm'),
+    RPM_PROVIDES_TAG: _entries_handler('provides'),
+    RPM_REQUIRES_TAG: _entries_handler('requires'),
+}
+
+_FORMAT_REPEATED_HANDLERS = {
+    FILE_TAG: _handle_file,
+}
@@ -13,6 +13,7 @@
 import logging
 
 from pulp_rpm.common import models
+from pulp_rpm.plugins.importers.yum import utils
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -32,28 +33,28 @@ def process_package_element(element):
     :rtype:     dict
     """
     package_info = {
-        'description': element.find('description').text,
         'from': element.attrib['from'],
-        'id': element.find('id').text,
-        'issued': element.find('issued').attrib['date'],
         'pushcount': '',
         # yum defaults this to False, and sets it to True if any package in
         # any collection has an element present with tag 'reboot_suggested'.
         # Note that yum, as of 3.4.3, does not check the contents of that element.
         'reboot_suggested': False,
-        'references': map(_parse_reference, element.find('references') or []),
+        'references': [],
         'release': '',
         'rights': '',
-        'pkglist': map(_parse_collection, element.find('pkglist') or []),
+        'pkglist': [],
         'severity': '',
         'solution': '',
         'status': element.attrib['status'],
         'summary': '',
-        'title': element.find('title').text,
         'type': element.attrib['type'],
         'updated': '',
         'version': element.attrib['version'],
     }
+    remaining = utils.dispatch_children(element, package_info, _UPDATE_HANDLERS)
+    missing = [tag for tag in _REQUIRED_TAGS if tag in remaining]
+    if missing:
+        raise ValueError('update has no %s element' % ', '.join(missing))
 
     # see comment above about 'reboot_suggested' to explain this behavior
     for collection in package_info['pkglist']:
@@ -62,13 +63,6 @@ def process_package_element(element):
                 package_info['reboot_suggested'] = True
                 break
 
-    for attr_name in ('rights', 'severity', 'summary', 'solution', 'release', 'pushcount'):
-        child = element.find(attr_name)
-        if child is not None:
-            package_info[attr_name] = child.text
-    updated_element = element.find('updated')
-    if updated_element is not None:
-        package_info['updated'] = updated_element.attrib['date']
     return models.Errata.from_package_info(package_info)
 
 
@@ -84,9 +78,18 @@ def _parse_reference(element):
 
 
 def _parse_collection(element):
+    packages = []
+    name_element = None
+    for child in element:
+        tag = child.tag
+        if tag == 'package':
+            packages.append(_parse_package(child))
+        elif tag == 'name' and name_element is None:
+            name_element = child
+
     ret = {
-        'packages': map(_parse_package, element.findall('package')),
-        'name': element.find('name').text,
+        'packages': packages,
+        'name': name_element.text,
     }
     # based on yum's parsing, this could be optional. See yum.update_md.UpdateNotice._parse_pkglist
     if 'short' in element.attrib:
@@ -97,11 +100,6 @@ def _parse_collection(element):
 
 def _parse_package(element):
     # looking at yum.update_md.UpdateNotice to see what attributes we can expect
-    sum_element = element.find('sum')
-    if sum_element is not None:
-        sum_tuple = (sum_element.attrib['type'], sum_element.text)
-    else:
-        sum_tuple = None
     ret = {
         'arch': element.attrib['arch'],
         'name': element.attrib['name'],
@@ -109,12 +107,65 @@ def _parse_package(element):
         'version': element.attrib['version'],
         'release': element.attrib['release'],
         'src': element.attrib['src'],
-        'filename': element.find('filename').text,
-        'sum': sum_tuple,
+        'sum': None,
     }
-
-    reboot_suggested = element.find('reboot_suggested')
-    if reboot_suggested is not None:
-        ret['reboot_suggested'] = reboot_suggested.text
+    remaining = utils.dispatch_children(element, ret, _PACKAGE_HANDLERS)
+    if 'filename' in remaining:
+        raise ValueError('update package %s has no filename element' % ret['name'])
 
     return ret
+
+
+# child element handlers -------------------------------------------------------
+
+# each handler takes the dictionary being built and a child element, and is
+# called by utils.dispatch_children for the first child with its tag
+
+def _text_handler(key):
+    def handler(info, element):
+        info[key] = element.text
+    return handler
+
+
+def _date_handler(key):
+    def handler(info, element):
+        info[key] = element.attrib['date']
+    return handler
+
+
+def _handle_references(package_info, references_element):
+    package_info['references'] = map(_parse_reference, references_element)
+
+
+def _handle_pkglist(package_info, pkglist_element):
+    package_info['pkglist'] = map(_parse_collection, pkglist_element)
+
+
+def _handle_sum(package, sum_element):
+    package['sum'] = (sum_element.attrib['type'], sum_element.text)
+
+
+# these elements must be present in every update
+_REQUIRED_TAGS = ('description', 'id', 'issued', 'title')
+
+_UPDATE_HANDLERS = {
+    'description': _text_handler('description'),
+    'id': _text_handler('id'),
+    'issued': _date_handler('issued'),
+    'references': _handle_references,
+    'pkglist': _handle_pkglist,
+    'title': _text_handler('title'),
+    'rights': _text_handler('rights'),
+    'severity': _text_handler('severity'),
+    'summary': _text_handler('summary'),
+    'solution': _text_handler('solution'),
+    'release': _text_handler('release'),
+    'pushcount': _text_handler('pushcount'),
+    'updated': _date_handler('updated'),
+}
+
+_PACKAGE_HANDLERS = {
+    'filename': _text_handler('filename'),
+    'sum': _handle_sum,
+    'reboot_suggested': _text_handler('reboot_suggested'),
+}
@@ -19,6 +19,12 @@ type_done_map = {
     models.DRPM.TYPE: 'drpm_done',
 }
 
+type_associated_map = {
+    models.RPM.TYPE: 'rpm_associated',
+    models.SRPM.TYPE: 'rpm_associated',
+    models.DRPM.TYPE: 'drpm_associated',
+}
+
 type_total_map = {
     'rpm_total' : models.RPM.TYPE,
     'drpm_total' : models.DRPM.TYPE,
@@ -50,7 +56,14 @@ class ContentReport(dict):
             'rpm_total': 0,
             'drpm_done' : 0,
             'drpm_total': 0,
+            # units that were already in the content store, so were added to
+            # the repo without being downloaded or counted in the totals
+            'rpm_associated': 0,
+            'drpm_associated': 0,
         }
+        # number of packages processed so far from each of the metadata files
+        # that have per-package data stored for later lookup
+        self['repodata_progress'] = {}
 
     def set_initial_values(self, counts, total_size):
         self['size_total'] = total_size
@@ -60,6 +73,10 @@ class ContentReport(dict):
         for total_name, total_type in type_total_map.iteritems():
             self['details'][total_name] = counts[total_type]
 
+    def set_repodata_progress(self, filename, count):
+        self['repodata_progress'][filename] = count
+        return self
+
     def success(self, model):
         self['items_left'] -= 1
         self['size_left'] -= model.metadata['size']
@@ -67,6 +84,10 @@ class ContentReport(dict):
         self['details'][done_attribute] += 1
         return self
 
+    def associated(self, type_id):
+        self['details'][type_associated_map[type_id]] += 1
+        return self
+
     def failure(self, model, error_report):
         self['items_left'] -= 1
         self['size_left'] -= model.metadata['size']
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import heapq
+
+from pulp_rpm.common import version_utils
+
+
+class VersionRetainer(object):
+    """
+    Keeps track of the newest versions of each package, up to a limit per
+    package. This is used both to decide which versions to download and to
+    decide which old versions to remove from a repository.
+
+    For each package, versions are kept in a min-heap, so finding and evicting
+    the oldest version costs O(log k) where k is the limit.
+    """
+
+    def __init__(self, limit=None):
+        """
+        :param limit:   maximum number of versions to keep for each package,
+                        or None to keep every version
+        :type  limit:   int
+        """
+        self.limit = limit
+        # keys are package keys, values are dicts where keys are serialized
+        # versions and values are whatever the caller associated with them
+        self._versions = {}
+        # keys are package keys, values are heaps of serialized versions
+        self._heaps = {}
+
+    def serialize(self, complete_version):
+        """
+        Same as VersionedPackage.complete_version_serialized. Encodings are
+        cached by version_utils, so each distinct field is usually only
+        encoded once per sync.
+
+        :param complete_version:    tuple of version fields, such as
+                                    (epoch, version, release)
+        :type  complete_version:    tuple
+
+        :return:    tuple of encoded fields that sorts according to RPM
+                    version comparison rules
+        :rtype:     tuple
+        """
+        return tuple(version_utils.encode_many(complete_version))
+
+    def add(self, key, complete_version, value):
+        """
+        Add one version of a package. If that makes the package exceed the
+        limit, its oldest version is evicted. If the same version was already
+        added for this package, its value is replaced.
+
+        :param key:                 identifies the package, without any version
+                                    information, such as
+                                    VersionedPackage.key_string_without_version
+        :type  key:                 basestring
+        :param complete_version:    tuple of version fields, such as
+                                    VersionedPackage.complete_version
+        :type  complete_version:    tuple
+        :param value:               any value to associate with this version
+
+        :return:    the value that was evicted, which may be the value just
+                    added if it is older than every retained version, or None
+                    if nothing was evicted
+        """
+        serialized_version = self.serialize(complete_version)
+        versions = self._versions.get(key)
+        if versions is None:
+            versions = self._versions[key] = {}
+            self._heaps[key] = []
+
+        if serialized_version in versions:
+            versions[serialized_version] = value
+            return
+
+        versions[serialized_version] = value
+        if self.limit is None:
+            return
+
+        heap = self._heaps[key]
+        if len(heap) < self.limit:
+            heapq.heappush(heap, serialized_version)
+            return
+        # one step that pushes the new version and pops the oldest
+        oldest_version = heapq.heappushpop(heap, serialized_version)
+        return versions.pop(oldest_version)
+
+    def values(self):
+        """
+        :return:    generator of the values associated with every retained
+                    version of every package
+        :rtype:     generator
+        """
+        for versions in self._versions.itervalues():
+            for value in versions.itervalues():
+                yield value
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+from nectar.listener import DownloadEventListener
+
+from pulp_rpm.plugins.importers.yum.repomd import nectar_factory
+
+
+class _Routed(object):
+    """
+    Stands in for a request's data while it is being downloaded, remembering
+    which listener should receive the request's events.
+    """
+    __slots__ = ('listener', 'data')
+
+    def __init__(self, listener, data):
+        self.listener = listener
+        self.data = data
+
+
+class DispatchingListener(DownloadEventListener):
+    """
+    Passes each download event to the listener that the request was added
+    with, along with the request's original data.
+    """
+
+    def download_started(self, report):
+        self._forward('download_started', report)
+
+    def download_progress(self, report):
+        self._forward('download_progress', report)
+
+    def download_succeeded(self, report):
+        self._forward('download_succeeded', report, final=True)
+
+    def download_failed(self, report):
+        self._forward('download_failed', report, final=True)
+
+    @staticmethod
+    def _forward(method_name, report, final=False):
+        """
+        :param method_name: name of the listener method to call
+        :type  method_name: str
+        :param report:      report whose data is a _Routed
+        :type  report:      nectar.report.DownloadReport
+        :param final:       True if no more events will be received for this
+                            report, in which case its original data is left in
+                            place, since the listener may hold on to the report
+        :type  final:       bool
+        """
+        routed = report.data
+        report.data = routed.data
+        try:
+            getattr(routed.listener, method_name)(report)
+        finally:
+            if not final:
+                report.data = routed
+
+
+class DownloadScheduler(object):
+    """
+    Downloads several kinds of content, such as RPMs, DRPMs and distribution
+    files, with one downloader, so that the number of concurrent downloads is
+    shared among them and no kind waits for the slowest file of another.
+
+    Each kind is added as an iterable of requests and the listener for them.
+    Requests are taken from each iterable in turn, so every kind makes progress
+    from the start, and each listener only sees the events for its own
+    requests. Iterables are consumed lazily, as the downloader has room.
+    """
+
+    def __init__(self, repo_url, nectar_config, downloader_pool=None):
+        """
+        :param repo_url:        URL of the repository being synced
+        :type  repo_url:        basestring
+        :param nectar_config:   download config to be used by nectar
+        :type  nectar_config:   nectar.config.DownloaderConfig
+        :param downloader_pool: if given, the downloader is borrowed from this
+                                pool, and the caller should release it once
+                                download() has returned
+        :type  downloader_pool: pulp_rpm.plugins.importers.yum.repomd.nectar_factory.DownloaderPool
+        """
+        if downloader_pool is not None:
+            self.downloader = downloader_pool.get(repo_url, DispatchingListener())
+        else:
+            self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
+                                                               DispatchingListener())
+        self._sources = []
+
+    def add(self, requests, listener):
+        """
+        :param requests:    download requests
+        :type  requests:    iterable of nectar.request.DownloadRequest
+        :param listener:    listener that should receive events for these requests
+        :type  listener:    nectar.listener.DownloadEventListener
+        """
+        self._sources.append((iter(requests), listener))
+
+    def download(self):
+        """
+        Download every request that has been added, returning once all are done.
+        """
+        sources, self._sources = self._sources, []
+        self.downloader.download(self._interleaved_requests(sources))
+
+    def cancel(self):
+        self.downloader.cancel()
+
+    @staticmethod
+    def _interleaved_requests(sources):
+        """
+        :param sources: list of (iterator of requests, listener)
+        :type  sources: list
+
+        :return:    generator of every request, taking one from each source in
+                    turn, with its data replaced by a _Routed
+        :rtype:     generator
+        """
+        while sources:
+            for source in list(sources):
+                requests, listener = source
+                try:
+                    request = requests.next()
+                except StopIteration:
+                    sources.remove(source)
+                    continue
+                request.data = _Routed(listener, request.data)
+                yield request
@@ -12,6 +12,8 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import functools
+import hashlib
+import json
 import logging
 import os
 import shutil
@@ -21,11 +23,17 @@ from pulp.common.plugins import importer_constants
 from pulp.plugins.util import nectar_config as nectar_utils
 
 from pulp_rpm.common import constants, models
-from pulp_rpm.plugins.importers.yum import existing, purge
-from pulp_rpm.plugins.importers.yum.repomd import metadata, primary, packages, updateinfo, presto, group
+from pulp_rpm.common.progress import ProgressPublisher
+from pulp_rpm.plugins.importers.yum import existing, purge, retention
+from pulp_rpm.plugins.importers.yum.checkpoint import SyncCheckpoint
+from pulp_rpm.plugins.importers.yum.index import PackageIndex
+from pulp_rpm.plugins.importers.yum.package_filter import PackageFilter
+from pulp_rpm.plugins.importers.yum.repomd import (metadata, primary, packages, updateinfo, presto,
+                                                   group, filelists, other, nectar_factory)
 from pulp_rpm.plugins.importers.yum.listener import ContentListener
 from pulp_rpm.plugins.importers.yum.parse import treeinfo
 from pulp_rpm.plugins.importers.yum.report import ContentReport, DistributionReport
+from pulp_rpm.plugins.importers.yum.scheduler import DownloadScheduler
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -39,6 +47,22 @@ class FailedException(Exception):
     pass
 
 
+# metadata files that determine the outcome of each sync step
+STEP_METADATA_TYPES = {
+    'content': (primary.METADATA_FILE_NAME, filelists.METADATA_FILE_NAME,
+                other.METADATA_FILE_NAME, presto.METADATA_FILE_NAME),
+    'errata': (updateinfo.METADATA_FILE_NAME,),
+    'comps': ('group', 'group_gz'),
+}
+
+# type of the fileless units identified by each XML tag
+FILELESS_TAG_TYPES = {
+    updateinfo.PACKAGE_TAG: models.Errata.TYPE,
+    group.GROUP_TAG: models.PackageGroup.TYPE,
+    group.CATEGORY_TAG: models.PackageCategory.TYPE,
+}
+
+
 class RepoSync(object):
 
     def __init__(self, repo, sync_conduit, call_config):
@@ -64,13 +88,54 @@ class RepoSync(object):
             'comps': {'state': 'NOT_STARTED'},
         }
         self.sync_conduit = sync_conduit
+        # coalesces frequent progress updates, such as one per package
+        self.progress_publisher = ProgressPublisher(sync_conduit)
         self.set_progress()
         self.repo = repo
 
         self.call_config = call_config
+        # files from a feed on the local filesystem may be linked into place
+        # instead of being copied
+        feed = call_config.get(importer_constants.KEY_FEED) or ''
+        self.link_local = feed.startswith('file://') and \
+            call_config.get_boolean(constants.CONFIG_LINK_LOCAL_FEED) is True
+        # downloaded files are only verified if the sync is configured to
+        # validate them, and unless told to read them again afterward, they
+        # are hashed as they are written. Linked files are never written, so
+        # they must be read.
+        self.validate_downloads = bool(call_config.get(importer_constants.KEY_VALIDATE))
+        self.hash_downloads = self.validate_downloads and not self.link_local and \
+            call_config.get_boolean(constants.CONFIG_VERIFY_BY_REREAD) is not True
+        # experimental: primary.xml may be parsed, and the repodata dbs
+        # generated, by worker processes forked from this one
+        parse_processes = call_config.get(constants.CONFIG_PARSE_PROCESSES)
+        self.parse_processes = int(parse_processes) if parse_processes is not None else None
+        # limits which packages in primary.xml are considered at all, or None
+        self.package_filter = PackageFilter.from_config(call_config)
+        # populated during the decision phase if primary.xml is being indexed
+        self.rpm_index = None
+        # names of steps, or "metadata" for the entire repository, whose
+        # metadata has not changed since the last sync
+        self.unchanged_steps = set()
+        # remembers which units already exist, so each type is only loaded once
+        self.existence_checker = existing.ExistenceChecker(sync_conduit.get_units)
+        # set while packages are being downloaded
+        self.content_listener = None
+        # units found in the content store during the decision phase, which
+        # are associated with the repo instead of being downloaded
+        self.units_in_store = []
+        # if the sync is resumable, files are downloaded into a directory that
+        # is kept until the sync succeeds, so that a later sync can reuse them
+        if call_config.get_boolean(constants.CONFIG_RESUMABLE) is True:
+            self.checkpoint = SyncCheckpoint(self.working_dir)
+        else:
+            self.checkpoint = None
 
         flat_call_config = call_config.flatten()
         self.nectar_config = nectar_utils.importer_config_to_nectar_config(flat_call_config)
+        # every phase borrows its downloader from here, so connections opened
+        # by one phase are reused by the next
+        self.downloader_pool = nectar_factory.DownloaderPool(self.nectar_config, self.link_local)
 
     def set_progress(self):
         """
@@ -78,10 +143,28 @@ class RepoSync(object):
         a convenient time to check if we've been cancelled, and if so, raise
         the proper exception.
         """
-        self.sync_conduit.set_progress(self.progress_status)
+        self.progress_publisher.publish(self.progress_status)
+        if self.cancelled is True:
+            raise CancelException
+
+    def update_progress(self):
+        """
+        Like set_progress, but for frequent updates, such as one per file. The
+        report is only sent from time to time, or when a step's state changes.
+        """
+        self.progress_publisher.update(self.progress_status)
         if self.cancelled is True:
             raise CancelException
 
+    @property
+    def resuming(self):
+        """
+        :return:    True if files downloaded by an earlier, interrupted sync of
+                    the same metadata are being reused
+        :rtype:     bool
+        """
+        return self.checkpoint is not None and self.checkpoint.resuming
+
     @property
     def sync_feed(self):
         """
@@ -102,7 +185,11 @@ class RepoSync(object):
         """
         # using this tmp dir ensures that cleanup leaves nothing behind, since
         # we delete below
-        self.tmp_dir = tempfile.mkdtemp(dir=self.working_dir)
+        if self.checkpoint is not None:
+            self.tmp_dir = self.checkpoint.open()
+        else:
+            self.tmp_dir = tempfile.mkdtemp(dir=self.working_dir)
+        succeeded = False
         try:
             self.progress_status['metadata']['state'] = constants.STATE_RUNNING
             self.set_progress()
@@ -114,23 +201,31 @@ class RepoSync(object):
                 self.progress_status['metadata']['state'] = constants.STATE_COMPLETE
             self.set_progress()
 
-            self.content_report['state'] = constants.STATE_RUNNING
-            self.set_progress()
-            self.update_content(metadata_files)
-            if self.content_report['state'] == constants.STATE_RUNNING:
-                self.content_report['state'] = constants.STATE_COMPLETE
+            if 'content' in self.unchanged_steps:
+                self.content_report['state'] = constants.STATE_SKIPPED
+            else:
+                self.content_report['state'] = constants.STATE_RUNNING
+                self.set_progress()
+                self.update_content(metadata_files)
+                if self.content_report['state'] == constants.STATE_RUNNING:
+                    self.content_report['state'] = constants.STATE_COMPLETE
             self.set_progress()
 
             if models.Distribution.TYPE in self.call_config.get(constants.CONFIG_SKIP, []):
                 self.distribution_report['state'] = constants.STATE_SKIPPED
-            else:
+            # the distribution may have been downloaded along with the content
+            elif self.distribution_report['state'] == constants.STATE_NOT_STARTED:
                 self.distribution_report['state'] = constants.STATE_RUNNING
                 self.set_progress()
                 treeinfo.sync(self.sync_conduit, self.sync_feed, self.tmp_dir,
-                              self.nectar_config, self.distribution_report, self.set_progress)
+                              self.nectar_config, self.distribution_report, self.update_progress,
+                              validate=self.validate_downloads,
+                              hash_downloads=self.hash_downloads,
+                              downloader_pool=self.downloader_pool)
             self.set_progress()
 
-            if models.Errata.TYPE in self.call_config.get(constants.CONFIG_SKIP, []):
+            if models.Errata.TYPE in self.call_config.get(constants.CONFIG_SKIP, []) or \
+                    'errata' in self.unchanged_steps:
                 self.progress_status['errata']['state'] = constants.STATE_SKIPPED
             else:
                 self.progress_status['errata']['state'] = constants.STATE_RUNNING
@@ -139,13 +234,20 @@ class RepoSync(object):
                 self.progress_status['errata']['state'] = constants.STATE_COMPLETE
             self.set_progress()
 
-            self.progress_status['comps']['state'] = constants.STATE_RUNNING
-            self.set_progress()
-            self.get_groups(metadata_files)
-            self.get_categories(metadata_files)
-            self.progress_status['comps']['state'] = constants.STATE_COMPLETE
+            if 'comps' in self.unchanged_steps:
+                self.progress_status['comps']['state'] = constants.STATE_SKIPPED
+            else:
+                self.progress_status['comps']['state'] = constants.STATE_RUNNING
+                self.set_progress()
+                self.get_groups(metadata_files)
+                self.get_categories(metadata_files)
+                self.progress_status['comps']['state'] = constants.STATE_COMPLETE
             self.set_progress()
 
+            if self.call_config.get_boolean(constants.CONFIG_SKIP_UNCHANGED) is True:
+                self.save_metadata_fingerprint(metadata_files)
+            succeeded = True
+
         except CancelException:
             report = self.sync_conduit.build_cancel_report(self._progress_summary, self.progress_status)
             report.canceled_flag = True
@@ -162,8 +264,10 @@ class RepoSync(object):
             return report
 
         finally:
-            # clean up whatever we may have left behind
-            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            # clean up whatever we may have left behind, unless it is needed
+            # to resume the sync
+            if self.checkpoint is None or succeeded:
+                shutil.rmtree(self.tmp_dir, ignore_errors=True)
 
         return self.sync_conduit.build_success_report(self._progress_summary, self.progress_status)
 
@@ -188,27 +292,128 @@ class RepoSync(object):
                     identified and downloaded.
         :rtype:     pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
         """
-        metadata_files = metadata.MetadataFiles(self.sync_feed, self.tmp_dir, self.nectar_config)
+        metadata_files = metadata.MetadataFiles(self.sync_feed, self.tmp_dir, self.nectar_config,
+                                                self.downloader_pool)
+        if self.call_config.get_boolean(constants.CONFIG_CACHE_DECOMPRESSED) is True:
+            metadata_files.cache_decompressed = True
+            # filled in as each file is first read, in seconds per file name
+            self.progress_status['metadata']['decompression_time'] = \
+                metadata_files.decompression_times
         # allow the downloader to be accessed by the cancel method if necessary
         self.downloader = metadata_files.downloader
         try:
-            metadata_files.download_repomd()
-        except IOError, e:
-            raise FailedException(str(e))
-
-        try:
-            metadata_files.parse_repomd()
-        except ValueError, e:
-            raise FailedException(str(e))
+            try:
+                metadata_files.download_repomd()
+            except IOError, e:
+                raise FailedException(str(e))
 
-        metadata_files.download_metadata_files()
-        self.downloader = None
-        metadata_files.generate_dbs()
+            try:
+                metadata_files.parse_repomd()
+            except ValueError, e:
+                raise FailedException(str(e))
+
+            if self.checkpoint is not None:
+                self.checkpoint.begin(self.sync_feed, metadata.REPOMD_FILE_NAME,
+                                      metadata_files.revision)
+
+            if self.call_config.get_boolean(constants.CONFIG_SKIP_UNCHANGED) is True:
+                self.unchanged_steps = self._find_unchanged_steps(metadata_files)
+            if 'metadata' in self.unchanged_steps:
+                _LOGGER.debug('repository metadata has not changed since the last sync')
+                return metadata_files
+
+            verify_metadata = self.call_config.get_boolean(constants.CONFIG_VERIFY_METADATA) is not False
+            metadata_files.download_metadata_files(
+                hash_downloads=verify_metadata and not self.link_local and
+                self.call_config.get_boolean(constants.CONFIG_VERIFY_BY_REREAD) is not True,
+                reuse_existing=self.resuming)
+        finally:
+            self.downloader = None
+            self.downloader_pool.release(metadata_files.downloader)
+        if verify_metadata:
+            try:
+                metadata_files.verify_metadata_files()
+            except RuntimeError, e:
+                if self.resuming:
+                    # do not try to reuse these files again
+                    self.checkpoint.discard()
+                raise FailedException(str(e))
         self.import_unknown_metadata_files(metadata_files)
-        # TODO: verify metadata
-        #metadata_files.verify_metadata_files()
         return metadata_files
 
+    def _metadata_fingerprint(self, metadata_files):
+        """
+        Summarize the parts of a sync that determine its outcome, so that it
+        can be compared with the same summary from a previous sync.
+
+        :param metadata_files:  instance of MetadataFiles on which repomd.xml
+                                has been parsed
+        :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+
+        :return:    dict with keys "revision", "checksums" and "config", where
+                    "checksums" is a dict of metadata file names to checksums
+                    and "config" is a digest of the call config
+        :rtype:     dict
+        """
+        checksums = dict((name, file_info['checksum']['hex_digest'])
+                         for name, file_info in metadata_files.metadata.iteritems())
+        config = json.dumps(self.call_config.flatten(), sort_keys=True, default=str)
+        return {
+            'revision': metadata_files.revision,
+            'checksums': checksums,
+            'config': hashlib.sha256(config).hexdigest(),
+        }
+
+    def _find_unchanged_steps(self, metadata_files):
+        """
+        Compare the current metadata with what was saved on the scratchpad by
+        the last successful sync, and determine which steps can be skipped.
+
+        :param metadata_files:  instance of MetadataFiles on which repomd.xml
+                                has been parsed
+        :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+
+        :return:    set of step names from STEP_METADATA_TYPES whose metadata
+                    files are unchanged, plus "metadata" if nothing at all
+                    has changed
+        :rtype:     set
+        """
+        scratchpad = self.sync_conduit.get_repo_scratchpad() or {}
+        previous = scratchpad.get(constants.SCRATCHPAD_LAST_SYNC_METADATA)
+        current = self._metadata_fingerprint(metadata_files)
+        # a different config could have a different outcome, such as
+        # retaining fewer old versions, so nothing can be skipped
+        if not previous or previous.get('config') != current['config']:
+            return set()
+
+        ret = set()
+        for step, metadata_types in STEP_METADATA_TYPES.iteritems():
+            if all(previous['checksums'].get(name) == current['checksums'].get(name)
+                   for name in metadata_types):
+                ret.add(step)
+        if previous == current:
+            ret.add('metadata')
+        return ret
+
+    def save_metadata_fingerprint(self, metadata_files):
+        """
+        Save a summary of the metadata that was synchronized on the repo
+        scratchpad, so the next sync can tell if anything changed. Nothing is
+        saved if any content failed to download, so that the next sync will
+        try again.
+
+        :param metadata_files:  instance of MetadataFiles on which repomd.xml
+                                has been parsed
+        :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+        """
+        scratchpad = self.sync_conduit.get_repo_scratchpad() or {}
+        if self.content_report['error_details'] or self.distribution_report['error_details']:
+            scratchpad.pop(constants.SCRATCHPAD_LAST_SYNC_METADATA, None)
+        else:
+            scratchpad[constants.SCRATCHPAD_LAST_SYNC_METADATA] = \
+                self._metadata_fingerprint(metadata_files)
+        self.sync_conduit.set_repo_scratchpad(scratchpad)
+
     def save_default_metadata_checksum_on_repo(self, metadata_files):
         """
         Determine the default checksum that should be used for metadata files and save it in
@@ -261,9 +466,34 @@ class RepoSync(object):
         :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
         """
         rpms_to_download, drpms_to_download = self._decide_what_to_download(metadata_files)
+        if self.call_config.get_boolean(constants.CONFIG_LAZY_REPODATA) is True:
+            metadata_files.index_repodata(self._set_repodata_progress)
+        else:
+            # only the packages being downloaded need their repodata looked up
+            wanted_db_keys = set(metadata.MetadataFiles.generate_db_key(unit._asdict())
+                                 for unit in rpms_to_download)
+            metadata_files.generate_dbs(self._set_repodata_progress, wanted_db_keys,
+                                        processes=self.parse_processes)
         self.download(metadata_files, rpms_to_download, drpms_to_download)
         # removes unwanted units according to the config settings
-        purge.purge_unwanted_units(metadata_files, self.sync_conduit, self.call_config)
+        if self.rpm_index is None:
+            purge.purge_unwanted_units(metadata_files, self.sync_conduit, self.call_config,
+                                       parse_processes=self.parse_processes)
+        else:
+            purge.purge_unwanted_units(metadata_files, self.sync_conduit, self.call_config,
+                                       self.rpm_index)
+
+    def _set_repodata_progress(self, filename, count):
+        """
+        Progress callback for generating the repodata dbs.
+
+        :param filename:    name of the metadata file being processed
+        :type  filename:    basestring
+        :param count:       number of packages processed so far from that file
+        :type  count:       int
+        """
+        self.content_report.set_repodata_progress(filename, count)
+        self.update_progress()
 
     def _decide_what_to_download(self, metadata_files):
         """
@@ -303,14 +533,27 @@ class RepoSync(object):
         if models.RPM.TYPE in self.call_config.get(constants.CONFIG_SKIP, []):
             _LOGGER.debug('skipping RPM sync')
             return set(), 0, 0
+        if self.call_config.get_boolean(constants.CONFIG_SINGLE_PASS) is True:
+            return self._index_rpms_to_download(metadata_files)
         primary_file_handle = metadata_files.get_metadata_file_handle(primary.METADATA_FILE_NAME)
         try:
-            # scan through all the metadata to decide which packages to download
-            package_info_generator = packages.package_list_generator(primary_file_handle,
-                                                                     primary.PACKAGE_TAG,
-                                                                     primary.process_package_element)
-            wanted = self._identify_wanted_versions(package_info_generator)
-            to_download = existing.check_repo(wanted.iterkeys(), self.sync_conduit.get_units)
+            # scan through all the metadata to decide which packages to download,
+            # only reading enough of each package to identify it
+            package_records = packages.package_list_generator(
+                primary_file_handle, primary.PACKAGE_TAG, primary.process_package_record,
+                processes=self.parse_processes)
+            try:
+                package_info_generator = package_records
+                if self.package_filter is not None:
+                    package_info_generator = self.package_filter.filter(package_info_generator)
+                wanted = self._identify_wanted_versions(package_info_generator)
+            finally:
+                # stops any worker processes parsing primary.xml, even if the
+                # sync fails or is cancelled part way through
+                package_records.close()
+            to_download = existing.check_repo(wanted.iterkeys(), self.sync_conduit.get_units,
+                                              checker=self.existence_checker)
+            self._find_in_store(to_download)
             count = len(to_download)
             size = 0
             for unit in to_download:
@@ -319,6 +562,37 @@ class RepoSync(object):
         finally:
             primary_file_handle.close()
 
+    def _index_rpms_to_download(self, metadata_files):
+        """
+        Decide which RPMs should be downloaded while building an index of
+        primary.xml, so that neither the download nor the purge phase needs to
+        parse every package again. The index is stored as self.rpm_index.
+
+        :param metadata_files:  instance of MetadataFiles
+        :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+
+        :return:    tuple of (set(RPM.NAMEDTUPLEs), number of RPMs, total size in bytes)
+        :rtype:     tuple
+        """
+        filter_func = self.package_filter.wants if self.package_filter is not None else None
+        rpm_index = PackageIndex(primary.PACKAGE_TAG, primary.process_package_element,
+                                 primary.process_package_record, primary.process_package_snippet,
+                                 filter_func)
+        primary_file_handle = metadata_files.get_metadata_file_handle(primary.METADATA_FILE_NAME)
+        try:
+            rpm_index.wanted = self._identify_wanted_versions(
+                rpm_index.model_generator(primary_file_handle))
+            rpm_index.to_download = existing.check_repo(rpm_index.wanted.iterkeys(),
+                                                        self.sync_conduit.get_units,
+                                                        checker=self.existence_checker)
+            self._find_in_store(rpm_index.to_download)
+        finally:
+            primary_file_handle.close()
+
+        self.rpm_index = rpm_index
+        size = sum(rpm_index.wanted[unit] for unit in rpm_index.to_download)
+        return rpm_index.to_download, len(rpm_index.to_download), size
+
     def _decide_drpms_to_download(self, metadata_files):
         """
         Decide which DRPMs should be downloaded based on the repo metadata and on
@@ -339,8 +613,13 @@ class RepoSync(object):
                 package_info_generator = packages.package_list_generator(presto_file_handle,
                                                                          presto.PACKAGE_TAG,
                                                                          presto.process_package_element)
+                if self.package_filter is not None:
+                    package_info_generator = self.package_filter.filter_drpms(
+                        package_info_generator)
                 wanted = self._identify_wanted_versions(package_info_generator)
-                to_download = existing.check_repo(wanted.iterkeys(), self.sync_conduit.get_units)
+                to_download = existing.check_repo(wanted.iterkeys(), self.sync_conduit.get_units,
+                                                  checker=self.existence_checker)
+                self._find_in_store(to_download)
                 count = len(to_download)
                 size = 0
                 for unit in to_download:
@@ -353,6 +632,35 @@ class RepoSync(object):
             size = 0
         return to_download, count, size
 
+    def _find_in_store(self, to_download):
+        """
+        If the sync is configured to do so, look for the units about to be
+        downloaded in the whole content store. Those that are found are removed
+        from the set and kept in self.units_in_store, to be associated with the
+        repo instead of being downloaded.
+
+        :param to_download: set of units as namedtuples that are not in the
+                            repo. This set is modified in place.
+        :type  to_download: set
+        """
+        if self.call_config.get_boolean(constants.CONFIG_ASSOCIATE_FROM_STORE) is not True:
+            return
+        found = existing.find_in_content_store(to_download, self.sync_conduit.search_all_units)
+        to_download.difference_update(found.iterkeys())
+        self.units_in_store.extend(found.itervalues())
+        _LOGGER.debug('found %d units in the content store' % len(found))
+
+    def _associate_units_in_store(self):
+        """
+        Add the units that were found in the content store to the repo, in
+        place of downloading them.
+        """
+        for unit in self.units_in_store:
+            self.sync_conduit.save_unit(unit)
+            self.content_report.associated(unit.type_id)
+            self.update_progress()
+        self.units_in_store = []
+
     def download(self, metadata_files, rpms_to_download, drpms_to_download):
         """
         Actually download the requested RPMs and DRPMs. This method iterates over
@@ -369,20 +677,59 @@ class RepoSync(object):
         :rtype: pulp.plugins.model.SyncReport
         """
         # TODO: probably should make this more generic
-        event_listener = ContentListener(self.sync_conduit, self.progress_status, self.call_config, metadata_files)
-        primary_file_handle = metadata_files.get_metadata_file_handle(primary.METADATA_FILE_NAME)
+        batch_writes = self.call_config.get_boolean(constants.CONFIG_BATCH_UNIT_WRITES) is True
+        event_listener = ContentListener(self.sync_conduit, self.progress_status, self.call_config,
+                                         metadata_files, batch_writes, self.progress_publisher)
+        # allow the listener to be cancelled by the cancel method if necessary
+        self.content_listener = event_listener
         try:
-            package_model_generator = packages.package_list_generator(primary_file_handle,
-                                                                     primary.PACKAGE_TAG,
-                                                                     primary.process_package_element)
-            units_to_download = self._filtered_unit_generator(package_model_generator, rpms_to_download)
+            self._associate_units_in_store()
+            if self.call_config.get_boolean(constants.CONFIG_UNIFIED_DOWNLOADS) is True:
+                self._download_together(metadata_files, event_listener, rpms_to_download,
+                                        drpms_to_download)
+            else:
+                self._download_packages(metadata_files, event_listener, rpms_to_download,
+                                        drpms_to_download)
+        finally:
+            event_listener.stop()
+            self.content_listener = None
+            # only RPMs and SRPMs need the repodata dbs, and every one that was
+            # downloaded has been saved now
+            metadata_files.close_dbs()
+
+        report = self.sync_conduit.build_success_report({}, {})
+        return report
+
+    def _download_packages(self, metadata_files, event_listener, rpms_to_download,
+                           drpms_to_download):
+        """
+        Download the requested RPMs and then the requested DRPMs, waiting for
+        each type to be saved before moving on.
 
+        :param metadata_files:      populated instance of MetadataFiles
+        :type  metadata_files:      pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+        :param event_listener:      listener that saves each downloaded unit
+        :type  event_listener:      pulp_rpm.plugins.importers.yum.listener.ContentListener
+        :param rpms_to_download:    set of RPM.NAMEDTUPLEs
+        :type  rpms_to_download:    set
+        :param drpms_to_download:   set of DRPM.NAMEDTUPLEs
+        :type  drpms_to_download:   set
+        """
+        primary_file_handle = metadata_files.get_metadata_file_handle(primary.METADATA_FILE_NAME)
+        try:
+            units_to_download = self._rpm_models_to_download(primary_file_handle, rpms_to_download)
             download_wrapper = packages.Packages(self.sync_feed, self.nectar_config,
-                                                    units_to_download, self.tmp_dir, event_listener)
+                                                 units_to_download, self.tmp_dir, event_listener,
+                                                 self.hash_downloads, self.downloader_pool,
+                                                 self.resuming)
             # allow the downloader to be accessed by the cancel method if necessary
             self.downloader = download_wrapper.downloader
-            download_wrapper.download_packages()
-            self.downloader = None
+            try:
+                download_wrapper.download_packages()
+            finally:
+                self.downloader = None
+                self.downloader_pool.release(download_wrapper.downloader)
+            event_listener.finish()
         finally:
             primary_file_handle.close()
 
@@ -390,22 +737,133 @@ class RepoSync(object):
         presto_file_handle = metadata_files.get_metadata_file_handle(presto.METADATA_FILE_NAME)
         if presto_file_handle:
             try:
-                package_model_generator = packages.package_list_generator(presto_file_handle,
-                                                                         presto.PACKAGE_TAG,
-                                                                         presto.process_package_element)
-                units_to_download = self._filtered_unit_generator(package_model_generator, drpms_to_download)
-
+                units_to_download = self._drpm_models_to_download(presto_file_handle,
+                                                                  drpms_to_download)
                 download_wrapper = packages.Packages(self.sync_feed, self.nectar_config,
-                                                        units_to_download, self.tmp_dir, event_listener)
+                                                     units_to_download, self.tmp_dir,
+                                                     event_listener, self.hash_downloads,
+                                                     self.downloader_pool, self.resuming)
                 # allow the downloader to be accessed by the cancel method if necessary
                 self.downloader = download_wrapper.downloader
-                download_wrapper.download_packages()
-                self.downloader = None
+                try:
+                    download_wrapper.download_packages()
+                finally:
+                    self.downloader = None
+                    self.downloader_pool.release(download_wrapper.downloader)
+                event_listener.finish()
             finally:
                 presto_file_handle.close()
 
-        report = self.sync_conduit.build_success_report({}, {})
-        return report
+    def _download_together(self, metadata_files, event_listener, rpms_to_download,
+                           drpms_to_download):
+        """
+        Download the requested RPMs, the requested DRPMs and the distribution's
+        files, if any, with one downloader, so that no type waits for the
+        slowest file of another. The distribution step is run here instead of
+        by run(), and its state is reported separately as usual.
+
+        :param metadata_files:      populated instance of MetadataFiles
+        :type  metadata_files:      pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+        :param event_listener:      listener that saves each downloaded unit
+        :type  event_listener:      pulp_rpm.plugins.importers.yum.listener.ContentListener
+        :param rpms_to_download:    set of RPM.NAMEDTUPLEs
+        :type  rpms_to_download:    set
+        :param drpms_to_download:   set of DRPM.NAMEDTUPLEs
+        :type  drpms_to_download:   set
+        """
+        scheduler = DownloadScheduler(self.sync_feed, self.nectar_config, self.downloader_pool)
+
+        distribution = None
+        if models.Distribution.TYPE not in self.call_config.get(constants.CONFIG_SKIP, []):
+            self.distribution_report['state'] = constants.STATE_RUNNING
+            self.set_progress()
+            distribution_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+            distribution = treeinfo.prepare(self.sync_feed, distribution_dir, self.nectar_config,
+                                            self.distribution_report, self.update_progress,
+                                            self.validate_downloads, self.hash_downloads,
+                                            self.downloader_pool)
+            if distribution is not None:
+                # distribution files are few but large, so they start right away
+                distribution_model, distribution_listener, requests = distribution
+                scheduler.add(requests, distribution_listener)
+
+        primary_file_handle = metadata_files.get_metadata_file_handle(primary.METADATA_FILE_NAME)
+        presto_file_handle = metadata_files.get_metadata_file_handle(presto.METADATA_FILE_NAME)
+        try:
+            units_to_download = self._rpm_models_to_download(primary_file_handle, rpms_to_download)
+            scheduler.add(self._package_requests(units_to_download, event_listener), event_listener)
+            if presto_file_handle:
+                units_to_download = self._drpm_models_to_download(presto_file_handle,
+                                                                  drpms_to_download)
+                scheduler.add(self._package_requests(units_to_download, event_listener),
+                              event_listener)
+            # allow the downloader to be accessed by the cancel method if necessary
+            self.downloader = scheduler.downloader
+            scheduler.download()
+            event_listener.finish()
+        finally:
+            self.downloader = None
+            self.downloader_pool.release(scheduler.downloader)
+            primary_file_handle.close()
+            if presto_file_handle:
+                presto_file_handle.close()
+
+        if distribution is not None:
+            treeinfo.finish(self.sync_conduit, distribution_dir, distribution_model,
+                            distribution_listener, self.distribution_report)
+        self.set_progress()
+
+    def _package_requests(self, units_to_download, event_listener):
+        """
+        :param units_to_download:   iterator of models for the packages to download
+        :type  units_to_download:   iterator
+        :param event_listener:      listener that saves each downloaded unit
+        :type  event_listener:      pulp_rpm.plugins.importers.yum.listener.ContentListener
+
+        :return:    generator of download requests, without those for packages
+                    an interrupted sync already downloaded, if resuming
+        :rtype:     generator
+        """
+        requests = packages.package_requests(self.sync_feed, units_to_download, self.tmp_dir,
+                                             self.hash_downloads)
+        if self.resuming:
+            requests = packages.skip_complete_requests(requests, event_listener)
+        return requests
+
+    def _rpm_models_to_download(self, primary_file_handle, rpms_to_download):
+        """
+        :param primary_file_handle: open primary.xml file
+        :type  primary_file_handle: file
+        :param rpms_to_download:    set of RPM.NAMEDTUPLEs
+        :type  rpms_to_download:    set
+
+        :return:    generator of models for the RPMs to download
+        :rtype:     generator
+        """
+        if self.rpm_index is not None:
+            # only parse the packages we actually need
+            return self.rpm_index.download_generator(primary_file_handle)
+        package_record_generator = packages.package_list_generator(primary_file_handle,
+                                                                   primary.PACKAGE_TAG,
+                                                                   primary.process_package_record)
+        # only build full models for the packages we actually need
+        return (record.to_model() for record in
+                self._filtered_unit_generator(package_record_generator, rpms_to_download))
+
+    def _drpm_models_to_download(self, presto_file_handle, drpms_to_download):
+        """
+        :param presto_file_handle:  open presto metadata file
+        :type  presto_file_handle:  file
+        :param drpms_to_download:   set of DRPM.NAMEDTUPLEs
+        :type  drpms_to_download:   set
+
+        :return:    generator of models for the DRPMs to download
+        :rtype:     generator
+        """
+        package_model_generator = packages.package_list_generator(presto_file_handle,
+                                                                  presto.PACKAGE_TAG,
+                                                                  presto.process_package_element)
+        return self._filtered_unit_generator(package_model_generator, drpms_to_download)
 
     def cancel(self):
         """
@@ -421,6 +879,11 @@ class RepoSync(object):
         except AttributeError:
             # there might not be a downloader to cancel right now.
             _LOGGER.debug('could not cancel downloader')
+        try:
+            # discard downloaded units that have not been saved yet
+            self.content_listener.cancel()
+        except AttributeError:
+            _LOGGER.debug('could not cancel content listener')
         try:
             self.set_progress()
         # this exception is only raised for the benefit of the run() method so
@@ -505,6 +968,10 @@ class RepoSync(object):
                                 don't have a version, but could change
         :type  mutable_type:    bool
         """
+        if self.call_config.get_boolean(constants.CONFIG_INCREMENTAL_FILELESS) is True:
+            self._save_changed_fileless_units(file_handle, tag, process_func)
+            return
+
         # iterate through the file and determine what we want to have
         package_info_generator = packages.package_list_generator(file_handle,
                                                                  tag,
@@ -514,7 +981,8 @@ class RepoSync(object):
         if not mutable_type:
             wanted = (model.as_named_tuple for model in package_info_generator)
             # given what we want, filter out what we already have
-            to_save = existing.check_repo(wanted, self.sync_conduit.get_units)
+            to_save = existing.check_repo(wanted, self.sync_conduit.get_units,
+                                          checker=self.existence_checker)
 
             # rewind, iterate again through the file, and save what we need
             file_handle.seek(0)
@@ -527,10 +995,68 @@ class RepoSync(object):
             unit = self.sync_conduit.init_unit(model.TYPE, model.unit_key, model.metadata, None)
             self.sync_conduit.save_unit(unit)
 
+    def _save_changed_fileless_units(self, file_handle, tag, process_func):
+        """
+        Incremental version of save_fileless_units. A hash of each unit's
+        content is compared to the hashes saved on the repo scratchpad by the
+        previous sync, and only units that are new or have changed are saved.
+        Units whose hashes match are checked against the repo in bulk, and the
+        file is only parsed again if some of them have been removed from it
+        since, so that they are saved again.
+
+        :param file_handle:     open file-like object containing metadata
+        :type  file_handle:     file
+        :param tag:             XML tag that identifies each unit
+        :type  tag:             basestring
+        :param process_func:    function that processes each unit and returns
+                                a model instance. The function must take one
+                                parameter, which is an ElementTree instance
+        :type  process_func:    function
+        """
+        scratchpad = self.sync_conduit.get_repo_scratchpad() or {}
+        previous_hashes = scratchpad.get(constants.SCRATCHPAD_UNIT_HASHES, {})
+        previous_hashes = dict((type_id, set(hashes)) for type_id, hashes in previous_hashes.iteritems())
+        current_hashes = {}
+        unchanged = set()
+
+        for model in packages.package_list_generator(file_handle, tag, process_func):
+            unit_hash = _unit_content_hash(model)
+            current_hashes.setdefault(model.TYPE, set()).add(unit_hash)
+            if unit_hash in previous_hashes.get(model.TYPE, ()):
+                unchanged.add(model.as_named_tuple)
+                continue
+            unit = self.sync_conduit.init_unit(model.TYPE, model.unit_key, model.metadata, None)
+            self.sync_conduit.save_unit(unit)
+
+        # units that have not changed may still have been removed from the repo
+        if unchanged:
+            missing = existing.check_repo(unchanged, self.sync_conduit.get_units,
+                                          checker=self.existence_checker)
+        else:
+            missing = set()
+        if missing:
+            file_handle.seek(0)
+            for model in packages.package_list_generator(file_handle, tag, process_func):
+                if model.as_named_tuple in missing:
+                    unit = self.sync_conduit.init_unit(model.TYPE, model.unit_key, model.metadata, None)
+                    self.sync_conduit.save_unit(unit)
+
+        # only remember the hashes once everything has been saved
+        scratchpad = self.sync_conduit.get_repo_scratchpad() or {}
+        saved_hashes = scratchpad.setdefault(constants.SCRATCHPAD_UNIT_HASHES, {})
+        for type_id, hashes in current_hashes.iteritems():
+            saved_hashes[type_id] = sorted(hashes)
+        # forget the hashes of a type that is no longer in the file
+        type_id = FILELESS_TAG_TYPES.get(tag)
+        if type_id is not None and type_id not in current_hashes:
+            saved_hashes.pop(type_id, None)
+        self.sync_conduit.set_repo_scratchpad(scratchpad)
+
     def finalize(self):
         """
         Perform any necessary cleanup.
         """
+        self.downloader_pool.clear()
         self.nectar_config.finalize()
 
     def _identify_wanted_versions(self, package_info_generator):
@@ -540,41 +1066,24 @@ class RepoSync(object):
         package_info_generator is in fact a generator, this will not consume
         much memory.
 
-        :param package_info_generator:  iterator of pulp_rpm.common.models.Package
+        :param package_info_generator:  iterator of pulp_rpm.common.models.VersionedPackage
+                                        or pulp_rpm.common.models.PackageRecord
                                         instances
         :return:    dict where keys are Packages as named tuples, and values
                     are the size of each package
         :rtype:     dict
         """
-        # keys are a model's key string minus any version info
-        # values are dicts where keys are serialized versions, and values are
-        # a tuple of (model as named tuple, size in bytes)
-        wanted = {}
-
         number_old_versions_to_keep = self.call_config.get(importer_constants.KEY_UNITS_RETAIN_OLD_COUNT)
+        if number_old_versions_to_keep is not None:
+            retainer = retention.VersionRetainer(int(number_old_versions_to_keep) + 1)
+        else:
+            retainer = retention.VersionRetainer()
+
         for model in package_info_generator:
-            versions = wanted.setdefault(model.key_string_without_version, {})
-            serialized_version = model.complete_version_serialized
-            size = model.metadata['size']
-
-            # if we are limited on the number of old versions we can have,
-            if number_old_versions_to_keep is not None:
-                number_to_keep = number_old_versions_to_keep + 1
-                if len(versions) < number_to_keep:
-                    versions[serialized_version] = (model.as_named_tuple, size)
-                else:
-                    smallest_version = sorted(versions.keys(), reverse=True)[:number_to_keep][-1]
-                    if serialized_version > smallest_version:
-                        del versions[smallest_version]
-                        versions[serialized_version] = (model.as_named_tuple, size)
-            else:
-                versions[serialized_version] = (model.as_named_tuple, size)
-        ret = {}
-        for units in wanted.itervalues():
-            for unit, size in units.itervalues():
-                ret[unit] = size
+            retainer.add(model.key_string_without_version, model.complete_version,
+                         (model.as_named_tuple, model.size))
 
-        return ret
+        return dict(retainer.values())
 
     def _filtered_unit_generator(self, units, to_download=None):
         """
@@ -599,3 +1108,15 @@ class RepoSync(object):
                 yield unit
             elif unit.as_named_tuple in to_download:
                 yield unit
+
+
+def _unit_content_hash(model):
+    """
+    :param model:   model instance representing a unit
+    :type  model:   pulp_rpm.common.models.Package
+
+    :return:    hex digest that changes if the unit's key or metadata change
+    :rtype:     str
+    """
+    content = json.dumps([model.unit_key, model.metadata], sort_keys=True, default=str)
+    return hashlib.sha1(content).hexdigest()
@@ -31,6 +31,13 @@ DEFAULT_PAGE_SIZE = 1000
 STRIP_NS_RE = re.compile('{.*?}')
 Namespace = namedtuple('Namespace', ['name', 'uri'])
 
+# required for using a raw snippet of a metadata file in place of an element
+# converted to raw XML
+XMLNS_DECLARATION_RE = re.compile(r'''\s+xmlns(?::([\w.-]+))?\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+# references to entities other than those predefined by XML, which cannot be
+# resolved once a snippet is taken out of its document
+UNDEFINED_ENTITY_RE = re.compile(r'&(?!(?:lt|gt|amp|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)')
+
 
 # TODO: probably should move this to pulp.common
 def paginate(iterable, page_size=DEFAULT_PAGE_SIZE):
@@ -102,6 +109,67 @@ def element_to_raw_xml(element, namespaces_to_register=None, default_namespace_u
     return ret
 
 
+def snippet_to_raw_xml(snippet, namespace_declarations='', namespaces_to_register=None,
+                       default_namespace_uri=None):
+    """
+    Produce a raw XML block like the one element_to_raw_xml would produce for
+    the element parsed from a snippet of a metadata file, by using the snippet
+    itself instead of serializing the element. Only the namespace declarations
+    are changed: any on the snippet's start tag are removed. Non-ASCII
+    characters are replaced with character references, as they are when an
+    element is serialized.
+
+    The snippet can only be used if it means the same thing without the
+    namespace declarations of the document it came from. If it does not, None
+    is returned and element_to_raw_xml must be used instead.
+
+    :param snippet:                 raw XML for one element, as found by
+                                    pulp_rpm.plugins.importers.yum.repomd.packages.PackageSnippets
+    :type  snippet:                 str
+    :param namespace_declarations:  "xmlns" attributes from the document's root
+                                    element
+    :type  namespace_declarations:  str
+    :param namespaces_to_register:  collection of Namespace instances whose
+                                    prefixes may be used in the snippet
+    :type  namespaces_to_register:  list or tuple
+    :param default_namespace_uri:   URI of the default namespace, which is
+                                    stripped from the element's tags. If None,
+                                    any default namespace is stripped, as
+                                    strip_ns does.
+    :type  default_namespace_uri:   basestring
+
+    :return:    XML as a string, or None if the snippet cannot be used
+    :rtype:     str or NoneType
+    """
+    start_tag_end = snippet.find('>')
+    if snippet.find('xmlns', start_tag_end) != -1:
+        # a namespace is declared on one of the descendants
+        return
+    allowed = set((namespace.name, namespace.uri) for namespace in namespaces_to_register or ())
+    for declarations in (' ' + namespace_declarations, snippet[:start_tag_end]):
+        for match in XMLNS_DECLARATION_RE.finditer(declarations):
+            prefix = match.group(1)
+            uri = match.group(2) if match.group(2) is not None else match.group(3)
+            if prefix is None:
+                if default_namespace_uri is not None and uri != default_namespace_uri:
+                    return
+            elif (prefix, uri) not in allowed:
+                return
+    if UNDEFINED_ENTITY_RE.search(snippet):
+        return
+
+    if 'xmlns' in snippet[:start_tag_end]:
+        snippet = XMLNS_DECLARATION_RE.sub('', snippet[:start_tag_end]) + snippet[start_tag_end:]
+    try:
+        snippet.decode('ascii')
+    except UnicodeDecodeError:
+        try:
+            snippet = snippet.decode('utf-8').encode('ascii', 'xmlcharrefreplace')
+        except UnicodeDecodeError:
+            return
+    return snippet + '\n'
+
+
 @check_builtin(ET)
 def register_namespace(prefix, uri):
     """
@@ -140,3 +208,43 @@ def strip_ns(element, uri=None):
         element.tag = element.tag.replace('{%s}' % uri, '')
     for child in list(element):
         strip_ns(child, uri)
+
+
+def dispatch_children(element, target, handlers, repeated_handlers=None):
+    """
+    Pass each child of an element to the handler for its tag, in one pass over
+    the children. A handler in "handlers" is called only for the first child
+    with its tag, which is the child that element.find() would return. A
+    handler in "repeated_handlers" is called for every child with its tag, in
+    document order, as element.findall() would return them.
+
+    :param element:             element whose children should be handled
+    :type  element:             xml.etree.ElementTree.Element
+    :param target:              object, usually a dict, that is passed to
+                                each handler along with the child
+    :type  target:              object
+    :param handlers:            dict where keys are tags and values are
+                                functions that take the target and a child
+    :type  handlers:            dict
+    :param repeated_handlers:   dict where keys are tags and values are
+                                functions that take the target and a child
+    :type  repeated_handlers:   dict
+
+    :return:    the handlers that were not called, keyed by tag
+    :rtype:     dict
+    """
+    remaining = dict(handlers)
+    pop = remaining.pop
+    if repeated_handlers:
+        get_repeated = repeated_handlers.get
+        for child in element:
+            tag = child.tag
+            handler = get_repeated(tag) or pop(tag, None)
+            if handler is not None:
+                handler(target, child)
+    else:
+        for child in element:
+            handler = pop(child.tag, None)
+            if handler is not None:
+                handler(target, child)
+    return remaining
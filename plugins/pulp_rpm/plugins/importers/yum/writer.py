@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import logging
+import Queue
+import sys
+import threading
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# maximum number of items waiting to be written before put() blocks
+QUEUE_SIZE = 100
+# maximum number of items handed to the save function at once
+BATCH_SIZE = 50
+# seconds to wait on a full queue before checking whether we were cancelled
+POLL_TIMEOUT = 1
+
+# tells the writer thread to exit
+_STOP = object()
+
+
+class BatchWriter(threading.Thread):
+    """
+    Saves items on a dedicated thread, so that whoever produces them, such as
+    a downloader calling a listener, does not have to wait for each one to be
+    written. Items wait in a bounded queue; when it is full, put() blocks until
+    the writer catches up. Whatever items are waiting when the writer becomes
+    free are saved together in one batch.
+
+    The save function should handle failures of individual items itself. If
+    it raises an exception anyway, only that batch is lost: later batches are
+    still saved, and the first such exception is raised again by flush().
+    """
+
+    def __init__(self, save_func, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        """
+        :param save_func:   function that takes a list of items and saves them
+        :type  save_func:   function
+        :param queue_size:  maximum number of items waiting to be saved
+        :type  queue_size:  int
+        :param batch_size:  maximum number of items passed to save_func at once
+        :type  batch_size:  int
+        """
+        super(BatchWriter, self).__init__()
+        self.daemon = True
+        self.save_func = save_func
+        self.batch_size = batch_size
+        self.queue = Queue.Queue(queue_size)
+        self.cancelled = threading.Event()
+        # sys.exc_info() of the first exception raised by save_func
+        self.exc_info = None
+        self._stopped = False
+
+    def put(self, item):
+        """
+        Add an item to be saved, blocking while the queue is full. If the
+        writer has been cancelled, the item is discarded.
+
+        :param item:    anything save_func accepts in its list
+        """
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=POLL_TIMEOUT)
+                return
+            except Queue.Full:
+                continue
+
+    def flush(self):
+        """
+        Block until every item added so far has been saved or discarded.
+
+        :raise Exception: the exception raised by save_func, if any
+        """
+        self.queue.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+    def stop(self):
+        """
+        Save whatever remains in the queue, then end the writer thread. This
+        is safe to call more than once.
+        """
+        if not self._stopped and self.is_alive():
+            self._stopped = True
+            self.queue.put(_STOP)
+            self.join()
+
+    def cancel(self):
+        """
+        Discard every item that has not been saved yet and end the writer
+        thread. The batch currently being saved, if any, is allowed to finish.
+        """
+        self.cancelled.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.queue.task_done()
+        self.stop()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            items = [item for item in batch if item is not _STOP]
+            try:
+                if items and not self.cancelled.is_set():
+                    self.save_func(items)
+            except Exception:
+                _LOGGER.exception('failed to save %d items' % len(items))
+                if self.exc_info is None:
+                    self.exc_info = sys.exc_info()
+            finally:
+                for item in batch:
+                    self.queue.task_done()
+            if batch[-1] is _STOP:
+                return
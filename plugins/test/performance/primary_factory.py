@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Generates synthetic primary.xml files for performance tests.
+"""
+
+import random
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="%d">
+"""
+
+FOOTER = """</metadata>
+"""
+
+PACKAGE_TEMPLATE = """<package type="rpm">
+  <name>%(name)s</name>
+  <arch>x86_64</arch>
+  <version epoch="0" ver="%(version)s" rel="%(release)s"/>
+  <checksum type="sha256" pkgid="YES">%(checksum)064x</checksum>
+  <summary>Synthetic package %(name)s</summary>
+  <description>Synthetic package used for performance testing</description>
+  <packager>Pulp Project</packager>
+  <url>http://www.pulpproject.org/</url>
+  <time file="1354738068" build="1354735351"/>
+  <size package="%(size)d" installed="176600" archive="177640"/>
+<location href="Packages/%(name)s-%(version)s-%(release)s.x86_64.rpm"/>
+  <format>
+    <rpm:license>GPLv2</rpm:license>
+    <rpm:vendor>Pulp Project</rpm:vendor>
+    <rpm:group>System Environment/Libraries</rpm:group>
+    <rpm:buildhost>localhost</rpm:buildhost>
+    <rpm:sourcerpm>%(name)s-%(version)s-%(release)s.src.rpm</rpm:sourcerpm>
+    <rpm:header-range start="1384" end="8104"/>
+    <rpm:provides>
+      <rpm:entry name="%(name)s" flags="EQ" epoch="0" ver="%(version)s" rel="%(release)s"/>
+      <rpm:entry name="lib%(name)s.so.1()(64bit)"/>
+    </rpm:provides>
+    <rpm:requires>
+      <rpm:entry name="/sbin/ldconfig"/>
+      <rpm:entry name="libc.so.6(GLIBC_2.14)(64bit)"/>
+    </rpm:requires>
+  </format>
+</package>
+"""
+
+
+def write_primary(path, package_count, versions_per_package=10, seed=0):
+    """
+    Write a primary.xml file containing package_count packages, where each
+    package name appears with versions_per_package different versions. The
+    packages are written in a random but repeatable order, so that versions
+    of a package do not appear in sorted order.
+
+    :param path:                    path of the file to write
+    :type  path:                    basestring
+    :param package_count:           total number of packages to write
+    :type  package_count:           int
+    :param versions_per_package:    number of versions of each package name
+    :type  versions_per_package:    int
+    :param seed:                    seed for the random ordering
+    :type  seed:                    int
+    """
+    rng = random.Random(seed)
+    order = range(package_count)
+    rng.shuffle(order)
+    with open(path, 'w') as primary_file:
+        primary_file.write(HEADER % package_count)
+        for i in order:
+            name_index, version_index = divmod(i, versions_per_package)
+            primary_file.write(PACKAGE_TEMPLATE % {
+                'name': 'package-%d' % name_index,
+                'version': '%d.%d' % (version_index % 3, version_index),
+                'release': '%d.el6' % (version_index + 1),
+                'checksum': i,
+                'size': 1024 + i,
+            })
+        primary_file.write(FOOTER)
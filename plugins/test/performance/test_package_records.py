@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Compares the time and memory needed to read a 100k-package primary.xml into
+full RPM models against reading it into PackageRecords.
+
+Memory is measured in a child process for each approach, as the growth in
+maximum resident set size while every result is held in a list.
+"""
+
+import gc
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import unittest
+
+from pulp_rpm.plugins.importers.yum.repomd import packages, primary
+import primary_factory
+
+PACKAGE_COUNT = 100000
+
+
+def detached_record(package_element):
+    """
+    A record as it is held once its element is no longer needed
+    """
+    record = primary.process_package_record(package_element)
+    record._element = None
+    return record
+
+
+def measure(path, process_func, queue):
+    """
+    Read every package in the file and hold on to all of them, reporting the
+    time taken, the growth in maximum RSS in kB, and the packages' unit keys.
+    """
+    gc.collect()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    with open(path) as primary_file:
+        results = list(packages.package_list_generator(primary_file, primary.PACKAGE_TAG,
+                                                       process_func))
+    elapsed = time.time() - start
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    # named tuples of unit keys can't be pickled, so send plain tuples
+    queue.put((elapsed, rss_growth, sorted(tuple(result.as_named_tuple) for result in results)))
+
+
+def run_measurement(path, process_func):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(path, process_func, queue))
+    process.start()
+    ret = queue.get()
+    process.join()
+    return ret
+
+
+class TestPackageRecordPerformance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.working_dir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.working_dir, 'primary.xml')
+        primary_factory.write_primary(cls.path, PACKAGE_COUNT)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.working_dir, ignore_errors=True)
+
+    def test_memory(self):
+        model_time, model_rss, model_keys = run_measurement(self.path,
+                                                            primary.process_package_element)
+        record_time, record_rss, record_keys = run_measurement(self.path, detached_record)
+
+        print '\n%d packages' % PACKAGE_COUNT
+        print 'RPM models:     %.2fs, %d kB max RSS growth' % (model_time, model_rss)
+        print 'PackageRecords: %.2fs, %d kB max RSS growth' % (record_time, record_rss)
+        self.assertEqual(record_keys, model_keys)
+        self.assertTrue(record_rss < model_rss)
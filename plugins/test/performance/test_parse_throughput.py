@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Measures how fast package_list_generator finds the package elements in each
+kind of metadata file, compared with the parser it replaced, which stripped
+the namespace from the tag of every element it reported.
+
+Elements are not processed, so that only the parser is measured, except when
+primary.xml is parsed by worker processes, which only makes sense along with
+processing.
+"""
+
+import functools
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from xml.etree.cElementTree import iterparse
+
+from pulp_rpm.plugins.importers.yum.repomd import (filelists, group, other, packages,
+                                                   presto, primary, updateinfo)
+import primary_factory
+
+ENTRY_COUNT = 20000
+
+FILELISTS_TEMPLATE = """<package pkgid="%(i)064x" name="package-%(i)d" arch="x86_64">
+  <version epoch="0" ver="1.%(i)d" rel="1.el6"/>
+  <file type="dir">/usr/share/doc/package-%(i)d</file>
+  <file>/usr/share/doc/package-%(i)d/README</file>
+  <file>/usr/lib64/libpackage-%(i)d.so.1</file>
+  <file>/usr/bin/package-%(i)d</file>
+</package>
+"""
+
+OTHER_TEMPLATE = """<package pkgid="%(i)064x" name="package-%(i)d" arch="x86_64">
+  <version epoch="0" ver="1.%(i)d" rel="1.el6"/>
+  <changelog author="Pulp Project &lt;pulp@example.com&gt; - 1.%(i)d-1" date="1354735351">- new upstream release</changelog>
+  <changelog author="Pulp Project &lt;pulp@example.com&gt; - 1.0-1" date="1254735351">- initial packaging</changelog>
+</package>
+"""
+
+UPDATEINFO_TEMPLATE = """<update from="pulp@example.com" status="stable" type="bugfix" version="1">
+  <id>RHBA-2013:%(i)05d</id>
+  <title>package-%(i)d bug fix update</title>
+  <issued date="2013-01-01 00:00:00"/>
+  <references>
+    <reference href="https://bugzilla.example.com/%(i)d" id="%(i)d" type="bugzilla"/>
+  </references>
+  <description>Synthetic erratum used for performance testing</description>
+  <pkglist>
+    <collection short="">
+      <name>el6</name>
+      <package arch="x86_64" name="package-%(i)d" release="1.el6" src="package-%(i)d-1.%(i)d-1.el6.src.rpm" version="1.%(i)d">
+        <filename>package-%(i)d-1.%(i)d-1.el6.x86_64.rpm</filename>
+        <sum type="sha256">%(i)064x</sum>
+      </package>
+    </collection>
+  </pkglist>
+</update>
+"""
+
+COMPS_TEMPLATE = """<group>
+  <id>group-%(i)d</id>
+  <name>Group %(i)d</name>
+  <name xml:lang="de">Gruppe %(i)d</name>
+  <description>Synthetic group used for performance testing</description>
+  <default>false</default>
+  <uservisible>true</uservisible>
+  <packagelist>
+    <packagereq type="mandatory">package-%(i)d</packagereq>
+    <packagereq type="default">package-%(j)d</packagereq>
+    <packagereq type="conditional" requires="package-%(i)d">package-%(k)d</packagereq>
+  </packagelist>
+</group>
+"""
+
+PRESTODELTA_TEMPLATE = """<newpackage name="package-%(i)d" epoch="0" version="1.%(i)d" release="1.el6" arch="x86_64">
+  <delta oldepoch="0" oldversion="1.%(j)d" oldrelease="1.el6">
+    <filename>drpms/package-%(i)d-1.%(j)d-1.el6_1.%(i)d-1.el6.x86_64.drpm</filename>
+    <sequence>package-%(i)d-1.%(j)d-1.el6-%(i)064x</sequence>
+    <size>%(i)d</size>
+    <checksum type="sha256">%(i)064x</checksum>
+  </delta>
+</newpackage>
+"""
+
+# header, template, footer and package tag for each kind of file
+FILE_TYPES = {
+    filelists.METADATA_FILE_NAME: (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<filelists xmlns="http://linux.duke.edu/metadata/filelists" packages="%d">\n',
+        FILELISTS_TEMPLATE, '</filelists>\n', filelists.PACKAGE_TAG),
+    other.METADATA_FILE_NAME: (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<otherdata xmlns="http://linux.duke.edu/metadata/other" packages="%d">\n',
+        OTHER_TEMPLATE, '</otherdata>\n', other.PACKAGE_TAG),
+    updateinfo.METADATA_FILE_NAME: (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<updates>\n',
+        UPDATEINFO_TEMPLATE, '</updates>\n', updateinfo.PACKAGE_TAG),
+    group.METADATA_FILE_NAME: (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<comps>\n',
+        COMPS_TEMPLATE, '</comps>\n', group.GROUP_TAG),
+    presto.METADATA_FILE_NAME: (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<prestodelta>\n',
+        PRESTODELTA_TEMPLATE, '</prestodelta>\n', presto.PACKAGE_TAG),
+}
+
+
+def write_metadata(path, header, template, footer, count):
+    with open(path, 'w') as metadata_file:
+        if '%d' in header:
+            header %= count
+        metadata_file.write(header)
+        for i in range(count):
+            metadata_file.write(template % {'i': i, 'j': i / 2, 'k': i / 3})
+        metadata_file.write(footer)
+
+
+def previous_package_list_generator(xml_handle, package_tag):
+    """
+    The parser that package_list_generator used to have
+    """
+    xml_iterator = iter(iterparse(xml_handle, events=('start', 'end')))
+    root_element = xml_iterator.next()[1]
+    for event, element in xml_iterator:
+        if event != 'end':
+            continue
+        if not (element.tag == package_tag or
+                re.sub(packages.NS_STRIP_RE, '', element.tag) == package_tag):
+            continue
+        root_element.clear()
+        yield element
+
+
+def measure(path, package_tag, generator):
+    """
+    :return:    tuple of the number of elements found, and the time taken
+    """
+    start = time.time()
+    with open(path) as xml_file:
+        count = sum(1 for element in generator(xml_file, package_tag))
+    return count, time.time() - start
+
+
+class TestParseThroughput(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.working_dir = tempfile.mkdtemp()
+        cls.files = {}
+
+        path = os.path.join(cls.working_dir, 'primary.xml')
+        primary_factory.write_primary(path, ENTRY_COUNT)
+        cls.files[primary.METADATA_FILE_NAME] = (path, primary.PACKAGE_TAG)
+
+        for name, (header, template, footer, tag) in FILE_TYPES.items():
+            path = os.path.join(cls.working_dir, '%s.xml' % name)
+            write_metadata(path, header, template, footer, ENTRY_COUNT)
+            cls.files[name] = (path, tag)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.working_dir, ignore_errors=True)
+
+    def test_throughput(self):
+        print '\n%d entries per file, parsed with %s' % (
+            ENTRY_COUNT, 'lxml' if packages.lxml_etree is not None else 'cElementTree')
+        for name, (path, tag) in sorted(self.files.items()):
+            megabytes = os.path.getsize(path) / float(1024 * 1024)
+            previous_count, previous_time = measure(path, tag, previous_package_list_generator)
+            count, elapsed = measure(path, tag, packages.package_list_generator)
+
+            print '%-12s %6.1f MB  previous: %6.1f MB/s  now: %6.1f MB/s' % (
+                name, megabytes, megabytes / previous_time, megabytes / elapsed)
+            self.assertEqual(count, ENTRY_COUNT)
+            self.assertEqual(previous_count, ENTRY_COUNT)
+
+    def test_parallel_primary(self):
+        path, tag = self.files[primary.METADATA_FILE_NAME]
+        megabytes = os.path.getsize(path) / float(1024 * 1024)
+        processes = multiprocessing.cpu_count()
+        serial = functools.partial(packages.package_list_generator,
+                                   process_func=primary.process_package_record)
+        parallel = functools.partial(serial, processes=processes)
+
+        serial_count, serial_time = measure(path, tag, serial)
+        count, elapsed = measure(path, tag, parallel)
+
+        print '\nprimary records  serial: %6.1f MB/s  %d processes: %6.1f MB/s' % (
+            megabytes / serial_time, processes, megabytes / elapsed)
+        self.assertEqual(count, ENTRY_COUNT)
+        self.assertEqual(serial_count, ENTRY_COUNT)
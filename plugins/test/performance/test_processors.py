@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Measures the time each element processor takes per element, apart from the
+time taken to parse the XML.
+
+Processors may modify the elements they are given, so the elements are
+parsed again before each round.
+"""
+
+import functools
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pulp_rpm.plugins.importers.yum import utils
+from pulp_rpm.plugins.importers.yum.repomd import (filelists, group, other, packages,
+                                                   presto, primary, updateinfo)
+import primary_factory
+import test_parse_throughput
+
+ELEMENT_COUNT = 5000
+ROUNDS = 3
+
+
+class TestProcessors(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.working_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.working_dir, ignore_errors=True)
+
+    def _measure(self, name, tag, process_func, strip_ns=False):
+        """
+        Print the fastest time per element over several rounds.
+
+        :param strip_ns:    strip namespaces from the elements before they are
+                            processed, as is done for filelists and other
+        """
+        path = os.path.join(self.working_dir, '%s.xml' % name)
+        if name == primary.METADATA_FILE_NAME:
+            primary_factory.write_primary(path, ELEMENT_COUNT)
+        else:
+            header, template, footer, tag = test_parse_throughput.FILE_TYPES[name]
+            test_parse_throughput.write_metadata(path, header, template, footer, ELEMENT_COUNT)
+
+        best = None
+        for i in range(ROUNDS):
+            with open(path) as xml_file:
+                elements = list(packages.package_list_generator(xml_file, tag))
+            if strip_ns:
+                for element in elements:
+                    utils.strip_ns(element)
+
+            start = time.time()
+            results = [process_func(element) for element in elements]
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print '\n%-12s %6.1f us per element' % (name, best * 1000000 / ELEMENT_COUNT)
+        self.assertEqual(len(results), ELEMENT_COUNT)
+
+    def test_primary(self):
+        self._measure(primary.METADATA_FILE_NAME, primary.PACKAGE_TAG,
+                      primary.process_package_element)
+
+    def test_filelists(self):
+        self._measure(filelists.METADATA_FILE_NAME, filelists.PACKAGE_TAG,
+                      filelists.process_package_element, strip_ns=True)
+
+    def test_other(self):
+        self._measure(other.METADATA_FILE_NAME, other.PACKAGE_TAG,
+                      other.process_package_element, strip_ns=True)
+
+    def test_updateinfo(self):
+        self._measure(updateinfo.METADATA_FILE_NAME, updateinfo.PACKAGE_TAG,
+                      updateinfo.process_package_element)
+
+    def test_group(self):
+        self._measure(group.METADATA_FILE_NAME, group.GROUP_TAG,
+                      functools.partial(group.process_group_element, 'repo1'))
+
+    def test_presto(self):
+        self._measure(presto.METADATA_FILE_NAME, presto.PACKAGE_TAG,
+                      presto.process_package_element)
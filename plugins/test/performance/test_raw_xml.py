@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Measures how long it takes to turn each package in primary.xml, filelists.xml
+and other.xml into the raw XML that is saved with it, by serializing the parsed
+element as was done before, and by using the package's snippet of the file.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pulp_rpm.plugins.importers.yum import utils
+from pulp_rpm.plugins.importers.yum.repomd import filelists, metadata, other, packages, primary
+import primary_factory
+import test_parse_throughput
+
+PACKAGE_COUNT = 10000
+
+
+def serialize_repodata(snippets, snippet):
+    element = snippets.parse(snippet)
+    utils.strip_ns(element)
+    return element, utils.element_to_raw_xml(element)
+
+
+def serialize_primary(snippets, snippet):
+    return primary.process_package_element(snippets.parse(snippet))
+
+
+class TestRawXML(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.working_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.working_dir, ignore_errors=True)
+
+    def _measure(self, name, tag, previous_func, func):
+        path = os.path.join(self.working_dir, '%s.xml' % name)
+        if name == primary.METADATA_FILE_NAME:
+            primary_factory.write_primary(path, PACKAGE_COUNT)
+        else:
+            header, template, footer, tag = test_parse_throughput.FILE_TYPES[name]
+            test_parse_throughput.write_metadata(path, header, template, footer, PACKAGE_COUNT)
+        with open(path) as xml_file:
+            snippets = packages.PackageSnippets(xml_file, tag)
+            all_snippets = [snippet for offset, snippet in snippets]
+
+        start = time.time()
+        for snippet in all_snippets:
+            previous_func(snippets, snippet)
+        previous_time = time.time() - start
+
+        start = time.time()
+        for snippet in all_snippets:
+            func(snippets, snippet)
+        elapsed = time.time() - start
+
+        print '\n%-10s serialized: %6.1f us  sliced: %6.1f us per package' % (
+            name, previous_time * 1000000 / PACKAGE_COUNT, elapsed * 1000000 / PACKAGE_COUNT)
+        self.assertEqual(len(all_snippets), PACKAGE_COUNT)
+
+    def test_primary(self):
+        self._measure(primary.METADATA_FILE_NAME, primary.PACKAGE_TAG, serialize_primary,
+                      primary.process_package_snippet)
+
+    def test_filelists(self):
+        self._measure(filelists.METADATA_FILE_NAME, filelists.PACKAGE_TAG, serialize_repodata,
+                      metadata._parse_repodata_snippet)
+
+    def test_other(self):
+        self._measure(other.METADATA_FILE_NAME, other.PACKAGE_TAG, serialize_repodata,
+                      metadata._parse_repodata_snippet)
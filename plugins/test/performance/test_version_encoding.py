@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Compares the throughput of version encoding against the original per-character
+implementation.
+
+By default a sample of Fedora 19 and 20 NEVRAs is used. To use a full list
+instead, such as the output of
+"repoquery --all --qf '%{name}-%{epoch}:%{version}-%{release}.%{arch}'",
+set the environment variable NEVRA_LIST to the path of a file with one NEVRA
+per line.
+"""
+
+import os
+import time
+import unittest
+
+from pulp_rpm.common import version_utils
+
+SAMPLE_NEVRAS = """
+NetworkManager-1:0.9.9.0-28.git20131003.fc20.x86_64
+PackageKit-0:0.8.13-1.fc20.x86_64
+abrt-0:2.1.11-1.fc20.x86_64
+alsa-lib-0:1.0.27.2-2.fc20.x86_64
+audit-0:2.3.2-1.fc20.x86_64
+bash-0:4.2.45-4.fc20.x86_64
+bind-libs-32:9.9.4-8.fc20.x86_64
+binutils-0:2.23.88.0.1-13.fc20.x86_64
+bzip2-libs-0:1.0.6-9.fc20.x86_64
+ca-certificates-0:2013.1.95-1.fc20.noarch
+coreutils-0:8.21-13.fc20.x86_64
+cpio-0:2.11-24.fc20.x86_64
+cups-libs-1:1.7.0-4.fc20.x86_64
+curl-0:7.32.0-3.fc20.x86_64
+dbus-1:1.6.12-1.fc20.x86_64
+dracut-0:034-64.git20131205.fc20.x86_64
+e2fsprogs-0:1.42.8-3.fc20.x86_64
+emacs-1:24.3-16.fc20.x86_64
+file-libs-0:5.14-13.fc20.x86_64
+firefox-0:25.0.1-1.fc20.x86_64
+gcc-0:4.8.2-7.fc20.x86_64
+gdb-0:7.6.50.20130731-16.fc20.x86_64
+git-0:1.8.4.2-1.fc20.x86_64
+glib2-0:2.38.2-2.fc20.x86_64
+glibc-0:2.18-11.fc20.x86_64
+gnome-shell-0:3.10.2.1-3.fc20.x86_64
+gnupg2-0:2.0.22-1.fc20.x86_64
+grub2-1:2.00-25.fc20.x86_64
+gtk3-0:3.10.6-1.fc20.x86_64
+httpd-0:2.4.6-6.fc20.x86_64
+java-1.7.0-openjdk-1:1.7.0.60-2.4.3.4.fc20.x86_64
+kernel-0:3.11.10-301.fc20.x86_64
+kernel-0:3.12.5-302.fc20.x86_64
+krb5-libs-0:1.11.3-33.fc20.x86_64
+libX11-0:1.6.1-1.fc20.x86_64
+libreoffice-core-1:4.1.3.2-8.fc20.x86_64
+libselinux-0:2.2.1-6.fc20.x86_64
+libxml2-0:2.9.1-2.fc20.x86_64
+mesa-libGL-0:9.2.4-1.20131128.fc20.x86_64
+mongodb-0:2.4.6-1.fc20.x86_64
+nss-0:3.15.3-1.fc20.x86_64
+openssh-0:6.3p1-5.fc20.x86_64
+openssl-1:1.0.1e-30.fc20.x86_64
+pam-0:1.1.8-1.fc20.x86_64
+perl-4:5.18.1-288.fc20.x86_64
+perl-Digest-SHA-1:5.85-3.fc20.x86_64
+python-0:2.7.5-9.fc20.x86_64
+python-lxml-0:3.2.3-1.fc20.x86_64
+qemu-kvm-2:1.6.1-2.fc20.x86_64
+rpm-0:4.11.1-7.fc20.x86_64
+samba-libs-2:4.1.2-1.fc20.x86_64
+selinux-policy-0:3.12.1-106.fc20.noarch
+sqlite-0:3.8.1-1.fc20.x86_64
+systemd-0:208-9.fc20.x86_64
+tzdata-0:2013h-1.fc20.noarch
+util-linux-0:2.24-2.fc20.x86_64
+vim-enhanced-2:7.4.027-2.fc20.x86_64
+xorg-x11-server-Xorg-0:1.14.4-5.fc20.x86_64
+xz-libs-0:5.1.2-6alpha.fc20.x86_64
+yum-0:3.4.3-111.fc20.noarch
+zlib-0:1.2.8-3.fc20.x86_64
+NetworkManager-1:0.9.8.2-1.fc19.x86_64
+bash-0:4.2.45-1.fc19.x86_64
+firefox-0:22.0-1.fc19.x86_64
+gcc-0:4.8.1-1.fc19.x86_64
+glibc-0:2.17-11.fc19.x86_64
+java-1.7.0-openjdk-1:1.7.0.25-2.3.10.3.fc19.x86_64
+kernel-0:3.9.5-301.fc19.x86_64
+openssh-0:6.2p2-3.fc19.x86_64
+openssl-1:1.0.1e-4.fc19.x86_64
+perl-4:5.16.3-265.fc19.x86_64
+python-0:2.7.5-1.fc19.x86_64
+systemd-0:204-5.fc19.x86_64
+tzdata-0:2013c-1.fc19.noarch
+vim-enhanced-2:7.3.944-1.fc19.x86_64
+yum-0:3.4.3-99.fc19.noarch
+"""
+
+# each NEVRA is seen this many times, as it would be across several syncs and copies
+REPEAT = 2000
+
+
+def load_fields():
+    """
+    :return: list of every version and release in the NEVRA list, in order
+    :rtype:  list
+    """
+    path = os.environ.get('NEVRA_LIST')
+    if path:
+        with open(path) as nevra_file:
+            nevras = nevra_file.read().split()
+    else:
+        nevras = SAMPLE_NEVRAS.split() * REPEAT
+
+    fields = []
+    for nevra in nevras:
+        name_epoch_version, release_arch = nevra.rsplit('-', 1)
+        version = name_epoch_version.rsplit(':', 1)[1]
+        release = release_arch.rsplit('.', 1)[0]
+        fields.extend((version, release))
+    return fields
+
+
+class TestEncodingPerformance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fields = load_fields()
+        print '\nencoding %d fields, %d distinct' % (len(cls.fields), len(set(cls.fields)))
+
+    def time_encoding(self, label, encode_func):
+        start = time.time()
+        ret = encode_func(self.fields)
+        elapsed = time.time() - start
+        print '%s %.3fs (%d fields/s)' % (label.ljust(12), elapsed, len(self.fields) / elapsed)
+        return ret
+
+    def test_encoding(self):
+        version_utils._encode_cache.clear()
+
+        expected = self.time_encoding('legacy:', lambda fields: map(version_utils._legacy_encode, fields))
+        uncached = self.time_encoding('tokenizer:', lambda fields: map(version_utils._encode, fields))
+        cached = self.time_encoding('encode:', lambda fields: map(version_utils.encode, fields))
+        batch = self.time_encoding('encode_many:', version_utils.encode_many)
+
+        self.assertEqual(uncached, expected)
+        self.assertEqual(cached, expected)
+        self.assertEqual(batch, expected)
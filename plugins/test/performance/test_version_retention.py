@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Compares version retention with a bounded heap and memoized encodings against
+the previous approach of sorting every package's versions each time a new
+version is seen.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pulp_rpm.common import version_utils
+from pulp_rpm.plugins.importers.yum import retention
+from pulp_rpm.plugins.importers.yum.repomd import packages, primary
+import primary_factory
+
+PACKAGE_COUNT = 200000
+RETAIN_OLD_COUNT = 2
+
+
+def sorted_retention(records, number_to_keep):
+    """
+    The retention approach used by RepoSync._identify_wanted_versions before
+    VersionRetainer existed.
+    """
+    wanted = {}
+    for key, complete_version, unit, size in records:
+        versions = wanted.setdefault(key, {})
+        serialized_version = tuple(version_utils.encode(field) for field in complete_version)
+        if len(versions) < number_to_keep:
+            versions[serialized_version] = (unit, size)
+        else:
+            smallest_version = sorted(versions.keys(), reverse=True)[:number_to_keep][-1]
+            if serialized_version > smallest_version:
+                del versions[smallest_version]
+                versions[serialized_version] = (unit, size)
+    ret = {}
+    for units in wanted.itervalues():
+        for unit, size in units.itervalues():
+            ret[unit] = size
+    return ret
+
+
+def heap_retention(records, number_to_keep):
+    retainer = retention.VersionRetainer(number_to_keep)
+    for key, complete_version, unit, size in records:
+        retainer.add(key, complete_version, (unit, size))
+    return dict(retainer.values())
+
+
+class TestRetentionPerformance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.working_dir = tempfile.mkdtemp()
+        path = os.path.join(cls.working_dir, 'primary.xml')
+        primary_factory.write_primary(path, PACKAGE_COUNT)
+
+        start = time.time()
+        with open(path) as primary_file:
+            # keep only what retention needs, so the models can be freed
+            cls.records = [(model.key_string_without_version, model.complete_version,
+                            model.as_named_tuple, model.metadata['size'])
+                           for model in packages.package_list_generator(
+                               primary_file, primary.PACKAGE_TAG, primary.process_package_element)]
+        print '\nparsed %d packages in %.2fs' % (len(cls.records), time.time() - start)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.working_dir, ignore_errors=True)
+
+    def test_retention(self):
+        number_to_keep = RETAIN_OLD_COUNT + 1
+
+        start = time.time()
+        expected = sorted_retention(self.records, number_to_keep)
+        sorted_time = time.time() - start
+
+        start = time.time()
+        result = heap_retention(self.records, number_to_keep)
+        heap_time = time.time() - start
+
+        print 'sorted retention: %.2fs' % sorted_time
+        print 'heap retention:   %.2fs' % heap_time
+        self.assertEqual(result, expected)
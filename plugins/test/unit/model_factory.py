@@ -61,6 +61,14 @@ def rpm_units(num, same_name_and_arch=False):
     return rpm_models(num, same_name_and_arch)
 
 
+def rpm_records(rpms):
+    """
+    Wraps models in records whose to_model method returns the original model
+    """
+    return [models.PackageRecord(type(rpm), rpm.as_named_tuple, rpm.metadata.get('size'),
+                                 rpm, lambda model: model) for rpm in rpms]
+
+
 def srpm_models(num, same_name_and_arch=False):
     ret = []
     count = _srpm_counter.next()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulp_rpm.plugins.importers.yum.checkpoint import SyncCheckpoint
+
+
+FEED = 'http://fake/repo/'
+
+
+class TestSyncCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.checkpoint = SyncCheckpoint(self.working_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def _download(self, name, data):
+        with open(os.path.join(self.checkpoint.path, name), 'w') as downloaded_file:
+            downloaded_file.write(data)
+
+    def test_open(self):
+        path = self.checkpoint.open()
+
+        self.assertTrue(os.path.isdir(path))
+        self.assertTrue(path.startswith(self.working_dir))
+
+    def test_open_removes_directories(self):
+        path = self.checkpoint.open()
+        os.mkdir(os.path.join(path, 'distribution'))
+        self._download('a.rpm', 'rpm')
+
+        self.checkpoint.open()
+
+        self.assertEqual(os.listdir(path), ['a.rpm'])
+
+    def test_first_sync(self):
+        self.checkpoint.open()
+        self._download('repomd.xml', 'revision 1')
+        self._download('a.rpm', 'rpm')
+
+        self.assertFalse(self.checkpoint.begin(FEED, 'repomd.xml', '1'))
+
+        self.assertFalse(self.checkpoint.resuming)
+        self.assertEqual(sorted(os.listdir(self.checkpoint.path)), ['journal.json', 'repomd.xml'])
+
+    def test_resume(self):
+        self.checkpoint.open()
+        self._download('repomd.xml', 'revision 1')
+        self.checkpoint.begin(FEED, 'repomd.xml', '1')
+        self._download('a.rpm', 'rpm')
+
+        checkpoint = SyncCheckpoint(self.working_dir)
+        checkpoint.open()
+
+        self.assertTrue(checkpoint.begin(FEED, 'repomd.xml', '1'))
+        self.assertTrue(checkpoint.resuming)
+        self.assertTrue('a.rpm' in os.listdir(checkpoint.path))
+
+    def test_new_revision(self):
+        self.checkpoint.open()
+        self._download('repomd.xml', 'revision 1')
+        self.checkpoint.begin(FEED, 'repomd.xml', '1')
+        self._download('a.rpm', 'rpm')
+        self._download('repomd.xml', 'revision 2')
+
+        self.assertFalse(self.checkpoint.begin(FEED, 'repomd.xml', '2'))
+        self.assertFalse('a.rpm' in os.listdir(self.checkpoint.path))
+
+    def test_new_feed(self):
+        self.checkpoint.open()
+        self._download('repomd.xml', 'revision 1')
+        self.checkpoint.begin(FEED, 'repomd.xml', '1')
+
+        self.assertFalse(self.checkpoint.begin('http://other/', 'repomd.xml', '1'))
+
+    def test_corrupt_journal(self):
+        self.checkpoint.open()
+        self._download('repomd.xml', 'revision 1')
+        self._download('journal.json', '{not json')
+
+        self.assertFalse(self.checkpoint.begin(FEED, 'repomd.xml', '1'))
+
+    def test_discard(self):
+        self.checkpoint.open()
+        self._download('repomd.xml', 'revision 1')
+        self.checkpoint.begin(FEED, 'repomd.xml', '1')
+
+        self.checkpoint.discard()
+
+        self.assertFalse(os.path.exists(self.checkpoint.path))
+        self.assertFalse(self.checkpoint.resuming)
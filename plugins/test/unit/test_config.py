@@ -15,6 +15,7 @@ from pulp.common.plugins import importer_constants
 
 from pulp.plugins.config import PluginCallConfiguration
 
+from pulp_rpm.common import constants
 from pulp_rpm.plugins.importers.yum import config_validate
 
 
@@ -46,3 +47,81 @@ class ValidateTests(unittest.TestCase):
         self.assertEqual(False, result)
         self.assertTrue('Configuration errors' in error)
         self.assertTrue(not error.endswith('\n')) # make sure trailing \n is stripped off
+
+    def test_valid_package_filter(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_INCLUDE_ARCHES: ['x86_64', 'noarch'],
+                                              constants.CONFIG_EXCLUDE_NAMES: ['*-debuginfo'],
+                                              constants.CONFIG_EXCLUDE_REGEXES: [r'\.el5$']})
+
+        result, error = config_validate.validate(config)
+
+        self.assertEqual(result, True)
+        self.assertEqual(error, None)
+
+    def test_invalid_package_filter(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_INCLUDE_ARCHES: 'x86_64',
+                                              constants.CONFIG_EXCLUDE_REGEXES: ['(unclosed']})
+
+        result, error = config_validate.validate(config)
+
+        self.assertEqual(False, result)
+        self.assertTrue(constants.CONFIG_INCLUDE_ARCHES in error)
+        self.assertTrue('(unclosed' in error)
+
+    def test_invalid_platform_and_package_filter(self):
+        config = PluginCallConfiguration({}, {importer_constants.KEY_PROXY_PORT : 'foo',
+                                              constants.CONFIG_EXCLUDE_NAMES: [1]})
+
+        result, error = config_validate.validate(config)
+
+        # messages from both are reported
+        self.assertEqual(False, result)
+        self.assertTrue(len(error.split('\n')) >= 3)
+        self.assertTrue(constants.CONFIG_EXCLUDE_NAMES in error)
+
+    def test_valid_parse_processes(self):
+        for value in (1, 4, '2'):
+            config = PluginCallConfiguration({}, {constants.CONFIG_PARSE_PROCESSES: value})
+
+            result, error = config_validate.validate(config)
+
+            self.assertEqual(result, True)
+            self.assertEqual(error, None)
+
+    def test_invalid_parse_processes(self):
+        for value in ('abc', '0', 0, -1, '1.5', 1.5, True):
+            config = PluginCallConfiguration({}, {constants.CONFIG_PARSE_PROCESSES: value})
+
+            result, error = config_validate.validate(config)
+
+            self.assertEqual(False, result)
+            self.assertTrue(constants.CONFIG_PARSE_PROCESSES in error)
+
+    def test_valid_booleans(self):
+        for value in (True, False, 'true', 'false'):
+            config = PluginCallConfiguration(
+                {}, dict((key, value) for key in config_validate.BOOLEAN_KEYS))
+
+            result, error = config_validate.validate(config)
+
+            self.assertEqual(result, True)
+            self.assertEqual(error, None)
+
+    def test_invalid_booleans(self):
+        config = PluginCallConfiguration(
+            {}, dict((key, 'yes please') for key in config_validate.BOOLEAN_KEYS))
+
+        result, error = config_validate.validate(config)
+
+        # every invalid option is reported
+        self.assertEqual(False, result)
+        for key in config_validate.BOOLEAN_KEYS:
+            self.assertTrue('<%s>' % key in error)
+
+    def test_invalid_boolean_type(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_SINGLE_PASS: 1})
+
+        result, error = config_validate.validate(config)
+
+        self.assertEqual(False, result)
+        self.assertTrue(constants.CONFIG_SINGLE_PASS in error)
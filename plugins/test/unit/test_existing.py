@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import unittest
+
+import mock
+from pulp.plugins.model import Unit
+
+import model_factory
+from pulp_rpm.common import models
+from pulp_rpm.plugins.importers.yum import existing
+
+
+class TestCheckRepo(unittest.TestCase):
+    def setUp(self):
+        self.rpms = model_factory.rpm_models(3)
+        self.existing_units = [Unit(models.RPM.TYPE, rpm.unit_key, rpm.metadata, None)
+                               for rpm in self.rpms[:2]]
+        self.search_method = mock.MagicMock(return_value=self.existing_units)
+
+    def test_paginated(self):
+        wanted = [rpm.as_named_tuple for rpm in self.rpms]
+
+        ret = existing.check_repo(wanted, self.search_method)
+
+        self.assertEqual(ret, set([self.rpms[2].as_named_tuple]))
+        criteria = self.search_method.call_args[0][0]
+        self.assertTrue('$or' in criteria.unit_filters)
+
+    def test_bulk(self):
+        wanted = [rpm.as_named_tuple for rpm in self.rpms]
+        checker = existing.ExistenceChecker(self.search_method, bulk_threshold=1)
+
+        ret = existing.check_repo(wanted, self.search_method, checker=checker)
+
+        self.assertEqual(ret, set([self.rpms[2].as_named_tuple]))
+        criteria = self.search_method.call_args[0][0]
+        # every unit of the type is loaded, but only its key fields
+        self.assertFalse(criteria.unit_filters)
+        self.assertEqual(list(criteria.unit_fields), list(models.RPM.UNIT_KEY_NAMES))
+
+    def test_bulk_loads_once(self):
+        checker = existing.BulkExistenceChecker(self.search_method)
+
+        existing.check_repo([self.rpms[0].as_named_tuple], self.search_method, checker=checker)
+        ret = existing.check_repo([rpm.as_named_tuple for rpm in self.rpms],
+                                  self.search_method, checker=checker)
+
+        self.assertEqual(ret, set([self.rpms[2].as_named_tuple]))
+        self.assertEqual(self.search_method.call_count, 1)
+
+    def test_threshold(self):
+        checker = existing.ExistenceChecker(self.search_method, bulk_threshold=3)
+        checker.bulk.discard_existing = mock.MagicMock()
+        checker.paginated.discard_existing = mock.MagicMock()
+        values = set(rpm.as_named_tuple for rpm in self.rpms)
+
+        checker.discard_existing(models.RPM.TYPE, values)
+        checker.discard_existing(models.RPM.TYPE, set(list(values)[:2]))
+
+        self.assertEqual(checker.bulk.discard_existing.call_count, 1)
+        self.assertEqual(checker.paginated.discard_existing.call_count, 1)
+
+
+class TestFindInContentStore(unittest.TestCase):
+    def setUp(self):
+        self.rpms = model_factory.rpm_models(3)
+        self.store_units = [Unit(models.RPM.TYPE, rpm.unit_key, rpm.metadata, '/storage/%d' % i)
+                            for i, rpm in enumerate(self.rpms[:2])]
+        self.search_all_method = mock.MagicMock(return_value=self.store_units)
+
+    @mock.patch('os.path.exists', return_value=True)
+    def test_found(self, mock_exists):
+        wanted = [rpm.as_named_tuple for rpm in self.rpms]
+
+        ret = existing.find_in_content_store(wanted, self.search_all_method)
+
+        self.assertEqual(ret, {self.rpms[0].as_named_tuple: self.store_units[0],
+                               self.rpms[1].as_named_tuple: self.store_units[1]})
+        self.assertEqual(self.search_all_method.call_count, 1)
+        unit_type, criteria = self.search_all_method.call_args[0]
+        self.assertEqual(unit_type, models.RPM.TYPE)
+        # the whole unit key, including the checksum, must match
+        self.assertEqual(len(criteria.filters['$or']), 3)
+        self.assertTrue('checksum' in criteria.filters['$or'][0])
+
+    @mock.patch('os.path.exists', return_value=False)
+    def test_missing_file(self, mock_exists):
+        wanted = [rpm.as_named_tuple for rpm in self.rpms]
+
+        ret = existing.find_in_content_store(wanted, self.search_all_method)
+
+        self.assertEqual(ret, {})
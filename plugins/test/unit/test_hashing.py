@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from pulp.plugins.util import verification
+
+from pulp_rpm.plugins.importers.yum import hashing
+
+
+DATA = 'some bytes ' * 1000
+DATA_SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class TestHashingFile(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.working_dir, 'a.rpm')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_write(self):
+        destination = hashing.HashingFile(self.path, 'sha256')
+
+        destination.write(DATA[:100])
+        destination.write(DATA[100:])
+        destination.close()
+
+        self.assertEqual(destination.size, len(DATA))
+        self.assertEqual(destination.hexdigest('sha256'), DATA_SHA256)
+        self.assertTrue(destination.closed)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), DATA)
+
+    def test_opens_lazily(self):
+        destination = hashing.HashingFile(self.path, 'sha256')
+
+        self.assertFalse(os.path.exists(self.path))
+        destination.close()
+        # an empty download still creates the file
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(destination.hexdigest('sha256'), hashlib.sha256().hexdigest())
+
+    def test_other_checksum_type(self):
+        destination = hashing.HashingFile(self.path, 'sha256')
+        destination.write(DATA)
+
+        self.assertTrue(destination.hexdigest('md5') is None)
+
+    def test_unsupported_checksum_type(self):
+        destination = hashing.HashingFile(self.path, 'fake')
+        destination.write(DATA)
+
+        self.assertTrue(destination.hexdigest('fake') is None)
+        self.assertEqual(destination.size, len(DATA))
+
+    def test_start_over(self):
+        destination = hashing.HashingFile(self.path, 'sha256')
+        destination.write('partial')
+
+        destination.seek(0)
+        destination.truncate()
+        destination.write(DATA)
+
+        self.assertTrue(destination.valid)
+        self.assertEqual(destination.size, len(DATA))
+        self.assertEqual(destination.hexdigest('sha256'), DATA_SHA256)
+
+    def test_write_out_of_order(self):
+        destination = hashing.HashingFile(self.path, 'sha256')
+        destination.write(DATA)
+
+        destination.seek(10)
+        destination.write('x')
+
+        self.assertFalse(destination.valid)
+        self.assertTrue(destination.hexdigest('sha256') is None)
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.working_dir, 'a.rpm')
+        self.destination = hashing.HashingFile(self.path, 'sha256')
+        self.destination.write(DATA)
+        self.destination.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_destination_path(self):
+        self.assertEqual(hashing.destination_path(self.destination), self.path)
+        self.assertEqual(hashing.destination_path(self.path), self.path)
+
+    @mock.patch('__builtin__.open')
+    def test_size_from_stream(self, mock_open):
+        hashing.verify_size(self.destination, len(DATA))
+
+        self.assertRaises(verification.VerificationException, hashing.verify_size,
+                          self.destination, len(DATA) + 1)
+        # the file was not read again
+        self.assertEqual(mock_open.call_count, 0)
+
+    @mock.patch('__builtin__.open')
+    def test_checksum_from_stream(self, mock_open):
+        hashing.verify_checksum(self.destination, 'sha256', DATA_SHA256)
+
+        try:
+            hashing.verify_checksum(self.destination, 'sha256', 'abc')
+        except verification.VerificationException, e:
+            self.assertEqual(e[0], DATA_SHA256)
+        else:
+            self.fail('VerificationException not raised')
+        # the file was not read again
+        self.assertEqual(mock_open.call_count, 0)
+
+    def test_reread_path(self):
+        hashing.verify_size(self.path, len(DATA))
+        hashing.verify_checksum(self.path, 'sha256', DATA_SHA256)
+
+        self.assertRaises(verification.VerificationException, hashing.verify_size,
+                          self.path, len(DATA) + 1)
+        self.assertRaises(verification.VerificationException, hashing.verify_checksum,
+                          self.path, 'sha256', 'abc')
+
+    def test_reread_other_checksum_type(self):
+        hashing.verify_checksum(self.destination, 'md5', hashlib.md5(DATA).hexdigest())
+
+        self.assertRaises(verification.VerificationException, hashing.verify_checksum,
+                          self.destination, 'md5', 'abc')
+
+    def test_unsupported_checksum_type(self):
+        self.assertRaises(verification.InvalidChecksumType, hashing.verify_checksum,
+                          self.destination, 'fake', 'abc')
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+from cStringIO import StringIO
+import unittest
+
+import mock
+
+from pulp_rpm.common import models
+from pulp_rpm.plugins.importers.yum.index import PackageIndex
+from pulp_rpm.plugins.importers.yum.repomd import primary
+from test_repomd_packages import TWO_PACKAGES_XML
+
+
+class TestPackageIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PackageIndex(primary.PACKAGE_TAG, primary.process_package_element)
+
+    def test_model_generator(self):
+        models = list(self.index.model_generator(StringIO(TWO_PACKAGES_XML)))
+
+        self.assertEqual(len(models), 2)
+        self.assertEqual(set(self.index.locations), set(m.as_named_tuple for m in models))
+        for offset, length in self.index.locations.values():
+            snippet = TWO_PACKAGES_XML[offset:offset + length]
+            self.assertTrue(snippet.startswith('<package '))
+            self.assertTrue(snippet.endswith('</package>'))
+
+    def test_remote_units(self):
+        models = list(self.index.model_generator(StringIO(TWO_PACKAGES_XML)))
+
+        remote_units = self.index.remote_units
+        remote_units.clear()
+
+        # make sure a copy was returned
+        self.assertEqual(len(self.index.remote_units), len(models))
+
+    def test_download_generator(self):
+        models = list(self.index.model_generator(StringIO(TWO_PACKAGES_XML)))
+        self.index.to_download = set([models[1].as_named_tuple])
+
+        result = list(self.index.download_generator(StringIO(TWO_PACKAGES_XML)))
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].as_named_tuple, models[1].as_named_tuple)
+        self.assertEqual(result[0].raw_xml, models[1].raw_xml)
+
+    def test_download_generator_nothing_wanted(self):
+        list(self.index.model_generator(StringIO(TWO_PACKAGES_XML)))
+
+        result = list(self.index.download_generator(StringIO(TWO_PACKAGES_XML)))
+
+        self.assertEqual(result, [])
+
+    def test_record_func(self):
+        index = PackageIndex(primary.PACKAGE_TAG, primary.process_package_element,
+                             primary.process_package_record)
+
+        records = list(index.model_generator(StringIO(TWO_PACKAGES_XML)))
+        index.to_download = set([records[1].as_named_tuple])
+        result = list(index.download_generator(StringIO(TWO_PACKAGES_XML)))
+
+        self.assertTrue(isinstance(records[0], models.PackageRecord))
+        self.assertEqual(set(index.locations), set(r.as_named_tuple for r in records))
+        self.assertEqual(len(result), 1)
+        self.assertTrue(isinstance(result[0], models.RPM))
+        self.assertEqual(result[0].as_named_tuple, records[1].as_named_tuple)
+
+    def test_filter_func(self):
+        index = PackageIndex(primary.PACKAGE_TAG, primary.process_package_element,
+                             filter_func=lambda unit: unit.arch != 'src')
+
+        result = list(index.model_generator(StringIO(TWO_PACKAGES_XML)))
+
+        self.assertEqual([model.arch for model in result], ['x86_64'])
+        self.assertEqual([unit.arch for unit in index.remote_units], ['x86_64'])
+
+    def test_snippet_func(self):
+        snippet_func = mock.MagicMock(side_effect=primary.process_package_snippet)
+        index = PackageIndex(primary.PACKAGE_TAG, primary.process_package_element,
+                             primary.process_package_record, snippet_func)
+
+        records = list(index.model_generator(StringIO(TWO_PACKAGES_XML)))
+        index.to_download = set([records[0].as_named_tuple])
+        result = list(index.download_generator(StringIO(TWO_PACKAGES_XML)))
+
+        self.assertEqual(snippet_func.call_count, 1)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].as_named_tuple, records[0].as_named_tuple)
+        self.assertTrue(result[0].raw_xml.startswith('<package type="rpm">'))
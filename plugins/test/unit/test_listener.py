@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from nectar.report import DownloadReport
+from pulp.common.plugins import importer_constants
+from pulp.plugins.conduits.repo_sync import RepoSyncConduit
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.plugins.model import Unit
+
+import model_factory
+from pulp_rpm.common import constants
+from pulp_rpm.plugins.importers.yum import hashing
+from pulp_rpm.plugins.importers.yum.listener import ContentListener, DistroFileListener
+from pulp_rpm.plugins.importers.yum.report import ContentReport
+from pulp_rpm.plugins.importers.yum.repomd import metadata
+
+
+@mock.patch('shutil.move', autospec=True)
+class TestContentListener(unittest.TestCase):
+    def setUp(self):
+        self.conduit = mock.MagicMock(spec_set=RepoSyncConduit)
+        self.conduit.init_unit.side_effect = lambda type_id, unit_key, metadata, path: \
+            Unit(type_id, unit_key, metadata, '/storage/' + path)
+        self.config = PluginCallConfiguration({}, {importer_constants.KEY_VALIDATE: False})
+        self.metadata_files = mock.MagicMock(spec_set=metadata.MetadataFiles)
+        self.progress_report = {'content': ContentReport()}
+
+        self.rpms = model_factory.rpm_models(3)
+        self.drpms = model_factory.drpm_models(1)
+        for model in self.rpms + self.drpms:
+            model.metadata['relativepath'] = model.metadata['filename'] = 'a.rpm'
+            model.metadata['size'] = 1024
+        self.progress_report['content'].set_initial_values({'rpm': 3, 'drpm': 1}, 4096)
+        self.reports = [DownloadReport('http://fake/a.rpm', '/tmp/%d' % i, model)
+                        for i, model in enumerate(self.rpms + self.drpms)]
+
+    def test_save_units(self, mock_move):
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files)
+
+        listener.save_units(self.reports)
+
+        # repodata is looked up once for every RPM in the batch
+        self.metadata_files.add_repodata_batch.assert_called_once_with(self.rpms)
+        self.assertEqual(self.conduit.save_unit.call_count, 4)
+        self.assertEqual(mock_move.call_count, 4)
+        self.assertEqual(self.conduit.set_progress.call_count, 1)
+        self.assertEqual(self.progress_report['content']['items_left'], 0)
+
+    def test_download_succeeded(self, mock_move):
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files)
+
+        listener.download_succeeded(self.reports[0])
+
+        self.metadata_files.add_repodata_batch.assert_called_once_with(self.rpms[:1])
+        self.assertEqual(self.conduit.save_unit.call_count, 1)
+        self.assertEqual(self.conduit.set_progress.call_count, 1)
+
+    def test_batch_writes(self, mock_move):
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files, batch_writes=True)
+
+        for report in self.reports:
+            listener.download_succeeded(report)
+        listener.finish()
+        listener.stop()
+
+        self.assertEqual(self.conduit.save_unit.call_count, 4)
+        saved_rpms = sum((call[0][0] for call in self.metadata_files.add_repodata_batch.call_args_list), [])
+        self.assertEqual(saved_rpms, self.rpms)
+        self.assertEqual(self.progress_report['content']['items_left'], 0)
+        self.assertFalse(listener.writer.is_alive())
+
+    def test_batch_writes_error(self, mock_move):
+        self.metadata_files.add_repodata_batch.side_effect = ValueError
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files, batch_writes=True)
+
+        listener.download_succeeded(self.reports[0])
+
+        self.assertRaises(ValueError, listener.finish)
+        listener.stop()
+
+    def test_missing_repodata(self, mock_move):
+        # the second RPM is not in the repodata dbs
+        self.metadata_files.add_repodata_batch.return_value = [self.rpms[1]]
+        self.metadata_files.add_repodata.side_effect = KeyError('seal')
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files)
+
+        listener.save_units(self.reports)
+
+        # it is looked up on its own, then reported as failed, and the rest are saved
+        self.metadata_files.add_repodata.assert_called_once_with(self.rpms[1])
+        self.assertEqual(self.conduit.save_unit.call_count, 3)
+        content_report = self.progress_report['content']
+        self.assertEqual(content_report['items_left'], 0)
+        self.assertEqual(len(content_report['error_details']), 1)
+        error_report = content_report['error_details'][0]
+        self.assertEqual(error_report[constants.UNIT_KEY], self.rpms[1].unit_key)
+        self.assertEqual(error_report[constants.ERROR_CODE], constants.ERROR_SAVE_FAILED)
+        self.assertTrue('seal' in error_report['error'])
+
+    def test_save_error(self, mock_move):
+        mock_move.side_effect = [None, IOError('disk full'), None, None]
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files, batch_writes=True)
+
+        for report in self.reports:
+            listener.download_succeeded(report)
+        listener.finish()
+        listener.stop()
+
+        # the unit that could not be saved is reported, and later units are still saved
+        self.assertEqual(self.conduit.save_unit.call_count, 3)
+        self.assertEqual(len(self.progress_report['content']['error_details']), 1)
+        self.assertEqual(self.progress_report['content']['items_left'], 0)
+
+    def test_cancel(self, mock_move):
+        listener = ContentListener(self.conduit, self.progress_report, self.config,
+                                   self.metadata_files, batch_writes=True)
+
+        listener.cancel()
+        listener.download_succeeded(self.reports[0])
+        listener.finish()
+
+        self.assertEqual(self.conduit.save_unit.call_count, 0)
+        self.assertFalse(listener.writer.is_alive())
+
+    def test_verify_from_stream(self, mock_move):
+        config = PluginCallConfiguration({}, {importer_constants.KEY_VALIDATE: True})
+        listener = ContentListener(self.conduit, self.progress_report, config,
+                                   self.metadata_files)
+        working_dir = tempfile.mkdtemp()
+        try:
+            destination = hashing.HashingFile(os.path.join(working_dir, 'a.rpm'), 'sha256')
+            destination.write('a' * 1024)
+            self.reports[0].destination = destination
+
+            with mock.patch('__builtin__.open') as mock_open:
+                listener.download_succeeded(self.reports[0])
+                # the size and checksum came from the download, not from disk
+                self.assertEqual(mock_open.call_count, 0)
+        finally:
+            shutil.rmtree(working_dir, ignore_errors=True)
+
+        self.assertTrue(destination.closed)
+        # the fake checksum can't match
+        self.assertEqual(self.conduit.save_unit.call_count, 0)
+        error_report = self.progress_report['content']['error_details'][0]
+        self.assertEqual(error_report[constants.ERROR_CODE], constants.ERROR_CHECKSUM_VERIFICATION)
+        self.assertEqual(error_report[constants.ERROR_KEY_CHECKSUM_ACTUAL],
+                         hashlib.sha256('a' * 1024).hexdigest())
+
+
+class TestDistroFileListener(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.progress_report = {'items_left': 2}
+        self.progress_callback = mock.MagicMock()
+        self.destination = hashing.HashingFile(os.path.join(self.working_dir, 'vmlinuz'), 'sha256')
+        self.destination.write('kernel')
+        self.file_dict = {'relativepath': 'images/vmlinuz', 'checksumtype': 'sha256',
+                          'checksum': hashlib.sha256('kernel').hexdigest()}
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_verified(self):
+        listener = DistroFileListener(self.progress_report, self.progress_callback, validate=True)
+        report = DownloadReport('http://fake/images/vmlinuz', self.destination, self.file_dict)
+
+        listener.download_succeeded(report)
+
+        self.assertEqual(listener.succeeded_reports, [report])
+        self.assertEqual(report.destination, self.destination.path)
+        self.assertTrue(self.destination.closed)
+        self.assertEqual(self.progress_report['items_left'], 1)
+        self.progress_callback.assert_called_once_with()
+
+    def test_checksum_mismatch(self):
+        self.file_dict['checksum'] = 'abc'
+        listener = DistroFileListener(self.progress_report, self.progress_callback, validate=True)
+        report = DownloadReport('http://fake/images/vmlinuz', self.destination, self.file_dict)
+
+        listener.download_succeeded(report)
+
+        self.assertEqual(listener.succeeded_reports, [])
+        self.assertEqual(listener.failed_reports, [report])
+        self.assertEqual(report.error_report[constants.ERROR_CODE],
+                         constants.ERROR_CHECKSUM_VERIFICATION)
+        # the file is only counted once
+        self.assertEqual(self.progress_report['items_left'], 1)
+
+    def test_not_validated(self):
+        self.file_dict['checksum'] = 'abc'
+        listener = DistroFileListener(self.progress_report, self.progress_callback)
+        report = DownloadReport('http://fake/images/vmlinuz', self.destination, self.file_dict)
+
+        listener.download_succeeded(report)
+
+        self.assertEqual(listener.succeeded_reports, [report])
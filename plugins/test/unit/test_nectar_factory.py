@@ -17,6 +17,7 @@ from nectar.downloaders.curl import HTTPCurlDownloader
 from nectar.downloaders.threaded import HTTPThreadedDownloader
 
 from pulp_rpm.plugins.importers.yum.repomd import nectar_factory
+from pulp_rpm.plugins.importers.yum.repomd.local import LocalLinkDownloader
 
 
 class NectarFactoryTests(unittest.TestCase):
@@ -41,6 +42,59 @@ class NectarFactoryTests(unittest.TestCase):
                                                       self.mock_event_listener)
         self.assertTrue(isinstance(downloader, HTTPThreadedDownloader))
 
+    def test_file_url_link_local(self):
+        downloader = nectar_factory.create_downloader('file:///foo', self.mock_config,
+                                                      self.mock_event_listener, link_local=True)
+        self.assertTrue(isinstance(downloader, LocalLinkDownloader))
+
+    def test_http_url_link_local(self):
+        downloader = nectar_factory.create_downloader('http://foo', self.mock_config,
+                                                      self.mock_event_listener, link_local=True)
+        self.assertTrue(isinstance(downloader, HTTPThreadedDownloader))
+
     def test_unknown_scheme(self):
         self.assertRaises(ValueError, nectar_factory.create_downloader, 'foo://bar',
                           self.mock_config, self.mock_event_listener)
+
+
+class DownloaderPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        super(DownloaderPoolTests, self).setUp()
+        self.pool = nectar_factory.DownloaderPool(mock.MagicMock())
+        self.mock_event_listener = mock.MagicMock()
+
+    def test_reuses_released_downloader(self):
+        downloader = self.pool.get('http://foo/repo/', mock.MagicMock())
+        self.pool.release(downloader)
+
+        reused = self.pool.get('http://foo/other/', self.mock_event_listener)
+
+        self.assertTrue(reused is downloader)
+        self.assertTrue(reused.event_listener is self.mock_event_listener)
+
+    def test_does_not_lend_downloader_in_use(self):
+        downloader = self.pool.get('http://foo/', self.mock_event_listener)
+
+        self.assertFalse(self.pool.get('http://foo/', self.mock_event_listener) is downloader)
+
+    def test_separate_hosts(self):
+        downloader = self.pool.get('http://foo/', self.mock_event_listener)
+        self.pool.release(downloader)
+
+        self.assertFalse(self.pool.get('http://bar/', self.mock_event_listener) is downloader)
+        self.assertFalse(self.pool.get('https://foo/', self.mock_event_listener) is downloader)
+
+    def test_drops_cancelled_downloader(self):
+        downloader = self.pool.get('http://foo/', self.mock_event_listener)
+        downloader.cancel()
+        self.pool.release(downloader)
+
+        self.assertFalse(self.pool.get('http://foo/', self.mock_event_listener) is downloader)
+
+    def test_clear(self):
+        downloader = self.pool.get('http://foo/', self.mock_event_listener)
+        self.pool.release(downloader)
+        self.pool.clear()
+
+        self.assertFalse(self.pool.get('http://foo/', self.mock_event_listener) is downloader)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import unittest
+
+from pulp.plugins.config import PluginCallConfiguration
+
+from pulp_rpm.common import constants, models
+from pulp_rpm.plugins.importers.yum import package_filter
+from pulp_rpm.plugins.importers.yum.package_filter import PackageFilter
+
+
+def _unit(name, arch, version='1.0', release='1.el6'):
+    return models.RPM.NAMEDTUPLE(name, '0', version, release, arch, 'sha256', 'abc')
+
+
+class TestPackageFilter(unittest.TestCase):
+    def test_no_rules(self):
+        self.assertTrue(PackageFilter().wants(_unit('walrus', 'i686')))
+
+    def test_arches(self):
+        package_filter = PackageFilter(include_arches=['x86_64', 'noarch'],
+                                       exclude_arches=['noarch'])
+
+        self.assertTrue(package_filter.wants(_unit('walrus', 'x86_64')))
+        self.assertFalse(package_filter.wants(_unit('walrus', 'noarch')))
+        self.assertFalse(package_filter.wants(_unit('walrus', 'i686')))
+        self.assertFalse(package_filter.wants(_unit('walrus', 'src')))
+
+    def test_names(self):
+        package_filter = PackageFilter(include_names=['kernel*', 'walrus'],
+                                       exclude_names=['*-debuginfo'])
+
+        self.assertTrue(package_filter.wants(_unit('kernel-devel', 'x86_64')))
+        self.assertTrue(package_filter.wants(_unit('walrus', 'x86_64')))
+        self.assertFalse(package_filter.wants(_unit('walrus-doc', 'x86_64')))
+        self.assertFalse(package_filter.wants(_unit('kernel-debuginfo', 'x86_64')))
+
+    def test_regexes(self):
+        package_filter = PackageFilter(include_regexes=[r'\.el6\.'],
+                                       exclude_regexes=[r'^penguin-2\.'])
+
+        self.assertTrue(package_filter.wants(_unit('penguin', 'x86_64', '1.0')))
+        self.assertFalse(package_filter.wants(_unit('penguin', 'x86_64', '2.0')))
+        self.assertFalse(package_filter.wants(_unit('penguin', 'x86_64', release='1.el5')))
+
+    def test_every_kind_of_include_rule(self):
+        package_filter = PackageFilter(include_arches=['x86_64'], include_names=['walrus'])
+
+        self.assertTrue(package_filter.wants(_unit('walrus', 'x86_64')))
+        self.assertFalse(package_filter.wants(_unit('walrus', 'i686')))
+        self.assertFalse(package_filter.wants(_unit('penguin', 'x86_64')))
+
+    def test_filter(self):
+        package_filter = PackageFilter(exclude_arches=['i686'])
+        rpms = [models.RPM('walrus', '0', '1.0', '1', arch, 'sha256', 'abc', {})
+                for arch in ('i686', 'x86_64')]
+
+        result = list(package_filter.filter(rpms))
+
+        self.assertEqual(result, [rpms[1]])
+
+    def test_drpms(self):
+        package_filter = PackageFilter(include_names=['walrus'], exclude_arches=['i686'],
+                                       exclude_regexes=[r'-2\.0-'])
+        drpms = []
+        for name, version, arch in (('walrus', '1.0', 'x86_64'), ('walrus', '1.0', 'i686'),
+                                    ('penguin', '1.0', 'x86_64'), ('walrus', '2.0', 'x86_64')):
+            drpms.append(models.DRPM('0', version, '1', 'drpms/%s-%s.drpm' % (name, arch),
+                                     'sha256', 'abc', {'new_package': name, 'arch': arch}))
+
+        self.assertTrue(package_filter.wants_drpm(drpms[0]))
+        self.assertEqual(list(package_filter.filter_drpms(drpms)), [drpms[0]])
+
+
+class TestFromConfig(unittest.TestCase):
+    def test_no_rules(self):
+        config = PluginCallConfiguration({}, {})
+
+        self.assertTrue(PackageFilter.from_config(config) is None)
+
+    def test_rules(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_INCLUDE_ARCHES: ['x86_64'],
+                                              constants.CONFIG_EXCLUDE_REGEXES: ['debug']})
+
+        result = PackageFilter.from_config(config)
+
+        self.assertEqual(result.include_arches, frozenset(['x86_64']))
+        self.assertEqual([regex.pattern for regex in result.exclude_regexes], ['debug'])
+
+
+class TestValidate(unittest.TestCase):
+    def test_valid(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_EXCLUDE_NAMES: ['*-debuginfo'],
+                                              constants.CONFIG_INCLUDE_REGEXES: [r'\.el6']})
+
+        self.assertEqual(package_filter.validate(config), [])
+
+    def test_not_a_list(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_INCLUDE_ARCHES: 'x86_64',
+                                              constants.CONFIG_EXCLUDE_ARCHES: [None]})
+
+        result = package_filter.validate(config)
+
+        self.assertEqual(len(result), 2)
+        self.assertTrue(constants.CONFIG_INCLUDE_ARCHES in result[0])
+        self.assertTrue(constants.CONFIG_EXCLUDE_ARCHES in result[1])
+
+    def test_invalid_regex(self):
+        config = PluginCallConfiguration({}, {constants.CONFIG_EXCLUDE_REGEXES: ['ok', '[unclosed']})
+
+        result = package_filter.validate(config)
+
+        self.assertEqual(len(result), 1)
+        self.assertTrue('[unclosed' in result[0])
@@ -24,8 +24,9 @@ from pulp.server.db.model.criteria import UnitAssociationCriteria
 from pulp.server.managers import factory as manager_factory
 from pulp.server.managers.repo.unit_association import OWNER_TYPE_IMPORTER
 
-from pulp_rpm.common import models
+from pulp_rpm.common import constants, models
 from pulp_rpm.plugins.importers.yum import purge
+from pulp_rpm.plugins.importers.yum.package_filter import PackageFilter
 from pulp_rpm.plugins.importers.yum.repomd import metadata, primary, presto, updateinfo, group
 import model_factory
 
@@ -67,10 +68,24 @@ class TestRemoveMissing(TestPurgeBase):
         mock_get_remote_units.assert_called_once_with(self.metadata_files,
                                                       primary.METADATA_FILE_NAME,
                                                       primary.PACKAGE_TAG,
-                                                      primary.process_package_element)
+                                                      primary.process_package_record, None)
         mock_remove.assert_called_once_with(self.metadata_files, self.conduit,
                                             models.RPM, mock_get_remote_units.return_value)
 
+    @mock.patch.object(purge, 'get_remote_units', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_units', autospec=True)
+    def test_remove_missing_rpms_filtered(self, mock_remove, mock_get_remote_units):
+        x86_64 = models.RPM.NAMEDTUPLE('walrus', '0', '1.0', '1', 'x86_64', 'sha256', 'a')
+        i686 = models.RPM.NAMEDTUPLE('walrus', '0', '1.0', '1', 'i686', 'sha256', 'b')
+        mock_get_remote_units.return_value = set([x86_64, i686])
+        package_filter = PackageFilter(include_arches=['x86_64'])
+
+        purge.remove_missing_rpms(self.metadata_files, self.conduit, None, package_filter)
+
+        # the filtered package counts as missing, so a local copy is removed
+        mock_remove.assert_called_once_with(self.metadata_files, self.conduit,
+                                            models.RPM, set([x86_64]))
+
     @mock.patch.object(purge, 'get_remote_units', autospec=True)
     @mock.patch.object(purge, 'remove_missing_units', autospec=True)
     def test_remove_missing_drpms(self, mock_remove, mock_get_remote_units):
@@ -154,7 +169,7 @@ class TestGetRemoteUnits(TestPurgeBase):
     @mock.patch('__builtin__.open', autospec=True)
     def test_rpm(self, mock_open, mock_package_list_generator):
         rpms = model_factory.rpm_models(2)
-        mock_package_list_generator.return_value = rpms
+        mock_package_list_generator.return_value = (model for model in rpms)
         fake_file = StringIO()
         mock_open.return_value = fake_file
         process_func = lambda x: x
@@ -163,7 +178,8 @@ class TestGetRemoteUnits(TestPurgeBase):
 
         mock_open.assert_called_once_with('/a/b/c', 'r')
         self.assertTrue(fake_file.closed)
-        mock_package_list_generator.assert_called_once_with(fake_file, 'bar', process_func)
+        mock_package_list_generator.assert_called_once_with(fake_file, 'bar', process_func,
+                                                            processes=None)
         self.assertEqual(len(rpms), len(ret))
         for model in rpms:
             self.assertTrue(model.as_named_tuple in ret)
@@ -268,12 +284,64 @@ class TestPurgeUnwantedUnits(TestPurgeBase):
 
         purge.purge_unwanted_units(self.metadata_files, self.conduit, self.config)
 
-        mock_remove_rpms.assert_called_once_with(self.metadata_files, self.conduit)
+        mock_remove_rpms.assert_called_once_with(self.metadata_files, self.conduit, None, None)
         mock_remove_drpms.assert_called_once_with(self.metadata_files, self.conduit)
         mock_remove_errata.assert_called_once_with(self.metadata_files, self.conduit)
         mock_remove_groups.assert_called_once_with(self.metadata_files, self.conduit)
         mock_remove_categories.assert_called_once_with(self.metadata_files, self.conduit)
 
+    @mock.patch.object(purge, 'remove_missing_rpms', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_drpms', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_errata', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_groups', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_categories', autospec=True)
+    def test_remove_missing_parse_processes(self, mock_remove_categories, mock_remove_groups,
+                                            mock_remove_errata, mock_remove_drpms,
+                                            mock_remove_rpms):
+        self.config.plugin_config[importer_constants.KEY_UNITS_REMOVE_MISSING] = True
+
+        purge.purge_unwanted_units(self.metadata_files, self.conduit, self.config,
+                                   parse_processes=4)
+
+        mock_remove_rpms.assert_called_once_with(self.metadata_files, self.conduit, 4, None)
+
+    @mock.patch.object(purge, 'remove_missing_rpms', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_drpms', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_errata', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_groups', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_categories', autospec=True)
+    def test_remove_missing_package_filter(self, mock_remove_categories, mock_remove_groups,
+                                           mock_remove_errata, mock_remove_drpms,
+                                           mock_remove_rpms):
+        self.config.plugin_config[importer_constants.KEY_UNITS_REMOVE_MISSING] = True
+        self.config.plugin_config[constants.CONFIG_EXCLUDE_NAMES] = ['*-debuginfo']
+
+        purge.purge_unwanted_units(self.metadata_files, self.conduit, self.config)
+
+        package_filter = mock_remove_rpms.call_args[0][3]
+        self.assertTrue(isinstance(package_filter, PackageFilter))
+        self.assertTrue(package_filter.exclude_names.match('kernel-debuginfo'))
+
+    @mock.patch.object(purge, 'remove_missing_rpms', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_units', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_drpms', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_errata', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_groups', autospec=True)
+    @mock.patch.object(purge, 'remove_missing_categories', autospec=True)
+    def test_remove_missing_with_index(self, mock_remove_categories, mock_remove_groups,
+                                       mock_remove_errata, mock_remove_drpms,
+                                       mock_remove_units, mock_remove_rpms):
+        self.config.plugin_config[importer_constants.KEY_UNITS_REMOVE_MISSING] = True
+        rpm_index = mock.MagicMock()
+
+        purge.purge_unwanted_units(self.metadata_files, self.conduit, self.config, rpm_index)
+
+        # primary.xml should not be parsed again
+        self.assertEqual(mock_remove_rpms.call_count, 0)
+        mock_remove_units.assert_called_once_with(self.metadata_files, self.conduit, models.RPM,
+                                                  rpm_index.remote_units)
+        mock_remove_drpms.assert_called_once_with(self.metadata_files, self.conduit)
+
     @mock.patch.object(purge, 'remove_old_versions', autospec=True)
     def test_retain_old_none(self, mock_remove_old_versions):
         self.config.plugin_config[importer_constants.KEY_UNITS_REMOVE_MISSING] = False
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from nectar.config import DownloaderConfig
+from nectar.listener import AggregatingEventListener
+from nectar.request import DownloadRequest
+
+from pulp_rpm.plugins.importers.yum.hashing import HashingFile
+from pulp_rpm.plugins.importers.yum.repomd import local
+
+
+DATA = 'some bytes ' * 1000
+
+
+class LocalTest(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.working_dir, 'feed.rpm')
+        with open(self.source, 'w') as source_file:
+            source_file.write(DATA)
+        self.destination = os.path.join(self.working_dir, 'a.rpm')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+
+class TestLinkOrCopy(LocalTest):
+    def test_hard_link(self):
+        local.link_or_copy(self.source, self.destination)
+
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+    def test_replaces_existing(self):
+        with open(self.destination, 'w') as destination_file:
+            destination_file.write('old')
+
+        local.link_or_copy(self.source, self.destination)
+
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+    @mock.patch('os.link', side_effect=OSError(errno.EXDEV, 'cross-device link'))
+    @mock.patch('fcntl.ioctl', side_effect=IOError(errno.EOPNOTSUPP, 'not supported'))
+    def test_copy_fallback(self, mock_ioctl, mock_link):
+        local.link_or_copy(self.source, self.destination)
+
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+        with open(self.destination) as destination_file:
+            self.assertEqual(destination_file.read(), DATA)
+        self.assertEqual(mock_ioctl.call_count, 1)
+
+    @mock.patch('os.link', side_effect=OSError(errno.ENOENT, 'no such file'))
+    def test_other_error(self, mock_link):
+        self.assertRaises(OSError, local.link_or_copy, self.source, self.destination)
+
+
+class TestLocalLinkDownloader(LocalTest):
+    def setUp(self):
+        super(TestLocalLinkDownloader, self).setUp()
+        self.listener = AggregatingEventListener()
+        self.downloader = local.LocalLinkDownloader(DownloaderConfig(), self.listener)
+
+    def test_links(self):
+        request = DownloadRequest('file://' + self.source, self.destination, 'data')
+
+        self.downloader.download([request])
+
+        self.assertEqual(len(self.listener.succeeded_reports), 1)
+        report = self.listener.succeeded_reports[0]
+        self.assertEqual(report.data, 'data')
+        self.assertEqual(report.bytes_downloaded, len(DATA))
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+    def test_file_like_destination(self):
+        destination = HashingFile(self.destination, 'sha256')
+        request = DownloadRequest('file://' + self.source, destination)
+
+        self.downloader.download([request])
+        destination.close()
+
+        self.assertEqual(len(self.listener.succeeded_reports), 1)
+        self.assertEqual(destination.size, len(DATA))
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+
+    def test_missing_file(self):
+        request = DownloadRequest('file://' + self.source + '.missing', self.destination)
+
+        self.downloader.download([request])
+
+        self.assertEqual(len(self.listener.failed_reports), 1)
+        self.assertEqual(len(self.listener.succeeded_reports), 0)
+
+    def test_canceled(self):
+        request = DownloadRequest('file://' + self.source, self.destination)
+        self.downloader.cancel()
+
+        self.downloader.download([request])
+
+        self.assertFalse(os.path.exists(self.destination))
@@ -11,13 +11,19 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
-
+import gzip
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
 from nectar.config import DownloaderConfig
 
-from pulp_rpm.plugins.importers.yum.repomd import metadata
+from pulp_rpm.plugins.importers.yum import hashing
+from pulp_rpm.plugins.importers.yum.repomd import filelists, metadata, packages
 
 
 def file_info_factory(name, path=None):
@@ -29,6 +35,38 @@ def file_info_factory(name, path=None):
     return ret
 
 
+FILELISTS_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<filelists xmlns="http://linux.duke.edu/metadata/filelists" packages="2">
+<package pkgid="a1" name="walrus" arch="noarch">
+  <version epoch="0" ver="5.21" rel="1"/>
+  <file>/tmp/walrus.txt</file>
+  <file type="dir">/tmp/walrus</file>
+</package>
+<package pkgid="b2" name="penguin" arch="noarch">
+  <version epoch="0" ver="0.9.1" rel="1"/>
+  <file>/tmp/penguin.txt</file>
+</package>
+</filelists>
+"""
+
+OTHER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<otherdata xmlns="http://linux.duke.edu/metadata/other" packages="2">
+<package pkgid="a1" name="walrus" arch="noarch">
+  <version epoch="0" ver="5.21" rel="1"/>
+  <changelog author="Pulp &lt;pulp@example.com&gt;" date="1365000000">- first</changelog>
+</package>
+<package pkgid="b2" name="penguin" arch="noarch">
+  <version epoch="0" ver="0.9.1" rel="1"/>
+</package>
+</otherdata>
+"""
+
+WALRUS_KEY = {'name': 'walrus', 'epoch': '0', 'version': '5.21', 'release': '1', 'arch': 'noarch',
+              'checksum': 'abc', 'checksumtype': 'sha256'}
+PENGUIN_KEY = {'name': 'penguin', 'epoch': '0', 'version': '0.9.1', 'release': '1', 'arch': 'noarch',
+               'checksum': 'def', 'checksumtype': 'sha256'}
+
+
 class TestDownloadMetadataFiles(unittest.TestCase):
     def setUp(self):
         self.metadata_files = metadata.MetadataFiles('http://pulpproject.org',
@@ -70,3 +108,553 @@ class TestDownloadMetadataFiles(unittest.TestCase):
         self.assertEqual(len(requests), 2)
         self.assertTrue(requests[0].destination.endswith('primary'))
         self.assertTrue(requests[1].destination.endswith('pkgtags.sqlite.gz'))
+
+    def test_reuse_existing(self):
+        working_dir = tempfile.mkdtemp()
+        try:
+            self.metadata_files.dst_dir = working_dir
+            self.metadata_files.metadata = {
+                'primary': file_info_factory('primary'),
+                'other': file_info_factory('other'),
+            }
+            self.metadata_files.metadata['primary']['size'] = 4
+            self.metadata_files.metadata['other']['size'] = 4
+            with open(os.path.join(working_dir, 'primary'), 'w') as primary_file:
+                primary_file.write('done')
+            # partially downloaded
+            with open(os.path.join(working_dir, 'other'), 'w') as other_file:
+                other_file.write('do')
+            self.metadata_files.downloader.download = mock.MagicMock(
+                spec_set=self.metadata_files.downloader.download)
+
+            self.metadata_files.download_metadata_files(reuse_existing=True)
+
+            requests = self.metadata_files.downloader.download.call_args[0][0]
+            self.assertEqual(len(requests), 1)
+            self.assertTrue(requests[0].destination.endswith('other'))
+            self.assertEqual(self.metadata_files.destinations['primary'],
+                             os.path.join(working_dir, 'primary'))
+        finally:
+            shutil.rmtree(working_dir)
+
+
+class TestVerifyMetadataFiles(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.metadata_files = metadata.MetadataFiles('http://pulpproject.org',
+                                                     self.working_dir,
+                                                     DownloaderConfig())
+        self.path = os.path.join(self.working_dir, 'filelists.xml.gz')
+        gzip_file = gzip.open(self.path, 'w')
+        gzip_file.write(FILELISTS_XML)
+        gzip_file.close()
+        with open(self.path) as gz_file:
+            compressed = gz_file.read()
+        file_info = file_info_factory('filelists', 'repodata/filelists.xml.gz')
+        file_info.update({
+            'local_path': self.path,
+            'checksum': {'algorithm': 'sha256', 'hex_digest': hashlib.sha256(compressed).hexdigest()},
+            'size': len(compressed),
+            'open_checksum': {'algorithm': 'sha256',
+                              'hex_digest': hashlib.sha256(FILELISTS_XML).hexdigest()},
+            'open_size': len(FILELISTS_XML),
+        })
+        self.metadata_files.metadata['filelists'] = file_info
+        self.metadata_files.destinations['filelists'] = self.path
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_valid(self):
+        self.metadata_files.verify_metadata_files()
+
+        file_handle = self.metadata_files.get_metadata_file_handle('filelists')
+        try:
+            self.assertEqual(file_handle.read(), FILELISTS_XML)
+            self.assertEqual(file_handle.read(), '')
+        finally:
+            file_handle.close()
+        self.assertEqual(self.metadata_files.open_verified, set(['filelists']))
+
+    def test_size_mismatch(self):
+        self.metadata_files.metadata['filelists']['size'] += 1
+
+        self.assertRaises(RuntimeError, self.metadata_files.verify_metadata_files)
+
+    def test_checksum_mismatch(self):
+        self.metadata_files.metadata['filelists']['checksum']['hex_digest'] = 'abc'
+
+        self.assertRaises(RuntimeError, self.metadata_files.verify_metadata_files)
+
+    def test_hashed_download(self):
+        destination = hashing.HashingFile(self.path + '.new', 'sha256')
+        with open(self.path) as gz_file:
+            destination.write(gz_file.read())
+        destination.close()
+        os.rename(self.path + '.new', self.path)
+        self.metadata_files.destinations['filelists'] = destination
+
+        with mock.patch('pulp.plugins.util.verification.verify_checksum') as mock_verify:
+            self.metadata_files.verify_metadata_files()
+
+        # the checksum computed during the download was used
+        self.assertFalse(mock_verify.called)
+
+    def test_open_checksum_mismatch(self):
+        self.metadata_files.metadata['filelists']['open_checksum']['hex_digest'] = 'abc'
+        self.metadata_files.verify_metadata_files()
+
+        file_handle = self.metadata_files.get_metadata_file_handle('filelists')
+        try:
+            self.assertRaises(RuntimeError, list,
+                              packages.package_list_generator(file_handle, filelists.PACKAGE_TAG,
+                                                              filelists.process_package_element))
+        finally:
+            file_handle.close()
+        self.assertEqual(self.metadata_files.open_verified, set())
+
+    def test_open_not_verified_before_verify(self):
+        self.metadata_files.metadata['filelists']['open_checksum']['hex_digest'] = 'abc'
+
+        file_handle = self.metadata_files.get_metadata_file_handle('filelists')
+        try:
+            self.assertEqual(file_handle.read(), FILELISTS_XML)
+            self.assertEqual(file_handle.read(), '')
+        finally:
+            file_handle.close()
+
+
+class TestDecompressedCache(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.metadata_files = metadata.MetadataFiles('http://pulpproject.org',
+                                                     self.working_dir,
+                                                     DownloaderConfig())
+        self.metadata_files.cache_decompressed = True
+        self.path = os.path.join(self.working_dir, 'filelists.xml.gz')
+        gzip_file = gzip.open(self.path, 'w')
+        gzip_file.write(FILELISTS_XML)
+        gzip_file.close()
+        file_info = file_info_factory('filelists', 'repodata/filelists.xml.gz')
+        file_info.update({
+            'local_path': self.path,
+            'open_checksum': {'algorithm': 'sha256',
+                              'hex_digest': hashlib.sha256(FILELISTS_XML).hexdigest()},
+            'open_size': len(FILELISTS_XML),
+        })
+        self.metadata_files.metadata['filelists'] = file_info
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_decompresses_once(self):
+        with mock.patch.object(metadata, 'open_metadata_file',
+                               side_effect=metadata.open_metadata_file) as mock_open:
+            for i in range(3):
+                file_handle = self.metadata_files.get_metadata_file_handle('filelists')
+                try:
+                    self.assertEqual(file_handle.read(len(FILELISTS_XML) + 1), FILELISTS_XML)
+                finally:
+                    file_handle.close()
+
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(self.metadata_files.decompressed.keys(), ['filelists'])
+        self.assertTrue('filelists' in self.metadata_files.decompression_times)
+
+    def test_parse(self):
+        file_handle = self.metadata_files.get_metadata_file_handle('filelists')
+        try:
+            result = list(packages.package_list_generator(file_handle, filelists.PACKAGE_TAG))
+        finally:
+            file_handle.close()
+
+        self.assertEqual(len(result), 2)
+
+    def test_read_cached(self):
+        file_handle = self.metadata_files.get_metadata_file_handle('filelists')
+        try:
+            self.assertFalse(file_handle.closed)
+            self.assertEqual(file_handle.read(), FILELISTS_XML)
+        finally:
+            file_handle.close()
+        self.assertTrue(file_handle.closed)
+
+    def test_verifies_while_decompressing(self):
+        self.metadata_files.verify_open = True
+
+        self.metadata_files.get_metadata_file_handle('filelists').close()
+
+        self.assertEqual(self.metadata_files.open_verified, set(['filelists']))
+
+    def test_verification_fails(self):
+        self.metadata_files.verify_open = True
+        self.metadata_files.metadata['filelists']['open_size'] += 1
+
+        self.assertRaises(RuntimeError, self.metadata_files.get_metadata_file_handle, 'filelists')
+        self.assertEqual(self.metadata_files.decompressed, {})
+        self.assertFalse(os.path.exists(os.path.join(self.working_dir,
+                                                     'filelists.xml.decompressed')))
+
+    def test_uncompressed_not_cached(self):
+        path = os.path.join(self.working_dir, 'other.xml')
+        with open(path, 'w') as other_file:
+            other_file.write(OTHER_XML)
+        self.metadata_files.metadata['other'] = {'local_path': path}
+
+        self.metadata_files.get_metadata_file_handle('other').close()
+
+        self.assertEqual(self.metadata_files.decompressed, {})
+
+
+class TestOpenMappedFile(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.working_dir, 'primary.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_read_and_seek(self):
+        with open(self.path, 'w') as xml_file:
+            xml_file.write(FILELISTS_XML)
+
+        file_handle = metadata.open_mapped_file(self.path)
+        try:
+            self.assertEqual(file_handle.read(5), FILELISTS_XML[:5])
+            file_handle.seek(10)
+            self.assertEqual(file_handle.read(5), FILELISTS_XML[10:15])
+        finally:
+            file_handle.close()
+
+    def test_read_all(self):
+        with open(self.path, 'w') as xml_file:
+            xml_file.write(FILELISTS_XML)
+
+        file_handle = metadata.open_mapped_file(self.path)
+        try:
+            file_handle.seek(10)
+            self.assertEqual(file_handle.read(), FILELISTS_XML[10:])
+            self.assertEqual(file_handle.read(), '')
+        finally:
+            file_handle.close()
+
+    def test_readline(self):
+        with open(self.path, 'w') as xml_file:
+            xml_file.write(FILELISTS_XML)
+
+        file_handle = metadata.open_mapped_file(self.path)
+        try:
+            self.assertEqual(list(file_handle), FILELISTS_XML.splitlines(True))
+        finally:
+            file_handle.close()
+
+    def test_closed(self):
+        with open(self.path, 'w') as xml_file:
+            xml_file.write(FILELISTS_XML)
+
+        file_handle = metadata.open_mapped_file(self.path)
+        self.assertFalse(file_handle.closed)
+        file_handle.close()
+
+        self.assertTrue(file_handle.closed)
+        # closing again does nothing
+        file_handle.close()
+
+    def test_empty_file(self):
+        open(self.path, 'w').close()
+
+        file_handle = metadata.open_mapped_file(self.path)
+        try:
+            self.assertEqual(file_handle.read(5), '')
+        finally:
+            file_handle.close()
+
+
+class RepodataDBTest(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.metadata_files = metadata.MetadataFiles('http://pulpproject.org',
+                                                     self.working_dir,
+                                                     DownloaderConfig())
+        for name, xml in (('filelists', FILELISTS_XML), ('other', OTHER_XML)):
+            path = os.path.join(self.working_dir, '%s.xml' % name)
+            with open(path, 'w') as xml_file:
+                xml_file.write(xml)
+            self.metadata_files.metadata[name] = {'local_path': path}
+
+    def tearDown(self):
+        self.metadata_files.close_dbs()
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+
+class TestGenerateDBs(RepodataDBTest):
+    processes = None
+    # number of worker processes expected to be started
+    workers = 0
+
+    def test_all_packages(self):
+        with mock.patch.object(metadata.multiprocessing, 'Process',
+                               wraps=multiprocessing.Process) as mock_process:
+            self.metadata_files.generate_dbs(processes=self.processes)
+
+        self.assertEqual(mock_process.call_count, self.workers)
+        for filename in ('filelists', 'other'):
+            result = list(self.metadata_files.repodata_generator(filename))
+            self.assertEqual(len(result), 2)
+
+    def test_wanted_db_keys(self):
+        wanted = set([metadata.MetadataFiles.generate_db_key(WALRUS_KEY)])
+
+        self.metadata_files.generate_dbs(wanted_db_keys=wanted, processes=self.processes)
+
+        for filename in ('filelists', 'other'):
+            db_keys = [row[0] for row in self.metadata_files.repodata_generator(filename)]
+            self.assertEqual(db_keys, list(wanted))
+
+    @mock.patch.object(metadata, 'REPODATA_PROGRESS_INTERVAL', 1)
+    def test_progress(self):
+        callback = mock.MagicMock()
+
+        self.metadata_files.generate_dbs(callback, processes=self.processes)
+
+        for filename in ('filelists', 'other'):
+            callback.assert_any_call(filename, 1)
+            # the final count is always reported
+            callback.assert_any_call(filename, 2)
+
+    def test_worker_error(self):
+        self.metadata_files.metadata['other']['local_path'] = os.path.join(self.working_dir,
+                                                                           'missing.xml')
+
+        self.assertRaises(RuntimeError, self.metadata_files.generate_dbs,
+                          processes=self.processes)
+
+    def _gzip_filelists(self, file_info):
+        path = os.path.join(self.working_dir, 'filelists.xml.gz')
+        gzip_file = gzip.open(path, 'w')
+        gzip_file.write(FILELISTS_XML)
+        gzip_file.close()
+        file_info.update({
+            'local_path': path,
+            'open_checksum': {'algorithm': 'sha256',
+                              'hex_digest': hashlib.sha256(FILELISTS_XML).hexdigest()},
+            'open_size': len(FILELISTS_XML),
+        })
+        self.metadata_files.metadata['filelists'] = file_info
+        self.metadata_files.verify_open = True
+
+    def test_verifies_open_checksum(self):
+        file_info = file_info_factory('filelists', 'repodata/filelists.xml.gz')
+        self._gzip_filelists(file_info)
+
+        self.metadata_files.generate_dbs(processes=self.processes)
+
+        self.assertEqual(len(list(self.metadata_files.repodata_generator('filelists'))), 2)
+
+    def test_open_checksum_mismatch(self):
+        file_info = file_info_factory('filelists', 'repodata/filelists.xml.gz')
+        self._gzip_filelists(file_info)
+        file_info['open_checksum']['hex_digest'] = hashlib.sha256('corrupted').hexdigest()
+
+        self.assertRaises(RuntimeError, self.metadata_files.generate_dbs,
+                          processes=self.processes)
+
+    def test_open_size_mismatch_cached(self):
+        file_info = file_info_factory('filelists', 'repodata/filelists.xml.gz')
+        self._gzip_filelists(file_info)
+        file_info['open_size'] += 1
+        self.metadata_files.cache_decompressed = True
+
+        self.assertRaises(RuntimeError, self.metadata_files.generate_dbs,
+                          processes=self.processes)
+
+    def test_callback_exception_stops_workers(self):
+        callback = mock.MagicMock(side_effect=ValueError)
+
+        self.assertRaises(ValueError, self.metadata_files.generate_dbs, callback,
+                          processes=self.processes)
+
+
+class TestGenerateDBsInWorkers(TestGenerateDBs):
+    processes = 2
+    workers = 2
+
+
+class TestRepodataDBs(RepodataDBTest):
+    def setUp(self):
+        super(TestRepodataDBs, self).setUp()
+        self.metadata_files.generate_dbs()
+
+    def _model(self, unit_key):
+        model = mock.MagicMock()
+        model.unit_key = unit_key
+        model.metadata = {}
+        model.raw_xml = '<package/>'
+        return model
+
+    def test_add_repodata(self):
+        model = self._model(WALRUS_KEY)
+
+        self.metadata_files.add_repodata(model)
+
+        self.assertEqual(model.metadata['files'], {'file': ['/tmp/walrus.txt'], 'dir': ['/tmp/walrus']})
+        self.assertEqual(model.metadata['changelog'],
+                         [[1365000000, 'Pulp <pulp@example.com>', '- first']])
+        repodata = model.metadata['repodata']
+        self.assertEqual(repodata['primary'], '<package/>')
+        self.assertTrue(repodata['filelists'].startswith('<package '))
+        self.assertTrue('/tmp/walrus.txt' in repodata['filelists'])
+        self.assertTrue('- first' in repodata['other'])
+
+    def test_add_repodata_batch(self):
+        models = [self._model(WALRUS_KEY), self._model(PENGUIN_KEY)]
+
+        self.metadata_files.add_repodata_batch(models)
+
+        self.assertEqual(models[0].metadata['files']['file'], ['/tmp/walrus.txt'])
+        self.assertEqual(models[1].metadata['files']['file'], ['/tmp/penguin.txt'])
+        self.assertEqual(models[1].metadata['changelog'], [])
+
+    def test_add_repodata_missing(self):
+        unit_key = WALRUS_KEY.copy()
+        unit_key['name'] = 'seal'
+
+        self.assertRaises(KeyError, self.metadata_files.add_repodata, self._model(unit_key))
+
+    def test_add_repodata_batch_missing(self):
+        unit_key = WALRUS_KEY.copy()
+        unit_key['name'] = 'seal'
+        models = [self._model(WALRUS_KEY), self._model(unit_key), self._model(PENGUIN_KEY)]
+
+        missing = self.metadata_files.add_repodata_batch(models)
+
+        # the packages that were found still get their repodata
+        self.assertEqual(missing, [models[1]])
+        self.assertEqual(models[0].metadata['files']['file'], ['/tmp/walrus.txt'])
+        self.assertEqual(models[2].metadata['repodata']['primary'], '<package/>')
+        self.assertFalse('repodata' in models[1].metadata)
+
+    def test_connections_are_shared(self):
+        self.metadata_files.add_repodata(self._model(WALRUS_KEY))
+        connections = self.metadata_files.db_connections.copy()
+
+        self.metadata_files.add_repodata(self._model(PENGUIN_KEY))
+
+        self.assertEqual(len(connections), 2)
+        self.assertEqual(connections, self.metadata_files.db_connections)
+
+    def test_close_dbs(self):
+        self.metadata_files.add_repodata(self._model(WALRUS_KEY))
+
+        self.metadata_files.close_dbs()
+
+        self.assertEqual(self.metadata_files.db_connections, {})
+        # connections get opened again if needed
+        self.metadata_files.add_repodata(self._model(PENGUIN_KEY))
+
+    @mock.patch.object(metadata, 'REPODATA_LOOKUP_PAGE_SIZE', 1)
+    def test_get_repodata_paginates(self):
+        db_keys = [metadata.MetadataFiles.generate_db_key(key) for key in (WALRUS_KEY, PENGUIN_KEY)]
+
+        result = self.metadata_files.get_repodata('filelists', db_keys)
+
+        self.assertEqual(set(result), set(db_keys))
+
+    def test_repodata_generator_sorted(self):
+        result = list(self.metadata_files.repodata_generator('filelists'))
+
+        db_keys = [db_key for db_key, raw_xml, items in result]
+        self.assertEqual(len(db_keys), 2)
+        self.assertEqual(db_keys, sorted(db_keys))
+
+
+class TestIndexRepodata(RepodataDBTest):
+    def test_matches_dbs(self):
+        db_keys = [metadata.MetadataFiles.generate_db_key(key) for key in (WALRUS_KEY, PENGUIN_KEY)]
+        self.metadata_files.generate_dbs()
+        expected = dict((filename, self.metadata_files.get_repodata(filename, db_keys))
+                        for filename in ('filelists', 'other'))
+        self.metadata_files.close_dbs()
+        self.metadata_files.dbs = {}
+
+        self.metadata_files.index_repodata()
+
+        for filename in ('filelists', 'other'):
+            result = self.metadata_files.get_repodata(filename, db_keys)
+            self.assertEqual(set(result), set(expected[filename]))
+            for db_key, (raw_xml, items) in result.iteritems():
+                self.assertEqual(items, expected[filename][db_key][1])
+                self.assertEqual(raw_xml.strip(), expected[filename][db_key][0].strip())
+
+    def test_add_repodata(self):
+        model = mock.MagicMock()
+        model.unit_key = WALRUS_KEY
+        model.metadata = {}
+        self.metadata_files.index_repodata()
+
+        self.metadata_files.add_repodata(model)
+
+        self.assertEqual(model.metadata['files'], {'file': ['/tmp/walrus.txt'], 'dir': ['/tmp/walrus']})
+        self.assertEqual(model.metadata['changelog'][0][0], 1365000000)
+
+    def test_compressed(self):
+        path = os.path.join(self.working_dir, 'filelists.xml.gz')
+        gzip_file = gzip.open(path, 'w')
+        gzip_file.write(FILELISTS_XML)
+        gzip_file.close()
+        self.metadata_files.metadata['filelists']['local_path'] = path
+
+        self.metadata_files.index_repodata()
+
+        lazy_repodata = self.metadata_files.lazy_repodata['filelists']
+        self.assertEqual(open(lazy_repodata.path).read(), FILELISTS_XML)
+        self.assertEqual(len(lazy_repodata.locations), 2)
+
+    @mock.patch.object(metadata, 'REPODATA_PROGRESS_INTERVAL', 1)
+    def test_progress(self):
+        callback = mock.MagicMock()
+
+        self.metadata_files.index_repodata(callback)
+
+        callback.assert_any_call('filelists', 1)
+        callback.assert_any_call('other', 2)
+
+    def test_repodata_generator_sorted(self):
+        self.metadata_files.index_repodata()
+
+        result = list(self.metadata_files.repodata_generator('other'))
+
+        db_keys = [db_key for db_key, raw_xml, items in result]
+        self.assertEqual(len(db_keys), 2)
+        self.assertEqual(db_keys, sorted(db_keys))
+
+
+class TestSnippetUnitKey(unittest.TestCase):
+    def test_unit_key(self):
+        snippet = '<package pkgid="a1" name="walrus" arch="noarch">' \
+                  '<version epoch="0" ver="5.21" rel="1"/></package>'
+
+        unit_key = metadata._snippet_unit_key(snippet)
+
+        self.assertEqual(unit_key, {'name': 'walrus', 'arch': 'noarch', 'epoch': '0',
+                                    'version': '5.21', 'release': '1'})
+
+    def test_single_quotes(self):
+        snippet = "<package arch='noarch' name='walrus'>" \
+                  "<version rel='1' ver='5.21' epoch='0'/></package>"
+
+        unit_key = metadata._snippet_unit_key(snippet)
+
+        self.assertEqual(unit_key['name'], 'walrus')
+        self.assertEqual(unit_key['release'], '1')
+
+    def test_escaped_value(self):
+        snippet = '<package name="a&amp;b" arch="noarch">' \
+                  '<version epoch="0" ver="1" rel="1"/></package>'
+
+        self.assertTrue(metadata._snippet_unit_key(snippet) is None)
+
+    def test_missing_version(self):
+        snippet = '<package name="walrus" arch="noarch"></package>'
+
+        self.assertTrue(metadata._snippet_unit_key(snippet) is None)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+from cStringIO import StringIO
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from nectar.listener import AggregatingEventListener
+
+import model_factory
+from pulp_rpm.plugins.importers.yum.hashing import HashingFile
+from pulp_rpm.plugins.importers.yum.repomd import packages, primary
+from test_repomd_primary import F18_SOURCE_XML, F18_XML
+
+
+def _package_xml(document):
+    start = document.index('<package ')
+    end = document.rindex('</package>') + len('</package>')
+    return document[start:end]
+
+
+# two complete packages in one document
+TWO_PACKAGES_XML = F18_XML.replace('packages="1"', 'packages="2"').replace(
+    '</metadata>', _package_xml(F18_SOURCE_XML) + '\n</metadata>')
+
+
+class TestPackageListGenerator(unittest.TestCase):
+    # lxml is used if it is installed
+    lxml_etree = packages.lxml_etree
+
+    def setUp(self):
+        patcher = mock.patch.object(packages, 'lxml_etree', self.lxml_etree)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_qualified_tag(self):
+        result = list(packages.package_list_generator(StringIO(TWO_PACKAGES_XML),
+                                                      primary.PACKAGE_TAG))
+
+        self.assertEqual(len(result), 2)
+        for element in result:
+            self.assertEqual(element.tag, primary.PACKAGE_TAG)
+
+    def test_unqualified_tag(self):
+        result = list(packages.package_list_generator(StringIO(TWO_PACKAGES_XML), 'package'))
+
+        self.assertEqual([element.tag for element in result], [primary.PACKAGE_TAG] * 2)
+
+    def test_no_namespace(self):
+        xml = '<updates><update id="1"/><other/><update id="2"/></updates>'
+
+        result = list(packages.package_list_generator(StringIO(xml), 'update'))
+
+        self.assertEqual([element.get('id') for element in result], ['1', '2'])
+
+    def test_ignores_similar_tags(self):
+        self.assertTrue('<packager>' in TWO_PACKAGES_XML)
+
+        result = list(packages.package_list_generator(StringIO(TWO_PACKAGES_XML),
+                                                      primary.PACKAGE_TAG))
+
+        self.assertEqual(len(result), 2)
+
+    def test_process_func(self):
+        result = packages.package_list_generator(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG,
+                                                 primary.process_package_element)
+
+        self.assertEqual([model.arch for model in result], ['x86_64', 'src'])
+
+    def test_elements_kept_intact(self):
+        """
+        make sure elements that were held on to are not emptied as parsing continues
+        """
+        result = list(packages.package_list_generator(StringIO(TWO_PACKAGES_XML),
+                                                      primary.PACKAGE_TAG))
+
+        for element in result:
+            self.assertTrue(element.find(primary.NAME_TAG) is not None)
+            self.assertTrue(element.find(primary.FORMAT_TAG) is not None)
+
+    def test_invalid_xml(self):
+        result = list(packages.package_list_generator(StringIO('not xml'), 'package'))
+
+        self.assertEqual(result, [])
+
+    def test_truncated_xml(self):
+        xml = TWO_PACKAGES_XML[:TWO_PACKAGES_XML.rindex('<package ') + 20]
+        generator = packages.package_list_generator(StringIO(xml), primary.PACKAGE_TAG)
+
+        self.assertRaises(SyntaxError, list, generator)
+
+    def test_external_entity_not_expanded(self):
+        working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, working_dir, ignore_errors=True)
+        secret_path = os.path.join(working_dir, 'secret.txt')
+        with open(secret_path, 'w') as secret_file:
+            secret_file.write('walrus-secret')
+        xml = TWO_PACKAGES_XML.replace(
+            '<metadata ', '<!DOCTYPE metadata [<!ENTITY x SYSTEM "file://%s">]>\n<metadata ' %
+            secret_path, 1).replace('<name>', '<name>&x;', 1)
+        seen = []
+
+        def process(element):
+            seen.append(element.findtext(primary.NAME_TAG))
+            return element
+
+        generator = packages.package_list_generator(StringIO(xml), primary.PACKAGE_TAG, process)
+
+        self.assertRaises(SyntaxError, list, generator)
+        self.assertFalse(any('walrus-secret' in (name or '') for name in seen))
+
+    def test_dtd_without_entities(self):
+        xml = TWO_PACKAGES_XML.replace(
+            '<metadata ', '<!DOCTYPE metadata [<!ELEMENT metadata ANY>]>\n<metadata ', 1)
+
+        result = list(packages.package_list_generator(StringIO(xml), primary.PACKAGE_TAG))
+
+        self.assertEqual(len(result), 2)
+
+
+class TestPackageListGeneratorElementTree(TestPackageListGenerator):
+    lxml_etree = None
+
+
+class TestParallelPackageList(unittest.TestCase):
+    def test_in_order(self):
+        result = packages.package_list_generator(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG,
+                                                 primary.process_package_element, processes=2)
+
+        self.assertEqual([model.arch for model in result], ['x86_64', 'src'])
+
+    @mock.patch.object(packages, 'PARALLEL_CHUNK_SIZE', 1)
+    def test_one_package_per_chunk(self):
+        self.assertEqual(len(list(packages._chunk_snippets(
+            packages.PackageSnippets(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG)))), 2)
+
+        result = packages.package_list_generator(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG,
+                                                 primary.process_package_element, processes=2)
+
+        self.assertEqual([model.arch for model in result], ['x86_64', 'src'])
+
+    def test_records(self):
+        serial = list(packages.package_list_generator(
+            StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG, primary.process_package_record))
+
+        result = list(packages.package_list_generator(
+            StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG, primary.process_package_record,
+            processes=2))
+
+        self.assertEqual([record.as_named_tuple for record in result],
+                         [record.as_named_tuple for record in serial])
+        self.assertEqual([record.size for record in result], [record.size for record in serial])
+
+    @mock.patch.object(packages, '_parallel_package_list', autospec=True)
+    def test_without_process_func(self, mock_parallel):
+        result = list(packages.package_list_generator(StringIO(TWO_PACKAGES_XML),
+                                                      primary.PACKAGE_TAG, processes=2))
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(mock_parallel.call_count, 0)
+
+
+class TestPackageSnippets(unittest.TestCase):
+    def test_offsets(self):
+        snippets = packages.PackageSnippets(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG)
+
+        result = list(snippets)
+
+        self.assertEqual(len(result), 2)
+        for offset, snippet in result:
+            self.assertTrue(snippet.startswith('<package '))
+            self.assertTrue(snippet.endswith('</package>'))
+            self.assertEqual(TWO_PACKAGES_XML[offset:offset + len(snippet)], snippet)
+
+    @mock.patch.object(packages, 'SNIPPET_READ_SIZE', 7)
+    def test_small_reads(self):
+        """
+        make sure snippets and tags that span multiple reads are found
+        """
+        snippets = packages.PackageSnippets(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG)
+
+        result = list(snippets)
+
+        self.assertEqual(len(result), 2)
+        for offset, snippet in result:
+            self.assertEqual(TWO_PACKAGES_XML[offset:offset + len(snippet)], snippet)
+
+    def test_ignores_similar_tags(self):
+        # both of these packages have a "packager" element
+        self.assertTrue('<packager>' in TWO_PACKAGES_XML)
+
+        result = list(packages.PackageSnippets(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG))
+
+        for offset, snippet in result:
+            self.assertEqual(snippet.count('<package '), 1)
+
+    def test_namespace_declarations(self):
+        snippets = packages.PackageSnippets(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG)
+
+        list(snippets)
+
+        self.assertTrue('xmlns="%s"' % primary.COMMON_SPEC_URL in snippets.namespace_declarations)
+        self.assertTrue('xmlns:rpm="%s"' % primary.RPM_SPEC_URL in snippets.namespace_declarations)
+
+    def test_parse_matches_package_list_generator(self):
+        snippets = packages.PackageSnippets(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG)
+
+        models = [primary.process_package_element(snippets.parse(snippet))
+                  for offset, snippet in snippets]
+
+        expected = packages.package_list_generator(StringIO(TWO_PACKAGES_XML), primary.PACKAGE_TAG,
+                                                   primary.process_package_element)
+        self.assertEqual([m.as_named_tuple for m in models],
+                         [m.as_named_tuple for m in expected])
+
+    def test_read(self):
+        xml_handle = StringIO(TWO_PACKAGES_XML)
+        snippets = packages.PackageSnippets(xml_handle, primary.PACKAGE_TAG)
+        locations = [(offset, len(snippet)) for offset, snippet in snippets]
+
+        snippet = snippets.read(*locations[1])
+
+        self.assertEqual(snippet, _package_xml(F18_SOURCE_XML))
+
+    def test_no_packages(self):
+        result = list(packages.PackageSnippets(StringIO('<metadata packages="0"/>'), 'package'))
+
+        self.assertEqual(result, [])
+
+
+class TestSkipCompleteRequests(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.listener = AggregatingEventListener()
+        self.models = model_factory.rpm_models(3)
+        for i, model in enumerate(self.models):
+            model.metadata['relativepath'] = 'a%d.rpm' % i
+            model.metadata['size'] = 10
+        # complete, partial, and missing
+        with open(os.path.join(self.working_dir, 'a0.rpm'), 'w') as rpm_file:
+            rpm_file.write('x' * 10)
+        with open(os.path.join(self.working_dir, 'a1.rpm'), 'w') as rpm_file:
+            rpm_file.write('x' * 4)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_skips_complete(self):
+        requests = packages.package_requests('http://fake/', self.models, self.working_dir)
+
+        remaining = list(packages.skip_complete_requests(requests, self.listener))
+
+        self.assertEqual([request.data for request in remaining], self.models[1:])
+        self.assertEqual(len(self.listener.succeeded_reports), 1)
+        report = self.listener.succeeded_reports[0]
+        self.assertTrue(report.data is self.models[0])
+        self.assertEqual(report.destination, os.path.join(self.working_dir, 'a0.rpm'))
+
+    def test_hashing_destinations(self):
+        requests = packages.package_requests('http://fake/', self.models, self.working_dir,
+                                             hash_downloads=True)
+
+        remaining = list(packages.skip_complete_requests(requests, self.listener))
+
+        self.assertEqual(len(remaining), 2)
+        self.assertTrue(isinstance(remaining[0].destination, HashingFile))
+        # the skipped file is reported by path, so it is not truncated when closed
+        report = self.listener.succeeded_reports[0]
+        self.assertEqual(report.destination, os.path.join(self.working_dir, 'a0.rpm'))
@@ -13,6 +13,7 @@
 
 from cStringIO import StringIO
 import unittest
+from xml.etree import cElementTree as ET
 
 from pulp_rpm.common import models
 from pulp_rpm.plugins.importers.yum.repomd import primary, packages
@@ -56,6 +57,88 @@ class TestProcessRPMElement(unittest.TestCase):
         self.assertEqual(model.checksumtype, 'sha256')
 
 
+class TestProcessPackageSnippet(unittest.TestCase):
+    WRAPPER = '<fake xmlns:rpm="%s">%%s</fake>' % primary.RPM_SPEC_URL
+
+    def _models(self, xml):
+        snippets = packages.PackageSnippets(StringIO(xml), primary.PACKAGE_TAG)
+        from_snippets = [primary.process_package_snippet(snippets, snippet)
+                         for offset, snippet in snippets]
+        from_elements = list(packages.package_list_generator(StringIO(xml), primary.PACKAGE_TAG,
+                                                             primary.process_package_element))
+        return from_snippets, from_elements
+
+    def test_rpm(self):
+        from_snippets, from_elements = self._models(F18_XML)
+
+        self.assertEqual(len(from_snippets), 1)
+        model = from_snippets[0]
+        self.assertEqual(model.unit_key, from_elements[0].unit_key)
+        self.assertEqual(model.metadata, from_elements[0].metadata)
+        self.assertTrue(model.raw_xml.startswith('<package type="rpm">'))
+        self.assertTrue(model.raw_xml.find('xmlns') == -1)
+        # the location is relative, as it is when the element is converted
+        self.assertTrue('<location href="opensm-libs-3.3.15-3.fc18.x86_64.rpm"/>' in model.raw_xml)
+        self.assertEqual(ET.tostring(ET.fromstring(self.WRAPPER % model.raw_xml.strip())),
+                         ET.tostring(ET.fromstring(self.WRAPPER % from_elements[0].raw_xml.strip())))
+
+    def test_unusable_snippet(self):
+        xml = F18_XML.replace('xmlns:rpm=', 'xmlns:r=').replace('<rpm:', '<r:').replace('</rpm:', '</r:')
+
+        from_snippets, from_elements = self._models(xml)
+
+        self.assertEqual(from_snippets[0].raw_xml.strip(), from_elements[0].raw_xml.strip())
+
+
+class TestProcessPackageRecord(unittest.TestCase):
+    def _records_and_models(self, xml):
+        records = list(packages.package_list_generator(StringIO(xml), primary.PACKAGE_TAG,
+                                                       primary.process_package_record))
+        rpms = list(packages.package_list_generator(StringIO(xml), primary.PACKAGE_TAG,
+                                                    primary.process_package_element))
+        return records, rpms
+
+    def test_rpm(self):
+        records, rpms = self._records_and_models(F18_XML)
+
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertTrue(record.model_class is models.RPM)
+        self.assertEqual(record.as_named_tuple, rpms[0].as_named_tuple)
+        self.assertEqual(record.unit_key, rpms[0].unit_key)
+        self.assertEqual(record.size, rpms[0].metadata['size'])
+        self.assertEqual(record.key_string_without_version, rpms[0].key_string_without_version)
+        self.assertEqual(record.complete_version, rpms[0].complete_version)
+
+    def test_srpm(self):
+        records, rpms = self._records_and_models(F18_SOURCE_XML)
+
+        self.assertTrue(records[0].model_class is models.SRPM)
+        self.assertEqual(records[0].as_named_tuple, rpms[0].as_named_tuple)
+
+    def test_to_model(self):
+        records, rpms = self._records_and_models(F18_XML)
+
+        model = records[0].to_model()
+
+        self.assertTrue(isinstance(model, models.RPM))
+        self.assertEqual(model.unit_key, rpms[0].unit_key)
+        self.assertEqual(model.metadata, rpms[0].metadata)
+        self.assertEqual(model.raw_xml, rpms[0].raw_xml)
+        # the element is released, so it can only be converted once
+        self.assertRaises(ValueError, records[0].to_model)
+
+    def test_hash_and_compare(self):
+        first = self._records_and_models(F18_XML)[0][0]
+        second = self._records_and_models(F18_XML)[0][0]
+        source = self._records_and_models(F18_SOURCE_XML)[0][0]
+
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertNotEqual(first, source)
+        self.assertEqual(len(set([first, second, source])), 2)
+
+
 F18_SOURCE_XML = """<?xml version="1.0" encoding="UTF-8"?>
 <metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="1">
 <package type="rpm">
@@ -11,7 +11,9 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
+from cStringIO import StringIO
 import os
+import re
 import unittest
 
 from pulp_rpm.common import models
@@ -48,3 +50,13 @@ class TestProcessErratumElement(unittest.TestCase):
             self.assertTrue(model.name.startswith('NetworkManager'))
             self.assertEqual(model.version, '0.8.1')
             self.assertEqual(model.release, '5.el6_0.1')
+
+    def test_missing_required_element(self):
+        with open(os.path.join(os.path.dirname(__file__),
+                               '../data/RHBA-2010-0836.erratum.xml')) as f:
+            xml = re.sub('<id>.*</id>', '', f.read())
+        errata = packages.package_list_generator(StringIO(xml),
+                                                 updateinfo.PACKAGE_TAG,
+                                                 updateinfo.process_package_element)
+
+        self.assertRaises(ValueError, list, errata)
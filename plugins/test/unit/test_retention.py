@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import unittest
+
+import mock
+
+from pulp_rpm.common import version_utils
+from pulp_rpm.plugins.importers.yum import retention
+
+
+class TestVersionRetainer(unittest.TestCase):
+    def test_unlimited(self):
+        retainer = retention.VersionRetainer()
+
+        for version in ('1.0', '1.2', '1.10', '1.1'):
+            self.assertTrue(retainer.add('walrus', ('0', version, '1'), version) is None)
+
+        self.assertEqual(sorted(retainer.values()), ['1.0', '1.1', '1.10', '1.2'])
+
+    def test_limit(self):
+        retainer = retention.VersionRetainer(2)
+
+        evicted = [retainer.add('walrus', ('0', version, '1'), version)
+                   for version in ('1.0', '1.2', '1.10', '1.1')]
+
+        # 1.10 is newer than 1.2 according to RPM rules
+        self.assertEqual(evicted, [None, None, '1.0', '1.1'])
+        self.assertEqual(sorted(retainer.values()), ['1.10', '1.2'])
+
+    def test_separate_packages(self):
+        retainer = retention.VersionRetainer(1)
+
+        retainer.add('walrus', ('0', '1.0', '1'), 'walrus-1.0')
+        retainer.add('penguin', ('0', '0.1', '1'), 'penguin-0.1')
+        retainer.add('walrus', ('0', '2.0', '1'), 'walrus-2.0')
+
+        self.assertEqual(sorted(retainer.values()), ['penguin-0.1', 'walrus-2.0'])
+
+    def test_same_version_replaced(self):
+        retainer = retention.VersionRetainer(1)
+
+        retainer.add('walrus', ('0', '1.0', '1'), 'first')
+        evicted = retainer.add('walrus', ('0', '1.0', '1'), 'second')
+
+        self.assertTrue(evicted is None)
+        self.assertEqual(list(retainer.values()), ['second'])
+
+    def test_serialize(self):
+        retainer = retention.VersionRetainer()
+
+        ret = retainer.serialize(('0', '1.2a', '3.el6'))
+
+        self.assertEqual(ret, tuple(version_utils.encode(field) for field in ('0', '1.2a', '3.el6')))
+
+    @mock.patch.object(version_utils, 'encode_many', wraps=version_utils.encode_many)
+    def test_serialize_uses_version_utils(self, mock_encode_many):
+        retainer = retention.VersionRetainer()
+
+        retainer.serialize(('0', '1.0', '1'))
+
+        # the bounded cache in version_utils is used rather than a memo of its own
+        mock_encode_many.assert_called_once_with(('0', '1.0', '1'))
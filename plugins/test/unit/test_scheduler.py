@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import unittest
+
+import mock
+from nectar.config import DownloaderConfig
+from nectar.listener import AggregatingEventListener
+from nectar.report import DownloadReport
+from nectar.request import DownloadRequest
+
+from pulp_rpm.plugins.importers.yum.scheduler import DownloadScheduler
+
+
+class FakeDownloader(object):
+    """
+    Reports every request as succeeded, except those whose URL ends in "bad"
+    """
+    def __init__(self, config, event_listener):
+        self.event_listener = event_listener
+        self.requested = []
+
+    def download(self, requests):
+        for request in requests:
+            self.requested.append(request.url)
+            report = DownloadReport(request.url, request.destination, request.data)
+            self.event_listener.download_started(report)
+            self.event_listener.download_progress(report)
+            if request.url.endswith('bad'):
+                self.event_listener.download_failed(report)
+            else:
+                self.event_listener.download_succeeded(report)
+
+    def cancel(self):
+        pass
+
+
+@mock.patch('pulp_rpm.plugins.importers.yum.repomd.nectar_factory.SCHEME_DOWNLOADERS',
+            {'http': FakeDownloader})
+class TestDownloadScheduler(unittest.TestCase):
+    def setUp(self):
+        self.rpm_listener = AggregatingEventListener()
+        self.distro_listener = AggregatingEventListener()
+        self.rpm_requests = [DownloadRequest('http://fake/rpm%d' % i, '/tmp/rpm%d' % i, i)
+                             for i in range(4)]
+        self.distro_requests = [DownloadRequest('http://fake/distro0', '/tmp/distro0', 'kernel'),
+                                DownloadRequest('http://fake/bad', '/tmp/bad', 'initrd')]
+
+    def test_interleaves(self):
+        scheduler = DownloadScheduler('http://fake/', DownloaderConfig())
+        scheduler.add(self.distro_requests, self.distro_listener)
+        scheduler.add(iter(self.rpm_requests), self.rpm_listener)
+
+        scheduler.download()
+
+        self.assertEqual(scheduler.downloader.requested,
+                         ['http://fake/distro0', 'http://fake/rpm0', 'http://fake/bad',
+                          'http://fake/rpm1', 'http://fake/rpm2', 'http://fake/rpm3'])
+
+    def test_routes_events(self):
+        rpm_listener = mock.MagicMock()
+        scheduler = DownloadScheduler('http://fake/', DownloaderConfig())
+        scheduler.add(self.distro_requests, self.distro_listener)
+        scheduler.add(self.rpm_requests, rpm_listener)
+
+        scheduler.download()
+
+        self.assertEqual([report.data for report in self.distro_listener.succeeded_reports],
+                         ['kernel'])
+        self.assertEqual([report.data for report in self.distro_listener.failed_reports],
+                         ['initrd'])
+        self.assertEqual(rpm_listener.download_started.call_count, 4)
+        self.assertEqual(rpm_listener.download_progress.call_count, 4)
+        # each listener receives the original data
+        self.assertEqual([call[0][0].data for call in rpm_listener.download_succeeded.call_args_list],
+                         range(4))
+
+    def test_download_consumes_sources(self):
+        scheduler = DownloadScheduler('http://fake/', DownloaderConfig())
+        scheduler.add(self.rpm_requests, self.rpm_listener)
+
+        scheduler.download()
+        scheduler.download()
+
+        self.assertEqual(len(self.rpm_listener.succeeded_reports), 4)
@@ -22,14 +22,18 @@ from nectar.downloaders.base import Downloader
 from pulp.common.plugins import importer_constants
 from pulp.plugins.conduits.repo_sync import RepoSyncConduit
 from pulp.plugins.config import PluginCallConfiguration
-from pulp.plugins.model import Repository, SyncReport
+from pulp.plugins.model import Repository, SyncReport, Unit
 import pulp.server.managers.factory as manager_factory
 
 import model_factory
 from pulp_rpm.common import models, constants
+from pulp_rpm.plugins.importers.yum.hashing import HashingFile
+from pulp_rpm.plugins.importers.yum.listener import ContentListener
+from pulp_rpm.plugins.importers.yum.package_filter import PackageFilter
 from pulp_rpm.plugins.importers.yum.repomd import metadata, group, updateinfo, packages, presto, primary
 from pulp_rpm.plugins.importers.yum.report import ContentReport
 from pulp_rpm.plugins.importers.yum.sync import RepoSync, FailedException, CancelException
+from test_repomd_packages import TWO_PACKAGES_XML
 
 manager_factory.initialize()
 
@@ -61,6 +65,77 @@ class TestInit(BaseSyncTest):
     def test_nectar_config(self):
         self.assertTrue(isinstance(self.reposync.nectar_config, DownloaderConfig))
 
+    def test_no_validation(self):
+        self.assertFalse(self.reposync.validate_downloads)
+        self.assertFalse(self.reposync.hash_downloads)
+
+    def test_hash_downloads(self):
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: self.url,
+                                              importer_constants.KEY_VALIDATE: True})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertTrue(reposync.validate_downloads)
+        self.assertTrue(reposync.hash_downloads)
+
+    def test_verify_by_reread(self):
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: self.url,
+                                              importer_constants.KEY_VALIDATE: True,
+                                              constants.CONFIG_VERIFY_BY_REREAD: True})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertTrue(reposync.validate_downloads)
+        self.assertFalse(reposync.hash_downloads)
+
+    def test_parse_processes(self):
+        self.assertTrue(self.reposync.parse_processes is None)
+
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: self.url,
+                                              constants.CONFIG_PARSE_PROCESSES: '4'})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertEqual(reposync.parse_processes, 4)
+
+    def test_package_filter(self):
+        self.assertTrue(self.reposync.package_filter is None)
+
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: self.url,
+                                              constants.CONFIG_EXCLUDE_ARCHES: ['i686']})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertTrue(isinstance(reposync.package_filter, PackageFilter))
+        self.assertEqual(reposync.package_filter.exclude_arches, frozenset(['i686']))
+
+    def test_link_local_feed(self):
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: 'file:///mirror/repo/',
+                                              importer_constants.KEY_VALIDATE: True,
+                                              constants.CONFIG_LINK_LOCAL_FEED: True})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertTrue(reposync.link_local)
+        self.assertTrue(reposync.downloader_pool.link_local)
+        # linked files are verified by reading them
+        self.assertTrue(reposync.validate_downloads)
+        self.assertFalse(reposync.hash_downloads)
+
+    def test_link_local_remote_feed(self):
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: self.url,
+                                              constants.CONFIG_LINK_LOCAL_FEED: True})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertFalse(reposync.link_local)
+
+
+    def test_resumable(self):
+        self.assertTrue(self.reposync.checkpoint is None)
+        self.assertFalse(self.reposync.resuming)
+
+        config = PluginCallConfiguration({}, {importer_constants.KEY_FEED: self.url,
+                                              constants.CONFIG_RESUMABLE: True})
+        reposync = RepoSync(self.repo, self.conduit, config)
+
+        self.assertTrue(reposync.checkpoint.path.startswith(self.repo.working_dir))
+        self.assertFalse(reposync.resuming)
+
 
 class TestSetProgress(BaseSyncTest):
     def test_not_canceled(self):
@@ -115,6 +190,30 @@ class TestRun(BaseSyncTest):
 
         mock_rmtree.assert_called_once_with(mock_mkdtemp.return_value, ignore_errors=True)
 
+    @mock.patch('shutil.rmtree', autospec=True)
+    @mock.patch('tempfile.mkdtemp', autospec=True)
+    def test_keeps_checkpoint_after_exception(self, mock_mkdtemp, mock_rmtree):
+        self.reposync.checkpoint = mock.MagicMock()
+        self.reposync.get_metadata.side_effect = ValueError
+
+        self.reposync.run()
+
+        self.assertEqual(self.reposync.tmp_dir, self.reposync.checkpoint.open.return_value)
+        self.assertFalse(mock_mkdtemp.called)
+        self.assertFalse(mock_rmtree.called)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.sync', autospec=True)
+    @mock.patch('shutil.rmtree', autospec=True)
+    @mock.patch('tempfile.mkdtemp', autospec=True)
+    def test_removes_checkpoint_after_success(self, mock_mkdtemp, mock_rmtree, mock_treeinfo_sync):
+        self.reposync.checkpoint = mock.MagicMock()
+
+        report = self.reposync.run()
+
+        self.assertTrue(report.success_flag)
+        mock_rmtree.assert_called_once_with(self.reposync.checkpoint.open.return_value,
+                                            ignore_errors=True)
+
     @mock.patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.sync', autospec=True)
     @mock.patch('shutil.rmtree', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
@@ -132,7 +231,9 @@ class TestRun(BaseSyncTest):
         mock_treeinfo_sync.assert_called_once_with(self.conduit, self.url, mock_mkdtemp.return_value,
                                                    self.reposync.nectar_config,
                                                    self.reposync.distribution_report,
-                                                   self.reposync.set_progress)
+                                                   self.reposync.update_progress,
+                                                   validate=False, hash_downloads=False,
+                                                   downloader_pool=self.reposync.downloader_pool)
         # make sure we cleaned up the temporary directory
         mock_rmtree.assert_called_once_with(mock_mkdtemp.return_value, ignore_errors=True)
 
@@ -167,6 +268,27 @@ class TestRun(BaseSyncTest):
         self.assertEqual(report.details['distribution']['state'],
                          constants.STATE_SKIPPED)
 
+    @mock.patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.sync', autospec=True)
+    @mock.patch('shutil.rmtree', autospec=True)
+    @mock.patch('tempfile.mkdtemp', autospec=True)
+    def test_skip_unchanged_steps(self, mock_mkdtemp, mock_rmtree, mock_treeinfo_sync):
+        self.config.override_config[constants.CONFIG_SKIP_UNCHANGED] = True
+        self.reposync.unchanged_steps = set(['content', 'errata', 'comps'])
+        self.reposync.save_metadata_fingerprint = mock.MagicMock(
+            spec_set=self.reposync.save_metadata_fingerprint)
+
+        report = self.reposync.run()
+
+        self.assertTrue(report.success_flag)
+        self.assertEqual(self.reposync.update_content.call_count, 0)
+        self.assertEqual(self.reposync.get_errata.call_count, 0)
+        self.assertEqual(self.reposync.get_groups.call_count, 0)
+        for step in ('content', 'errata', 'comps'):
+            self.assertEqual(report.details[step]['state'], constants.STATE_SKIPPED)
+        # the distribution is not described by repomd.xml
+        self.assertEqual(mock_treeinfo_sync.call_count, 1)
+        self.reposync.save_metadata_fingerprint.assert_called_once_with(self.metadata_files)
+
     @mock.patch('shutil.rmtree', autospec=True)
     @mock.patch('tempfile.mkdtemp', autospec=True)
     @mock.patch('nectar.config.DownloaderConfig.finalize')
@@ -244,10 +366,140 @@ class TestGetMetadata(BaseSyncTest):
         self.assertEqual(ret, mock_metadata_instane)
         mock_metadata_instane.download_repomd.assert_called_once_with()
         mock_metadata_instane.parse_repomd.assert_called_once_with()
-        mock_metadata_instane.download_metadata_files.assert_called_once_with()
-        mock_metadata_instane.generate_dbs.assert_called_once_with()
+        mock_metadata_instane.download_metadata_files.assert_called_once_with(hash_downloads=True,
+                                                                              reuse_existing=False)
+        mock_metadata_instane.verify_metadata_files.assert_called_once_with()
+        # dbs are generated once it is known what will be downloaded
+        self.assertFalse(mock_metadata_instane.generate_dbs.called)
         self.reposync.import_unknown_metadata_files.assert_called_once_with(mock_metadata_instane)
 
+    @mock.patch.object(metadata, 'MetadataFiles', autospec=True)
+    def test_resume(self, mock_metadata_files):
+        mock_metadata_instane = mock_metadata_files.return_value
+        mock_metadata_instane.downloader = mock.MagicMock()
+        mock_metadata_instane.revision = '1'
+        self.reposync.import_unknown_metadata_files = mock.MagicMock(spec_set=self.reposync.import_unknown_metadata_files)
+        self.reposync.checkpoint = mock.MagicMock()
+        self.reposync.checkpoint.resuming = True
+
+        self.reposync.get_metadata()
+
+        self.reposync.checkpoint.begin.assert_called_once_with(self.url, metadata.REPOMD_FILE_NAME, '1')
+        mock_metadata_instane.download_metadata_files.assert_called_once_with(hash_downloads=True,
+                                                                              reuse_existing=True)
+
+    @mock.patch.object(metadata, 'MetadataFiles', autospec=True)
+    def test_resume_failed_verification(self, mock_metadata_files):
+        mock_metadata_instane = mock_metadata_files.return_value
+        mock_metadata_instane.downloader = mock.MagicMock()
+        mock_metadata_instane.verify_metadata_files.side_effect = RuntimeError
+        self.reposync.checkpoint = mock.MagicMock()
+        self.reposync.checkpoint.resuming = True
+
+        self.assertRaises(FailedException, self.reposync.get_metadata)
+
+        self.reposync.checkpoint.discard.assert_called_once_with()
+
+    @mock.patch.object(metadata, 'MetadataFiles', autospec=True)
+    def test_cache_decompressed(self, mock_metadata_files):
+        self.config.override_config[constants.CONFIG_CACHE_DECOMPRESSED] = True
+        mock_metadata_instane = mock_metadata_files.return_value
+        mock_metadata_instane.downloader = mock.MagicMock()
+        mock_metadata_instane.decompression_times = {}
+        self.reposync.import_unknown_metadata_files = mock.MagicMock(spec_set=self.reposync.import_unknown_metadata_files)
+
+        self.reposync.get_metadata()
+
+        self.assertTrue(mock_metadata_instane.cache_decompressed)
+        self.assertTrue(self.reposync.progress_status['metadata']['decompression_time'] is
+                        mock_metadata_instane.decompression_times)
+
+    @mock.patch.object(metadata, 'MetadataFiles', autospec=True)
+    def test_failed_verification(self, mock_metadata_files):
+        mock_metadata_instane = mock_metadata_files.return_value
+        mock_metadata_instane.downloader = mock.MagicMock()
+        mock_metadata_instane.verify_metadata_files.side_effect = RuntimeError
+        self.reposync.import_unknown_metadata_files = mock.MagicMock(spec_set=self.reposync.import_unknown_metadata_files)
+
+        self.assertRaises(FailedException, self.reposync.get_metadata)
+        self.assertFalse(self.reposync.import_unknown_metadata_files.called)
+
+    @mock.patch.object(metadata, 'MetadataFiles', autospec=True)
+    def test_verification_disabled(self, mock_metadata_files):
+        self.config.override_config[constants.CONFIG_VERIFY_METADATA] = False
+        mock_metadata_instane = mock_metadata_files.return_value
+        mock_metadata_instane.downloader = mock.MagicMock()
+        self.reposync.import_unknown_metadata_files = mock.MagicMock(spec_set=self.reposync.import_unknown_metadata_files)
+
+        self.reposync.get_metadata()
+
+        mock_metadata_instane.download_metadata_files.assert_called_once_with(hash_downloads=False,
+                                                                              reuse_existing=False)
+        self.assertFalse(mock_metadata_instane.verify_metadata_files.called)
+
+
+class TestSkipUnchanged(BaseSyncTest):
+    def setUp(self):
+        super(TestSkipUnchanged, self).setUp()
+        self.metadata_files.revision = '1234'
+        self.metadata_files.metadata = {
+            'primary': {'checksum': {'algorithm': 'sha256', 'hex_digest': 'abc'}},
+            'updateinfo': {'checksum': {'algorithm': 'sha256', 'hex_digest': 'def'}},
+            'group': {'checksum': {'algorithm': 'sha256', 'hex_digest': 'ghi'}},
+        }
+        self.scratchpad = {}
+        self.conduit.get_repo_scratchpad = mock.MagicMock(return_value=self.scratchpad)
+        self.conduit.set_repo_scratchpad = mock.MagicMock()
+
+    def test_nothing_saved(self):
+        ret = self.reposync._find_unchanged_steps(self.metadata_files)
+
+        self.assertEqual(ret, set())
+
+    def test_nothing_changed(self):
+        self.reposync.save_metadata_fingerprint(self.metadata_files)
+
+        ret = self.reposync._find_unchanged_steps(self.metadata_files)
+
+        self.assertEqual(ret, set(['metadata', 'content', 'errata', 'comps']))
+
+    def test_one_type_changed(self):
+        self.reposync.save_metadata_fingerprint(self.metadata_files)
+        self.metadata_files.revision = '1235'
+        self.metadata_files.metadata['updateinfo']['checksum']['hex_digest'] = 'xyz'
+
+        ret = self.reposync._find_unchanged_steps(self.metadata_files)
+
+        self.assertEqual(ret, set(['content', 'comps']))
+
+    def test_config_changed(self):
+        self.reposync.save_metadata_fingerprint(self.metadata_files)
+        self.config.override_config[importer_constants.KEY_UNITS_RETAIN_OLD_COUNT] = 2
+
+        ret = self.reposync._find_unchanged_steps(self.metadata_files)
+
+        self.assertEqual(ret, set())
+
+    def test_not_saved_after_errors(self):
+        self.scratchpad[constants.SCRATCHPAD_LAST_SYNC_METADATA] = {}
+        self.reposync.content_report['error_details'].append({'error': 'oops'})
+
+        self.reposync.save_metadata_fingerprint(self.metadata_files)
+
+        self.assertFalse(constants.SCRATCHPAD_LAST_SYNC_METADATA in self.scratchpad)
+        self.conduit.set_repo_scratchpad.assert_called_once_with(self.scratchpad)
+
+    @mock.patch.object(metadata, 'MetadataFiles', autospec=True)
+    def test_get_metadata_short_circuits(self, mock_metadata_files):
+        self.config.override_config[constants.CONFIG_SKIP_UNCHANGED] = True
+        mock_metadata_instance = mock_metadata_files.return_value
+        self.reposync._find_unchanged_steps = mock.MagicMock(return_value=set(['metadata']))
+
+        ret = self.reposync.get_metadata()
+
+        self.assertEqual(ret, mock_metadata_instance)
+        self.assertFalse(mock_metadata_instance.download_metadata_files.called)
+
 
 class TestSaveMetadataChecksum(BaseSyncTest):
     def setUp(self):
@@ -324,15 +576,66 @@ class TestUpdateContent(BaseSyncTest):
                 spec_set=RepoSync.download)
     @mock.patch('pulp_rpm.plugins.importers.yum.purge.purge_unwanted_units', autospec=True)
     def test_workflow(self, mock_purge, mock_download, mock_decide):
-        rpms = set([1, 2, 3])
+        rpms = set([model_factory.rpm_models(1)[0].as_named_tuple])
         drpms = set([4, 5, 6])
         mock_decide.return_value = (rpms, drpms)
+        self.metadata_files.generate_dbs = mock.MagicMock(spec_set=self.metadata_files.generate_dbs)
 
         self.reposync.update_content(self.metadata_files)
 
         mock_decide.assert_called_once_with(self.metadata_files)
         mock_download.assert_called_once_with(self.metadata_files, rpms, drpms)
-        mock_purge.assert_called_once_with(self.metadata_files, self.conduit, self.config)
+        mock_purge.assert_called_once_with(self.metadata_files, self.conduit, self.config,
+                                           parse_processes=None)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync._decide_what_to_download',
+                spec_set=RepoSync._decide_what_to_download)
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync.download',
+                spec_set=RepoSync.download)
+    @mock.patch('pulp_rpm.plugins.importers.yum.purge.purge_unwanted_units', autospec=True)
+    def test_generates_dbs_for_wanted_rpms(self, mock_purge, mock_download, mock_decide):
+        rpm = model_factory.rpm_models(1)[0]
+        mock_decide.return_value = (set([rpm.as_named_tuple]), set())
+        self.metadata_files.generate_dbs = mock.MagicMock(spec_set=self.metadata_files.generate_dbs)
+
+        self.reposync.update_content(self.metadata_files)
+
+        expected_key = metadata.MetadataFiles.generate_db_key(rpm.unit_key)
+        self.metadata_files.generate_dbs.assert_called_once_with(
+            self.reposync._set_repodata_progress, set([expected_key]), processes=None)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync._decide_what_to_download',
+                spec_set=RepoSync._decide_what_to_download)
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync.download',
+                spec_set=RepoSync.download)
+    @mock.patch('pulp_rpm.plugins.importers.yum.purge.purge_unwanted_units', autospec=True)
+    def test_lazy_repodata(self, mock_purge, mock_download, mock_decide):
+        self.config.override_config[constants.CONFIG_LAZY_REPODATA] = True
+        mock_decide.return_value = (set(), set())
+        self.metadata_files.generate_dbs = mock.MagicMock(spec_set=self.metadata_files.generate_dbs)
+        self.metadata_files.index_repodata = mock.MagicMock(
+            spec_set=self.metadata_files.index_repodata)
+
+        self.reposync.update_content(self.metadata_files)
+
+        self.metadata_files.index_repodata.assert_called_once_with(
+            self.reposync._set_repodata_progress)
+        self.assertFalse(self.metadata_files.generate_dbs.called)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync._decide_what_to_download',
+                spec_set=RepoSync._decide_what_to_download)
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync.download',
+                spec_set=RepoSync.download)
+    @mock.patch('pulp_rpm.plugins.importers.yum.purge.purge_unwanted_units', autospec=True)
+    def test_workflow_with_index(self, mock_purge, mock_download, mock_decide):
+        mock_decide.return_value = (set(), set())
+        self.reposync.rpm_index = mock.MagicMock()
+        self.metadata_files.generate_dbs = mock.MagicMock(spec_set=self.metadata_files.generate_dbs)
+
+        self.reposync.update_content(self.metadata_files)
+
+        mock_purge.assert_called_once_with(self.metadata_files, self.conduit, self.config,
+                                           self.reposync.rpm_index)
 
 
 class TestDecideWhatToDownload(BaseSyncTest):
@@ -385,7 +688,6 @@ class TestDecideRPMsToDownload(BaseSyncTest):
         mock_open.return_value = primary_file
         model = model_factory.rpm_models(1)[0]
         self.metadata_files.metadata[primary.METADATA_FILE_NAME] = {'local_path': '/path/to/primary'}
-        mock_generator.return_value = [model.as_named_tuple]
         mock_identify.return_value = {model.as_named_tuple: 1024}
         mock_check_repo.return_value = set([model.as_named_tuple])
 
@@ -393,8 +695,31 @@ class TestDecideRPMsToDownload(BaseSyncTest):
 
         self.assertEqual(ret, (set([model.as_named_tuple]), 1, 1024))
         mock_open.assert_called_once_with('/path/to/primary', 'r')
-        mock_generator.assert_called_once_with(primary_file, primary.PACKAGE_TAG, primary.process_package_element)
+        mock_generator.assert_called_once_with(primary_file, primary.PACKAGE_TAG,
+                                               primary.process_package_record, processes=None)
         mock_identify.assert_called_once_with(mock_generator.return_value)
+        mock_generator.return_value.close.assert_called_once_with()
+        self.assertTrue(primary_file.closed)
+        # no index is built unless single-pass mode is enabled
+        self.assertTrue(self.reposync.rpm_index is None)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_single_pass(self, mock_check_repo):
+        self.config.override_config[constants.CONFIG_SINGLE_PASS] = True
+        primary_file = StringIO(TWO_PACKAGES_XML)
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle, return_value=primary_file)
+        # pretend the first package is already in the repo
+        mock_check_repo.side_effect = lambda wanted, search, checker: set(list(wanted)[1:])
+
+        ret = self.reposync._decide_rpms_to_download(self.metadata_files)
+
+        rpm_index = self.reposync.rpm_index
+        self.assertEqual(len(rpm_index.locations), 2)
+        self.assertEqual(len(rpm_index.wanted), 2)
+        self.assertEqual(len(rpm_index.to_download), 1)
+        unit = list(rpm_index.to_download)[0]
+        self.assertEqual(ret, (rpm_index.to_download, 1, rpm_index.wanted[unit]))
         self.assertTrue(primary_file.closed)
 
     @mock.patch('__builtin__.open', autospec=True)
@@ -411,6 +736,96 @@ class TestDecideRPMsToDownload(BaseSyncTest):
         mock_open.assert_called_once_with('/path/to/primary', 'r')
         self.assertTrue(primary_file.closed)
 
+    @mock.patch('__builtin__.open', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.RepoSync._identify_wanted_versions',
+                spec_set=RepoSync._identify_wanted_versions)
+    def test_closes_generator_on_exception(self, mock_identify, mock_generator, mock_open):
+        primary_file = StringIO()
+        mock_open.return_value = primary_file
+        self.metadata_files.metadata[primary.METADATA_FILE_NAME] = {'local_path': '/path/to/primary'}
+        mock_identify.side_effect = CancelException
+
+        self.assertRaises(CancelException, self.reposync._decide_rpms_to_download,
+                          self.metadata_files)
+
+        mock_generator.return_value.close.assert_called_once_with()
+        self.assertTrue(primary_file.closed)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_parse_processes(self, mock_check_repo):
+        self.reposync.parse_processes = 2
+        primary_file = StringIO(TWO_PACKAGES_XML)
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle, return_value=primary_file)
+        mock_check_repo.side_effect = lambda wanted, search, checker: set(wanted)
+
+        to_download, count, size = self.reposync._decide_rpms_to_download(self.metadata_files)
+
+        self.assertEqual(count, 2)
+        self.assertEqual(set(unit.arch for unit in to_download), set(['x86_64', 'src']))
+        self.assertTrue(primary_file.closed)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_package_filter(self, mock_check_repo):
+        self.reposync.package_filter = PackageFilter(exclude_arches=['src'])
+        primary_file = StringIO(TWO_PACKAGES_XML)
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle, return_value=primary_file)
+        mock_check_repo.side_effect = lambda wanted, search, checker: set(wanted)
+
+        to_download, count, size = self.reposync._decide_rpms_to_download(self.metadata_files)
+
+        self.assertEqual(count, 1)
+        self.assertEqual([unit.arch for unit in to_download], ['x86_64'])
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_single_pass_package_filter(self, mock_check_repo):
+        self.config.override_config[constants.CONFIG_SINGLE_PASS] = True
+        self.reposync.package_filter = PackageFilter(include_arches=['src'])
+        primary_file = StringIO(TWO_PACKAGES_XML)
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle, return_value=primary_file)
+        mock_check_repo.side_effect = lambda wanted, search, checker: set(wanted)
+
+        to_download, count, size = self.reposync._decide_rpms_to_download(self.metadata_files)
+
+        # the filtered package is not in the index, so it is not a remote unit
+        self.assertEqual(count, 1)
+        self.assertEqual([unit.arch for unit in self.reposync.rpm_index.remote_units], ['src'])
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.find_in_content_store', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_associate_from_store(self, mock_check_repo, mock_find):
+        self.config.override_config[constants.CONFIG_ASSOCIATE_FROM_STORE] = True
+        primary_file = StringIO(TWO_PACKAGES_XML)
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle, return_value=primary_file)
+        mock_check_repo.side_effect = lambda wanted, search, checker: set(wanted)
+        # pretend the first package is in another repo
+        found_unit = mock.MagicMock()
+        mock_find.side_effect = lambda wanted, search: {sorted(wanted)[0]: found_unit}
+
+        to_download, count, size = self.reposync._decide_rpms_to_download(self.metadata_files)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(len(to_download), 1)
+        self.assertEqual(self.reposync.units_in_store, [found_unit])
+        self.assertEqual(mock_find.call_args[0][1], self.conduit.search_all_units)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.find_in_content_store', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_store_not_searched_by_default(self, mock_check_repo, mock_find):
+        primary_file = StringIO(TWO_PACKAGES_XML)
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle, return_value=primary_file)
+        mock_check_repo.side_effect = lambda wanted, search, checker: set(wanted)
+
+        to_download, count, size = self.reposync._decide_rpms_to_download(self.metadata_files)
+
+        self.assertEqual(count, 2)
+        self.assertEqual(mock_find.call_count, 0)
+
 
 class TestDecideDRPMsToDownload(BaseSyncTest):
     def test_skip_drpms(self):
@@ -438,7 +853,6 @@ class TestDecideDRPMsToDownload(BaseSyncTest):
         mock_open.return_value = presto_file
         model = model_factory.drpm_models(1)[0]
         self.metadata_files.metadata[presto.METADATA_FILE_NAME] = {'local_path': '/path/to/presto'}
-        mock_generator.return_value = [model.as_named_tuple]
         mock_identify.return_value = {model.as_named_tuple: 1024}
         mock_check_repo.return_value = set([model.as_named_tuple])
 
@@ -464,6 +878,24 @@ class TestDecideDRPMsToDownload(BaseSyncTest):
         mock_open.assert_called_once_with('/path/to/presto', 'r')
         self.assertTrue(presto_file.closed)
 
+    @mock.patch('__builtin__.open', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    def test_package_filter(self, mock_check_repo, mock_generator, mock_open):
+        mock_open.return_value = StringIO()
+        self.metadata_files.metadata[presto.METADATA_FILE_NAME] = {'local_path': '/path/to/presto'}
+        wanted_model, filtered_model = model_factory.drpm_models(2)
+        wanted_model.metadata.update({'new_package': 'walrus', 'arch': 'x86_64', 'size': 1024})
+        filtered_model.metadata.update({'new_package': 'walrus', 'arch': 'i686', 'size': 2048})
+        mock_generator.return_value = [wanted_model, filtered_model]
+        mock_check_repo.side_effect = lambda wanted, *args, **kwargs: set(wanted)
+        self.reposync.package_filter = PackageFilter(exclude_arches=['i686'])
+
+        ret = self.reposync._decide_drpms_to_download(self.metadata_files)
+
+        # deltas that build filtered out packages are not downloaded
+        self.assertEqual(ret, (set([wanted_model.as_named_tuple]), 1, 1024))
+
 
 class TestDownload(BaseSyncTest):
     RELATIVEPATH = 'myrelativepath'
@@ -482,7 +914,7 @@ class TestDownload(BaseSyncTest):
             spec_set=self.metadata_files.get_metadata_file_handle,
             side_effect=StringIO,
         )
-        mock_package_list_generator.side_effect = iter([model_factory.rpm_models(3),
+        mock_package_list_generator.side_effect = iter([model_factory.rpm_records(model_factory.rpm_models(3)),
                                                     model_factory.drpm_models(3)])
 
         report = self.reposync.download(self.metadata_files, set(), set())
@@ -506,7 +938,7 @@ class TestDownload(BaseSyncTest):
         rpms = model_factory.rpm_models(3)
         for rpm in rpms:
             rpm.metadata['relativepath'] = self.RELATIVEPATH
-        mock_package_list_generator.return_value = rpms
+        mock_package_list_generator.return_value = model_factory.rpm_records(rpms)
         self.downloader.download = mock.MagicMock(spec_set=self.downloader.download)
         mock_create_downloader.return_value = self.downloader
 
@@ -528,6 +960,32 @@ class TestDownload(BaseSyncTest):
         self.assertTrue(requests[1].data is rpms[1])
         self.assertTrue(file_handle.closed)
 
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.nectar_factory.create_downloader', autospec=True)
+    @mock.patch.object(packages, 'package_list_generator', autospec=True)
+    def test_hash_downloads(self, mock_package_list_generator, mock_create_downloader):
+        """
+        when downloads are hashed, each request's destination is a HashingFile
+        """
+        self.reposync.hash_downloads = True
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle,
+            side_effect=[StringIO(), None],
+        )
+        rpms = model_factory.rpm_models(1)
+        rpms[0].metadata['relativepath'] = self.RELATIVEPATH
+        mock_package_list_generator.return_value = model_factory.rpm_records(rpms)
+        self.downloader.download = mock.MagicMock(spec_set=self.downloader.download)
+        mock_create_downloader.return_value = self.downloader
+
+        self.reposync.download(self.metadata_files, set(m.as_named_tuple for m in rpms), set())
+
+        requests = list(self.downloader.download.call_args[0][0])
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(isinstance(requests[0].destination, HashingFile))
+        self.assertEqual(requests[0].destination.path,
+                         os.path.join(self.reposync.tmp_dir, self.RELATIVEPATH))
+        self.assertEqual(requests[0].destination.checksumtype, 'sha256')
+
     @mock.patch('pulp_rpm.plugins.importers.yum.repomd.nectar_factory.create_downloader', autospec=True)
     @mock.patch.object(packages, 'package_list_generator', autospec=True)
     def test_drpms_to_download(self, mock_package_list_generator, mock_create_downloader):
@@ -564,6 +1022,94 @@ class TestDownload(BaseSyncTest):
         self.assertTrue(file_handle.closed)
 
 
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.nectar_factory.create_downloader', autospec=True)
+    @mock.patch.object(packages, 'package_list_generator', autospec=True)
+    def test_rpms_from_index(self, mock_package_list_generator, mock_create_downloader):
+        """
+        test that RPMs come from the index instead of another pass over primary.xml
+        """
+        file_handle = StringIO()
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle,
+            side_effect=[file_handle, None], # None means it will skip DRPMs
+        )
+        rpms = model_factory.rpm_models(2)
+        for rpm in rpms:
+            rpm.metadata['relativepath'] = self.RELATIVEPATH
+        self.reposync.rpm_index = mock.MagicMock()
+        self.reposync.rpm_index.download_generator.return_value = rpms
+        self.downloader.download = mock.MagicMock(spec_set=self.downloader.download)
+        mock_create_downloader.return_value = self.downloader
+
+        self.reposync.download(self.metadata_files, set(m.as_named_tuple for m in rpms), set())
+
+        self.assertEqual(mock_package_list_generator.call_count, 0)
+        self.reposync.rpm_index.download_generator.assert_called_once_with(file_handle)
+        requests = list(self.downloader.download.call_args[0][0])
+        self.assertEqual(len(requests), 2)
+        self.assertTrue(requests[0].data is rpms[0])
+        self.assertTrue(requests[1].data is rpms[1])
+        self.assertTrue(file_handle.closed)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.prepare', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.nectar_factory.create_downloader', autospec=True)
+    @mock.patch.object(packages, 'package_list_generator', autospec=True)
+    def test_unified_downloads(self, mock_package_list_generator, mock_create_downloader,
+                               mock_prepare):
+        """
+        RPMs and DRPMs are requested from one downloader, taking turns
+        """
+        self.config.override_config[constants.CONFIG_UNIFIED_DOWNLOADS] = True
+        primary_handle = StringIO()
+        presto_handle = StringIO()
+        self.metadata_files.get_metadata_file_handle = mock.MagicMock(
+            spec_set=self.metadata_files.get_metadata_file_handle,
+            side_effect=[primary_handle, presto_handle],
+        )
+        # no treefile was found
+        mock_prepare.return_value = None
+        rpms = model_factory.rpm_models(2)
+        for rpm in rpms:
+            rpm.metadata['relativepath'] = self.RELATIVEPATH
+        drpms = model_factory.drpm_models(2)
+        for drpm in drpms:
+            drpm.metadata['relativepath'] = ''
+        mock_package_list_generator.side_effect = iter([model_factory.rpm_records(rpms), drpms])
+        self.downloader.download = mock.MagicMock(spec_set=self.downloader.download)
+        mock_create_downloader.return_value = self.downloader
+
+        self.reposync.download(self.metadata_files, set(m.as_named_tuple for m in rpms),
+                               set(m.as_named_tuple for m in drpms))
+
+        self.assertEqual(mock_prepare.call_count, 1)
+        self.assertEqual(self.downloader.download.call_count, 1)
+        requests = list(self.downloader.download.call_args[0][0])
+        self.assertEqual([request.data.data for request in requests],
+                         [rpms[0], drpms[0], rpms[1], drpms[1]])
+        self.assertTrue(primary_handle.closed)
+        self.assertTrue(presto_handle.closed)
+
+
+class TestAssociateUnitsInStore(BaseSyncTest):
+    def test_associates(self):
+        rpm = model_factory.rpm_models(1)[0]
+        drpm = model_factory.drpm_models(1)[0]
+        units = [Unit(model.TYPE, model.unit_key, model.metadata, '/storage/%s' % model.TYPE)
+                 for model in (rpm, drpm)]
+        self.reposync.units_in_store = list(units)
+        self.conduit.save_unit = mock.MagicMock(spec_set=self.conduit.save_unit)
+
+        self.reposync._associate_units_in_store()
+
+        self.assertEqual([call[0][0] for call in self.conduit.save_unit.call_args_list], units)
+        details = self.reposync.content_report['details']
+        self.assertEqual(details['rpm_associated'], 1)
+        self.assertEqual(details['drpm_associated'], 1)
+        # they were never counted as downloads
+        self.assertEqual(details['rpm_done'], 0)
+        self.assertEqual(self.reposync.units_in_store, [])
+
+
 class TestCancel(BaseSyncTest):
     def test_sets_bools(self):
         self.reposync.downloader = self.downloader
@@ -573,6 +1119,13 @@ class TestCancel(BaseSyncTest):
         self.assertTrue(self.reposync.cancelled)
         self.assertTrue(self.downloader.is_canceled)
 
+    def test_cancels_content_listener(self):
+        self.reposync.content_listener = mock.MagicMock(spec_set=ContentListener)
+
+        self.reposync.cancel()
+
+        self.reposync.content_listener.cancel.assert_called_once_with()
+
     def test_handles_no_downloader(self):
         # it shouldn't get upset if there isn't a downloader available
         self.reposync.cancel()
@@ -751,6 +1304,124 @@ class TestGetCategories(BaseSyncTest):
         mock_process.assert_called_once_with(self.repo.id, fake_element)
 
 
+class TestSaveChangedFilelessUnits(BaseSyncTest):
+    def setUp(self):
+        super(TestSaveChangedFilelessUnits, self).setUp()
+        self.config.override_config[constants.CONFIG_INCREMENTAL_FILELESS] = True
+        self.scratchpad = {}
+        self.conduit.get_repo_scratchpad = mock.MagicMock(return_value=self.scratchpad)
+        self.conduit.set_repo_scratchpad = mock.MagicMock(side_effect=self.scratchpad.update)
+        self.conduit.init_unit = mock.MagicMock(spec_set=self.conduit.init_unit)
+        self.conduit.save_unit = mock.MagicMock(spec_set=self.conduit.save_unit)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    def test_first_sync(self, mock_generator, mock_check_repo):
+        errata = tuple(model_factory.errata_models(3))
+        mock_generator.return_value = errata
+
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+
+        # the file is only parsed once, and the db is not searched
+        self.assertEqual(mock_generator.call_count, 1)
+        self.assertEqual(mock_check_repo.call_count, 0)
+        self.assertEqual(self.conduit.save_unit.call_count, 3)
+        saved_hashes = self.scratchpad[constants.SCRATCHPAD_UNIT_HASHES][models.Errata.TYPE]
+        self.assertEqual(len(saved_hashes), 3)
+        self.conduit.set_repo_scratchpad.assert_called_once_with(self.scratchpad)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    def test_only_changed_saved(self, mock_generator, mock_check_repo):
+        mock_check_repo.return_value = set()
+        errata = tuple(model_factory.errata_models(3))
+        mock_generator.return_value = errata
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+        self.conduit.init_unit.reset_mock()
+        self.conduit.save_unit.reset_mock()
+        errata[1].metadata['description'] = 'changed'
+
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+
+        # the unchanged units are checked against the repo, all in one call
+        self.assertEqual(mock_generator.call_count, 2)
+        mock_check_repo.assert_called_once_with(
+            set([errata[0].as_named_tuple, errata[2].as_named_tuple]), self.conduit.get_units,
+            checker=self.reposync.existence_checker)
+        self.assertEqual(self.conduit.save_unit.call_count, 1)
+        self.conduit.init_unit.assert_called_once_with(errata[1].TYPE, errata[1].unit_key,
+                                                       errata[1].metadata, None)
+        saved_hashes = self.scratchpad[constants.SCRATCHPAD_UNIT_HASHES][models.Errata.TYPE]
+        self.assertEqual(len(saved_hashes), 3)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    def test_mutable_type(self, mock_generator, mock_check_repo):
+        mock_check_repo.return_value = set()
+        groups = tuple(model_factory.group_models(2))
+        mock_generator.return_value = groups
+        self.reposync.save_fileless_units(StringIO(), group.GROUP_TAG, group.process_group_element,
+                                          mutable_type=True)
+        self.conduit.save_unit.reset_mock()
+
+        self.reposync.save_fileless_units(StringIO(), group.GROUP_TAG, group.process_group_element,
+                                          mutable_type=True)
+
+        # nothing changed, so nothing is saved again
+        self.assertEqual(self.conduit.save_unit.call_count, 0)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    def test_removed_unit_saved_again(self, mock_generator, mock_check_repo):
+        errata = tuple(model_factory.errata_models(3))
+        mock_generator.return_value = errata
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+        self.conduit.init_unit.reset_mock()
+        self.conduit.save_unit.reset_mock()
+        # the second erratum was removed from the repo after the first sync
+        mock_check_repo.return_value = set([errata[1].as_named_tuple])
+        file_handle = StringIO('metadata')
+        file_handle.read()
+
+        self.reposync.save_fileless_units(file_handle, updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+
+        # the file is parsed again to find the missing unit
+        self.assertEqual(file_handle.tell(), 0)
+        self.assertEqual(mock_generator.call_count, 3)
+        self.assertEqual(self.conduit.save_unit.call_count, 1)
+        self.conduit.init_unit.assert_called_once_with(errata[1].TYPE, errata[1].unit_key,
+                                                       errata[1].metadata, None)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
+    @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
+    def test_type_dropped_from_file(self, mock_generator, mock_check_repo):
+        mock_check_repo.return_value = set()
+        errata = tuple(model_factory.errata_models(2))
+        mock_generator.return_value = errata
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+        mock_generator.return_value = ()
+
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+
+        self.assertFalse(models.Errata.TYPE in self.scratchpad[constants.SCRATCHPAD_UNIT_HASHES])
+
+        # when the same units come back, they are all saved again
+        self.conduit.save_unit.reset_mock()
+        mock_generator.return_value = errata
+
+        self.reposync.save_fileless_units(StringIO(), updateinfo.PACKAGE_TAG,
+                                          updateinfo.process_package_element)
+
+        self.assertEqual(self.conduit.save_unit.call_count, 2)
+
+
 class TestSaveFilelessUnits(BaseSyncTest):
     @mock.patch('pulp_rpm.plugins.importers.yum.existing.check_repo', autospec=True)
     @mock.patch('pulp_rpm.plugins.importers.yum.repomd.packages.package_list_generator', autospec=True)
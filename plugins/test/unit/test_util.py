@@ -78,6 +78,76 @@ class TestElementToRawXML(unittest.TestCase):
         reparsed = ET.fromstring(raw_xml)
 
 
+class TestSnippetToRawXML(unittest.TestCase):
+    RPM_NAMESPACES = [utils.Namespace('rpm', primary.RPM_SPEC_URL)]
+    PRIMARY_DECLARATIONS = 'xmlns="%s" xmlns:rpm="%s"' % (primary.COMMON_SPEC_URL,
+                                                          primary.RPM_SPEC_URL)
+
+    def _snippet(self, document):
+        start = document.index('<package')
+        end = document.index('</package>') + len('</package>')
+        return document[start:end]
+
+    def test_rpm(self):
+        snippet = self._snippet(PRIMARY_XML)
+
+        raw_xml = utils.snippet_to_raw_xml(snippet, self.PRIMARY_DECLARATIONS,
+                                           self.RPM_NAMESPACES, primary.COMMON_SPEC_URL)
+
+        self.assertEqual(raw_xml, snippet + '\n')
+        # matches what the element would have been converted to
+        element = ET.fromstring(PRIMARY_XML)[0]
+        expected = utils.element_to_raw_xml(element, self.RPM_NAMESPACES, primary.COMMON_SPEC_URL)
+        fake_xml = '<fake xmlns:rpm="%s">%s</fake>'
+        self.assertEqual(ET.tostring(ET.fromstring(fake_xml % (primary.RPM_SPEC_URL, raw_xml))),
+                         ET.tostring(ET.fromstring(fake_xml % (primary.RPM_SPEC_URL, expected))))
+
+    def test_other(self):
+        snippet = self._snippet(OTHER_XML)
+
+        raw_xml = utils.snippet_to_raw_xml(snippet, 'xmlns="http://linux.duke.edu/metadata/other"')
+
+        self.assertEqual(raw_xml, snippet + '\n')
+
+    def test_start_tag_declarations_removed(self):
+        snippet = '<package xmlns="http://linux.duke.edu/metadata/filelists" pkgid="a1"><file>/a</file></package>'
+
+        raw_xml = utils.snippet_to_raw_xml(snippet)
+
+        self.assertEqual(raw_xml, '<package pkgid="a1"><file>/a</file></package>\n')
+
+    def test_non_ascii(self):
+        snippet = '<package><changelog author="Jind\xc5\x99ich">- fix</changelog></package>'
+
+        raw_xml = utils.snippet_to_raw_xml(snippet)
+
+        self.assertEqual(raw_xml, '<package><changelog author="Jind&#345;ich">- fix</changelog></package>\n')
+        self.assertEqual(ET.fromstring(raw_xml)[0].get('author'), u'Jind\u0159ich')
+
+    def test_predefined_entities(self):
+        snippet = '<package><changelog author="A &lt;a@example.com&gt;">&#8211; &amp; &#x2014;</changelog></package>'
+
+        self.assertEqual(utils.snippet_to_raw_xml(snippet), snippet + '\n')
+
+    def test_unusable(self):
+        rpm_snippet = '<package><rpm:license>GPLv2</rpm:license></package>'
+        # the rpm prefix is not expected
+        self.assertTrue(utils.snippet_to_raw_xml(rpm_snippet, self.PRIMARY_DECLARATIONS) is None)
+        # the rpm prefix is bound to a different namespace
+        self.assertTrue(utils.snippet_to_raw_xml(rpm_snippet, 'xmlns:rpm="http://pulpproject.org"',
+                                                 self.RPM_NAMESPACES) is None)
+        # a different default namespace
+        self.assertTrue(utils.snippet_to_raw_xml('<package/>', 'xmlns="http://pulpproject.org"',
+                                                 self.RPM_NAMESPACES, primary.COMMON_SPEC_URL) is None)
+        # a namespace declared on a descendant
+        self.assertTrue(utils.snippet_to_raw_xml(
+            '<package><foo:a xmlns:foo="http://pulpproject.org"/></package>') is None)
+        # an entity declared by the document
+        self.assertTrue(utils.snippet_to_raw_xml('<package>&pulp;</package>') is None)
+        # not UTF-8
+        self.assertTrue(utils.snippet_to_raw_xml('<package>\xff</package>') is None)
+
+
 class TestRegisterNamespace(unittest.TestCase):
     DUMMY_XML = """<?xml version="1.0" encoding="UTF-8"?>
 <dummyroot xmlns:foo="http://pulpproject.org/foo">
@@ -135,6 +205,43 @@ class TestStripNS(unittest.TestCase):
             self._check_all_elements(child)
 
 
+class TestDispatchChildren(unittest.TestCase):
+    def setUp(self):
+        self.element = ET.fromstring('<a><b>1</b><c>2</c><b>3</b><d>4</d><c>5</c></a>')
+        self.calls = []
+
+    def _handler(self, target, element):
+        target.append((element.tag, element.text))
+
+    def test_first_child_only(self):
+        remaining = utils.dispatch_children(self.element, self.calls,
+                                            {'b': self._handler, 'c': self._handler})
+
+        self.assertEqual(self.calls, [('b', '1'), ('c', '2')])
+        self.assertEqual(remaining, {})
+
+    def test_repeated(self):
+        utils.dispatch_children(self.element, self.calls, {'b': self._handler},
+                                {'c': self._handler})
+
+        self.assertEqual(self.calls, [('b', '1'), ('c', '2'), ('c', '5')])
+
+    def test_remaining(self):
+        remaining = utils.dispatch_children(self.element, self.calls,
+                                            {'d': self._handler, 'e': self._handler})
+
+        self.assertEqual(self.calls, [('d', '4')])
+        self.assertEqual(remaining.keys(), ['e'])
+
+    def test_handlers_not_modified(self):
+        handlers = {'b': self._handler}
+
+        utils.dispatch_children(self.element, self.calls, handlers)
+        utils.dispatch_children(self.element, self.calls, handlers)
+
+        self.assertEqual(self.calls, [('b', '1'), ('b', '1')])
+
+
 class TestPaginate(unittest.TestCase):
     def test_list(self):
         iterable = list(range(10))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import threading
+import unittest
+
+from pulp_rpm.plugins.importers.yum.writer import BatchWriter
+
+
+class TestBatchWriter(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.writer = BatchWriter(self.batches.append, queue_size=10, batch_size=3)
+
+    def tearDown(self):
+        self.writer.cancel()
+
+    def test_saves_everything(self):
+        self.writer.start()
+
+        for i in range(10):
+            self.writer.put(i)
+        self.writer.flush()
+
+        self.assertEqual(sum(self.batches, []), range(10))
+        for batch in self.batches:
+            self.assertTrue(len(batch) <= 3)
+
+    def test_batches_waiting_items(self):
+        # items added before the writer starts are all waiting at once
+        for i in range(7):
+            self.writer.put(i)
+        self.writer.start()
+        self.writer.flush()
+
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_stop_saves_remaining(self):
+        for i in range(4):
+            self.writer.put(i)
+        self.writer.start()
+
+        self.writer.stop()
+
+        self.assertFalse(self.writer.is_alive())
+        self.assertEqual(sum(self.batches, []), range(4))
+
+    def test_error(self):
+        def save(items):
+            raise ValueError('oops')
+        writer = BatchWriter(save)
+        writer.start()
+
+        writer.put(1)
+        writer.put(2)
+
+        self.assertRaises(ValueError, writer.flush)
+        writer.stop()
+
+    def test_error_does_not_drop_later_batches(self):
+        def save(items):
+            if 0 in items:
+                raise ValueError('oops')
+            self.batches.append(items)
+        for i in range(7):
+            self.writer.put(i)
+        self.writer.save_func = save
+        self.writer.start()
+
+        self.assertRaises(ValueError, self.writer.flush)
+        # only the batch that failed is lost
+        self.assertEqual(self.batches, [[3, 4, 5], [6]])
+
+    def test_backpressure(self):
+        writer = BatchWriter(self.batches.append, queue_size=2)
+        for i in range(2):
+            writer.put(i)
+        third_put = threading.Thread(target=writer.put, args=(2,))
+        third_put.start()
+
+        # the queue is full, so the producer has to wait for the writer
+        third_put.join(0.1)
+        self.assertTrue(third_put.is_alive())
+
+        writer.start()
+        third_put.join()
+        writer.stop()
+        self.assertEqual(sum(self.batches, []), range(3))
+
+    def test_cancel(self):
+        for i in range(5):
+            self.writer.put(i)
+
+        self.writer.cancel()
+        self.writer.start()
+        self.writer.put(6)
+        self.writer.flush()
+        self.writer.stop()
+
+        self.assertEqual(self.batches, [])
@@ -26,6 +26,7 @@ from pulp.server.db.model.criteria import UnitAssociationCriteria
 from pulp_rpm.common.ids import (TYPE_ID_DISTRO, TYPE_ID_DRPM, TYPE_ID_ERRATA, TYPE_ID_PKG_GROUP,
                                  TYPE_ID_PKG_CATEGORY, TYPE_ID_RPM, TYPE_ID_SRPM, TYPE_ID_DISTRIBUTOR_YUM,
                                  TYPE_ID_YUM_REPO_METADATA_FILE)
+from pulp_rpm.common.progress import ProgressPublisher
 from pulp_rpm.repo_auth import protected_repo_utils, repo_cert_utils
 from pulp_rpm.yum_plugin import comps_util, util, metadata, updateinfo
 from pulp_rpm.plugins.importers.yum.parse.treeinfo import KEY_PACKAGEDIR
@@ -308,9 +309,12 @@ class YumDistributor(Distributor):
             "publish_https":      {"state": "NOT_STARTED"},
             }
 
+        # per-unit updates are coalesced, while state changes are sent right away
+        publisher = ProgressPublisher(publish_conduit)
+
         def progress_callback(type_id, status):
             progress_status[type_id] = status
-            publish_conduit.set_progress(progress_status)
+            publisher.update(progress_status)
 
         self.repo_working_dir = repo.working_dir
 
@@ -353,6 +357,7 @@ class YumDistributor(Distributor):
             updateinfo_xml_path = updateinfo.updateinfo(errata_units, repo.working_dir)
 
         if self.canceled:
+            publisher.flush()
             return publish_conduit.build_cancel_report(summary, details)
         groups_xml_path = None
         existing_cats = []
@@ -437,6 +442,7 @@ class YumDistributor(Distributor):
                 _LOG.debug("Removing link for %s since http is not set" % http_repo_publish_dir)
                 util.remove_repo_publish_dir(http_publish_dir, http_repo_publish_dir)
 
+        publisher.flush()
         summary["num_package_units_attempted"] = len(pkg_units)
         summary["num_package_units_published"] = len(pkg_units) - len(pkg_errors)
         summary["num_package_units_errors"] = len(pkg_errors)
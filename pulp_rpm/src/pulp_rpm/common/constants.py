@@ -25,6 +25,7 @@ COMPLETE_STATES = (STATE_COMPLETE, STATE_FAILED, STATE_SKIPPED)
 ERROR_SIZE_VERIFICATION = 'size_mismatch'
 ERROR_CHECKSUM_VERIFICATION = 'checksum_mismatch'
 ERROR_CHECKSUM_TYPE_UNKNOWN = 'checksum_type_unknown'
+ERROR_SAVE_FAILED = 'save_failed'
 
 # Standard keywords for progress reports to include
 PROGRESS_STATE_KEY = 'state'
@@ -70,6 +71,75 @@ CONFIG_SERVE_HTTPS_DEFAULT = True
 # list of types to skip at sync time
 CONFIG_SKIP = 'type_skip_list'
 
+# if True, primary.xml is parsed only once per sync, and an index of its
+# contents drives both downloading and purging
+CONFIG_SINGLE_PASS = 'single_pass'
+
+# if True, filelists.xml and other.xml are only scanned for the location of
+# each package, and a package's data is parsed only when it is downloaded
+CONFIG_LAZY_REPODATA = 'lazy_repodata'
+
+# if True, sync steps whose metadata files have not changed since the last
+# successful sync are skipped
+CONFIG_SKIP_UNCHANGED = 'skip_unchanged'
+
+# if True, errata, groups and categories are only saved if their content has
+# changed since the last sync
+CONFIG_INCREMENTAL_FILELESS = 'incremental_fileless'
+
+# if True, downloaded packages are verified and saved in batches on a separate
+# thread, so that downloading continues while units are written
+CONFIG_BATCH_UNIT_WRITES = 'batch_unit_writes'
+
+# if True, downloaded files are validated by reading them again once they are
+# written, instead of hashing them as they are downloaded
+CONFIG_VERIFY_BY_REREAD = 'verify_by_reread'
+
+# if True, packages that are already in the content store because another repo
+# has them are added to the repo being synced instead of being downloaded again
+CONFIG_ASSOCIATE_FROM_STORE = 'associate_from_store'
+
+# if True, RPMs, DRPMs and distribution files are all downloaded at once by one
+# downloader, instead of one type after another
+CONFIG_UNIFIED_DOWNLOADS = 'unified_downloads'
+
+# if False, metadata files are not verified against the sizes and checksums
+# listed in repomd.xml. They are verified by default.
+CONFIG_VERIFY_METADATA = 'verify_metadata'
+
+# if True and the feed is a file:// URL, files are hard linked, or cloned where
+# the filesystem supports it, instead of being copied
+CONFIG_LINK_LOCAL_FEED = 'link_local_feed'
+
+# if True, files are downloaded into a directory in the repo's working dir that
+# is kept until the sync succeeds, so that a cancelled or crashed sync of the
+# same metadata can be resumed
+CONFIG_RESUMABLE = 'resumable_sync'
+
+# if True, each compressed metadata file is decompressed once, the first time it
+# is read, and every later pass over it reads the decompressed copy through mmap
+CONFIG_CACHE_DECOMPRESSED = 'cache_decompressed_metadata'
+
+# experimental: number of worker processes that parse primary.xml when deciding
+# which RPMs to download and which to purge, and that generate the repodata dbs.
+# The workers are forked from the process running the sync. If unset or less
+# than 2, which is the default, nothing is forked and all of it is done in the
+# sync's own process.
+CONFIG_PARSE_PROCESSES = 'parse_processes'
+
+# lists of rules that limit which packages in primary.xml are synced at all. A
+# package is synced only if it matches every kind of include rule that is set,
+# and none of the exclude rules. Arches are compared exactly, names are matched
+# against glob patterns, and regular expressions are searched for in each
+# package's "name-version-release.arch". Packages that are filtered out are
+# treated as missing from the remote repository when missing units are removed.
+CONFIG_INCLUDE_ARCHES = 'include_arches'
+CONFIG_EXCLUDE_ARCHES = 'exclude_arches'
+CONFIG_INCLUDE_NAMES = 'include_names'
+CONFIG_EXCLUDE_NAMES = 'exclude_names'
+CONFIG_INCLUDE_REGEXES = 'include_regexes'
+CONFIG_EXCLUDE_REGEXES = 'exclude_regexes'
+
 # This is the CA that we should verify client entitlement certificates with. If it is set, and protected repos
 # are enabled serverwide, we will protect the repo with this cert over SSL. If it is unset, no repo protection
 # will be configured. This option is currently only used by the ISO distributor.
@@ -122,6 +192,8 @@ ERROR_KEY_ACTUAL_SIZE = 'actual_size'
 
 # Keys used for the scratchpad
 SCRATCHPAD_DEFAULT_METADATA_CHECKSUM = 'checksum_type'
+SCRATCHPAD_LAST_SYNC_METADATA = 'last_sync_metadata'
+SCRATCHPAD_UNIT_HASHES = 'fileless_unit_hashes'
 
 # -- extensions ---------------------------------------------------------------
 
@@ -101,7 +101,11 @@ class VersionedPackage(Package):
 
     @property
     def complete_version_serialized(self):
-        return tuple(version_utils.encode(field) for field in self.complete_version)
+        return tuple(version_utils.encode_many(self.complete_version))
+
+    @property
+    def size(self):
+        return self.metadata.get('size')
 
     def __cmp__(self, other):
         return cmp(
@@ -110,6 +114,99 @@ class VersionedPackage(Package):
         )
 
 
+class PackageRecord(object):
+    """
+    Compact summary of a versioned package found in a repository's metadata.
+    It holds only what is needed to decide whether a package should be
+    downloaded or kept, and it hashes and compares by unit key. A full model,
+    with all of its metadata, is only created by to_model when the unit is
+    actually going to be saved.
+    """
+    __slots__ = ('model_class', 'as_named_tuple', 'size', '_element', '_process_func')
+
+    def __init__(self, model_class, as_named_tuple, size, element=None, process_func=None):
+        """
+        :param model_class:     model class of the package
+        :type  model_class:     type
+        :param as_named_tuple:  the package's unit key
+        :type  as_named_tuple:  model_class.NAMEDTUPLE
+        :param size:            size of the package in bytes, if known
+        :type  size:            int
+        :param element:         XML element the record was read from, which is
+                                held until to_model is called
+        :type  element:         xml.etree.ElementTree.Element
+        :param process_func:    function that takes the element and returns a
+                                full model instance
+        :type  process_func:    function
+        """
+        self.model_class = model_class
+        self.as_named_tuple = as_named_tuple
+        self.size = size
+        self._element = element
+        self._process_func = process_func
+
+    @property
+    def unit_key(self):
+        return dict(zip(self.model_class.UNIT_KEY_NAMES, self.as_named_tuple))
+
+    @property
+    def key_string_without_version(self):
+        keys = [value for name, value in zip(self.model_class.UNIT_KEY_NAMES, self.as_named_tuple)
+                if name not in ['epoch', 'version', 'release', 'checksum', 'checksumtype']]
+        keys.append(self.model_class.TYPE)
+        return '-'.join(keys)
+
+    @property
+    def complete_version(self):
+        unit_key = self.as_named_tuple
+        return tuple(getattr(unit_key, name) for name in ('epoch', 'version', 'release')
+                     if name in self.model_class.UNIT_KEY_NAMES)
+
+    def to_model(self):
+        """
+        Process the XML element this record was read from into a full model.
+        The element is released afterward, so this can only be called once.
+
+        :return:    model instance with all of the package's metadata
+        :rtype:     pulp_rpm.common.models.VersionedPackage
+
+        :raise ValueError: if there is no element to process
+        """
+        if self._element is None:
+            raise ValueError('no XML element is available for %s' % str(self))
+        model = self._process_func(self._element)
+        self._element = None
+        return model
+
+    def __reduce__(self):
+        """
+        The element cannot be pickled, so a record is pickled without it. This
+        lets records be sent between processes, but to_model cannot be called
+        on the copy.
+        """
+        return _unpickle_package_record, (self.model_class, tuple(self.as_named_tuple), self.size)
+
+    def __hash__(self):
+        return hash(self.as_named_tuple)
+
+    def __eq__(self, other):
+        return isinstance(other, PackageRecord) and self.as_named_tuple == other.as_named_tuple
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return '%s: %s' % (self.model_class.TYPE, '-'.join(str(value) for value in self.as_named_tuple))
+
+
+def _unpickle_package_record(model_class, unit_key_values, size):
+    """
+    Rebuild a PackageRecord that was pickled. The named tuple types are
+    created dynamically, so the unit key is pickled as a plain tuple.
+    """
+    return PackageRecord(model_class, model_class.NAMEDTUPLE(*unit_key_values), size)
+
+
 class Distribution(Package):
     UNIT_KEY_NAMES = ('id', 'family', 'variant', 'version', 'arch')
     TYPE = ids.TYPE_ID_DISTRO
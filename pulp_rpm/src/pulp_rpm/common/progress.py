@@ -16,10 +16,126 @@ importer and distributor.
 """
 from datetime import datetime
 from gettext import gettext as _
+import threading
+import time
 
 from pulp.common.dateutils import format_iso8601_datetime, parse_iso8601_datetime
 
 
+# Coalesced progress updates are sent at least this often, in seconds
+PUBLISH_INTERVAL = 2
+# Coalesced progress updates are also sent after this many of them arrive
+PUBLISH_ITEM_INTERVAL = 100
+
+
+class ProgressPublisher(object):
+    """
+    Sends progress reports to a conduit without writing each small update to
+    the database. Updates passed to update() are coalesced: the report is only
+    sent once enough time has passed or enough updates have arrived since it
+    was last sent, or when the state of the report, or of any step in it, has
+    changed. Reports passed to publish() are always sent right away.
+
+    Reports are typically the same dict mutated in place, so sending the most
+    recent one includes every coalesced update.
+    """
+
+    def __init__(self, conduit, interval=PUBLISH_INTERVAL, item_interval=PUBLISH_ITEM_INTERVAL):
+        """
+        :param conduit:         conduit whose set_progress method receives reports
+        :type  conduit:         pulp.plugins.conduits.mixins.StatusMixin
+        :param interval:        maximum number of seconds to hold an update
+        :type  interval:        int
+        :param item_interval:   maximum number of updates to hold
+        :type  item_interval:   int
+        """
+        self.conduit = conduit
+        self.interval = interval
+        self.item_interval = item_interval
+        self._lock = threading.Lock()
+        self._pending = None
+        self._pending_count = 0
+        self._last_publish_time = None
+        self._last_states = None
+
+    def update(self, report):
+        """
+        Send the report if it is due, otherwise hold it until it is.
+
+        :param report:  progress report
+        :type  report:  dict
+        """
+        self._lock.acquire()
+        try:
+            states = self._states(report)
+            self._pending = report
+            self._pending_count += 1
+            if states != self._last_states or self._pending_count >= self.item_interval or \
+                    self._last_publish_time is None or \
+                    time.time() - self._last_publish_time >= self.interval:
+                self._send(states)
+        finally:
+            self._lock.release()
+
+    def publish(self, report):
+        """
+        Send the report right away.
+
+        :param report:  progress report
+        :type  report:  dict
+        """
+        self._lock.acquire()
+        try:
+            self._pending = report
+            self._send(self._states(report))
+        finally:
+            self._lock.release()
+
+    def flush(self):
+        """
+        Send the most recent report if any update to it is being held.
+        """
+        self._lock.acquire()
+        try:
+            if self._pending is not None:
+                self._send(self._states(self._pending))
+        finally:
+            self._lock.release()
+
+    def _send(self, states):
+        """
+        Send the pending report. The lock must be held.
+
+        :param states:  states found in the pending report
+        :type  states:  tuple
+        """
+        self.conduit.set_progress(self._pending)
+        self._pending = None
+        self._pending_count = 0
+        self._last_publish_time = time.time()
+        self._last_states = states
+
+    @staticmethod
+    def _states(report):
+        """
+        :param report:  progress report, which may have a "state" key of its
+                        own and may have a dict with a "state" key for each step
+        :type  report:  dict
+
+        :return:    every state found in the report, in a consistent order
+        :rtype:     tuple
+        """
+        states = []
+        if not isinstance(report, dict):
+            return tuple(states)
+        for key, value in sorted(report.items()):
+            if key == 'state':
+                states.append((key, value))
+            elif isinstance(value, dict) and 'state' in value:
+                states.append((key, value['state']))
+        return tuple(states)
+
+
 class ISOProgressReport(object):
     """
     This class is not meant to be instantiated directly, but has some common methods that are used by the Sync
@@ -60,6 +176,8 @@ class ISOProgressReport(object):
         :type  traceback:          basestring--delete--delete
         """
         self.conduit = conduit
+        # created when progress is first sent, since there is no conduit client-side
+        self.publisher = None
 
         if state is None:
             self._state = self.STATE_NOT_STARTED
@@ -142,12 +260,22 @@ class ISOProgressReport(object):
         r = cls(None, **new_report)
         return r
 
-    def update_progress(self):
+    def update_progress(self, coalesce=False):
         """
         Sends the current state of the progress report to Pulp.
+
+        :param coalesce:    if True, the report is only sent if it is due
+                            according to this report's ProgressPublisher, such
+                            as for frequent updates about bytes downloaded
+        :type  coalesce:    bool
         """
+        if self.publisher is None:
+            self.publisher = ProgressPublisher(self.conduit)
         report = self.build_progress_report()
-        self.conduit.set_progress(report)
+        if coalesce:
+            self.publisher.update(report)
+        else:
+            self.publisher.publish(report)
 
     def _get_state(self):
         """
@@ -46,6 +46,8 @@ Resources:
 """
 
 import re
+import string
+import threading
 
 # Used to separate the digit count from the actual int value
 NUMBER_DIVIDER = '-'
@@ -64,6 +66,17 @@ LETTERS_TEMPLATE = '$%s'  # substitute in segment
 # This regex is used on a single character to determine if it should be included.
 LETTER_REGEX = re.compile(r'[a-zA-Z]')
 
+# Splits a field into maximal runs of digits, maximal runs of anything other
+# than digits and periods, and periods. This produces the same segments as
+# reducing the field with _split_segments and splitting it on periods.
+TOKEN_REGEX = re.compile(r'([0-9]+)|([^0-9.]+)|\.')
+
+# Every byte other than an ASCII letter, for removing them with str.translate
+NON_LETTERS = ''.join(c for c in map(chr, range(256)) if c not in string.ascii_letters)
+
+# Maximum number of distinct fields whose encodings are remembered
+ENCODE_CACHE_SIZE = 20000
+
 # Keys the encoded fields are stored under in the unit's metadata
 VERSION_INDEX = 'version_sort_index'
 RELEASE_INDEX = 'release_sort_index'
@@ -77,6 +90,9 @@ def encode(field):
     Translates a package version into a string representation that is sortable according
     to the rules for RPM versions.
 
+    Encodings are cached, since the same versions and releases are encoded many times
+    over the course of a sync.
+
     :param field: version or release string to encode
     :type  field: str
 
@@ -88,6 +104,134 @@ def encode(field):
     if len(field) == 0:
         raise ValueError('field must be a non-empty string')
 
+    encoded_field = _encode_cache.get(field)
+    if encoded_field is None:
+        encoded_field = _encode(field)
+        _encode_cache.set(field, encoded_field)
+    return encoded_field
+
+
+def encode_many(fields):
+    """
+    Encodes each of the given fields, as with encode. Each distinct field is only
+    looked up or encoded once.
+
+    :param fields: iterable of version or release strings to encode
+    :type  fields: iterable
+
+    :return: list of encoded values in the same order as the fields
+    :rtype:  list
+    """
+    encoded = {}
+    ret = []
+    for field in fields:
+        try:
+            encoded_field = encoded[field]
+        except (KeyError, TypeError):
+            encoded_field = encoded[field] = encode(field)
+        ret.append(encoded_field)
+    return ret
+
+# -- private ------------------------------------------------------------------
+
+class _LRUCache(object):
+    """
+    Thread-safe mapping with a maximum size. When the size is exceeded, the least
+    recently used quarter of the entries is evicted at once, so eviction is cheap
+    on average.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._data = {}
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._clock += 1
+            entry[1] = self._clock
+            return entry[0]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            self._clock += 1
+            self._data[key] = [value, self._clock]
+            if len(self._data) > self.size:
+                by_age = sorted(self._data.iteritems(), key=lambda item: item[1][1])
+                for old_key, entry in by_age[:len(self._data) - self.size * 3 / 4]:
+                    del self._data[old_key]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data = {}
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_encode_cache = _LRUCache(ENCODE_CACHE_SIZE)
+
+
+def _encode(field):
+    """
+    Encodes a non-empty field without using the cache, tokenizing it with a single
+    regular expression.
+
+    :type field: basestring
+    :rtype: str
+    """
+    if isinstance(field, unicode):
+        try:
+            field = field.encode('ascii')
+        except UnicodeEncodeError:
+            # the tokenizer only knows about ASCII digits, so let int() decide
+            return _legacy_encode(field)
+
+    encoded_segments = []
+    # True when no segment has been found since the last period
+    empty = True
+    try:
+        for digits, other in TOKEN_REGEX.findall(field):
+            if digits:
+                encoded_segments.append(_encode_int(digits))
+                empty = False
+            elif other:
+                encoded_segments.append(LETTERS_TEMPLATE % other.translate(None, NON_LETTERS))
+                empty = False
+            else:
+                # a period; two in a row, or one at either end, surround an empty segment
+                if empty:
+                    encoded_segments.append(LETTERS_TEMPLATE % '')
+                empty = True
+    except TooManyDigits:
+        raise ValueError('Cannot not encode %s; too many digits in the field' % field)
+    if empty:
+        encoded_segments.append(LETTERS_TEMPLATE % '')
+
+    return '.'.join(encoded_segments)
+
+
+def _legacy_encode(field):
+    """
+    The original implementation of encode, which examines the field one character
+    at a time. It is only used for non-ASCII unicode fields.
+
+    :type field: basestring
+    :rtype: basestring
+    """
     try:
         all_segments = reduce(_split_segments, field).split('.')
         encoded_segments = map(_encode_segment, all_segments)
@@ -97,7 +241,6 @@ def encode(field):
 
     return encoded_field
 
-# -- private ------------------------------------------------------------------
 
 def _split_segments(x, y):
     """
@@ -115,7 +115,8 @@ class ISOSyncRun(listener.DownloadEventListener):
             additional_bytes_downloaded = report.bytes_downloaded - iso.bytes_downloaded
             self.progress_report.finished_bytes += additional_bytes_downloaded
             iso.bytes_downloaded = report.bytes_downloaded
-            self.progress_report.update_progress()
+            # this is called for every chunk, so only send the report from time to time
+            self.progress_report.update_progress(coalesce=True)
 
     def download_succeeded(self, report):
         """
@@ -25,6 +25,86 @@ from pulp_rpm.common import progress
 import importer_mocks
 
 
+class TestProgressPublisher(unittest.TestCase):
+    """
+    Test the ProgressPublisher class.
+    """
+    def setUp(self):
+        self.conduit = importer_mocks.get_sync_conduit()
+        self.publisher = progress.ProgressPublisher(self.conduit, interval=60, item_interval=3)
+        self.report = {'content': {'state': 'IN_PROGRESS', 'items_left': 10}}
+
+    def test_update_first(self):
+        self.publisher.update(self.report)
+
+        self.conduit.set_progress.assert_called_once_with(self.report)
+
+    def test_update_coalesces(self):
+        self.publisher.update(self.report)
+        self.report['content']['items_left'] = 9
+        self.publisher.update(self.report)
+        self.report['content']['items_left'] = 8
+        self.publisher.update(self.report)
+
+        # the first is sent, the next two are held
+        self.assertEqual(self.conduit.set_progress.call_count, 1)
+
+    def test_update_item_interval(self):
+        for i in range(4):
+            self.publisher.update(self.report)
+
+        # the first, then the fourth once three were held
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+    @mock.patch('time.time')
+    def test_update_interval(self, mock_time):
+        mock_time.return_value = 1000
+        self.publisher.update(self.report)
+        self.publisher.update(self.report)
+        mock_time.return_value = 1060
+        self.publisher.update(self.report)
+
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+    def test_update_state_change(self):
+        self.publisher.update(self.report)
+        self.report['content']['state'] = 'FINISHED'
+        self.publisher.update(self.report)
+        self.report['metadata'] = {'state': 'NOT_STARTED'}
+        self.publisher.update(self.report)
+
+        self.assertEqual(self.conduit.set_progress.call_count, 3)
+
+    def test_update_top_level_state(self):
+        report = {'state': 'in_progress'}
+        self.publisher.update(report)
+        report['state'] = 'complete'
+        self.publisher.update(report)
+
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+    def test_publish(self):
+        self.publisher.publish(self.report)
+        self.publisher.publish(self.report)
+
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+    def test_flush(self):
+        self.publisher.update(self.report)
+        self.publisher.update(self.report)
+
+        self.publisher.flush()
+
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
+    def test_flush_nothing_pending(self):
+        self.publisher.update(self.report)
+
+        self.publisher.flush()
+
+        self.assertEqual(self.conduit.set_progress.call_count, 1)
+
+
 class TestISOProgressReport(unittest.TestCase):
     """
     Test the ISOProgressReport class.
@@ -197,6 +277,20 @@ class TestISOProgressReport(unittest.TestCase):
         # Make sure the conduit's set_progress() method was called
         self.conduit.set_progress.assert_called_once_with(report.build_progress_report())
 
+    def test_update_progress_coalesce(self):
+        """
+        With coalesce=True, update_progress() should hold reports that are not yet due.
+        """
+        report = progress.ISOProgressReport(self.conduit)
+
+        report.update_progress(coalesce=True)
+        report.update_progress(coalesce=True)
+
+        # only the first one was due
+        self.assertEqual(self.conduit.set_progress.call_count, 1)
+        report.update_progress()
+        self.assertEqual(self.conduit.set_progress.call_count, 2)
+
     def test__get_state(self):
         """
         Test our state property as a getter.
@@ -12,6 +12,7 @@
 
 import unittest
 
+import mock
 import pymongo
 from pulp.server.db import connection
 
@@ -71,6 +72,55 @@ class EncodeTests(unittest.TestCase):
         # Test: Notice that the + is removed, in addition to the splitting apart of numbers and letters.
         self.assertEqual(encode('2xFg33.+f.5'), '01-2.$xFg.02-33.$f.01-5')
 
+    def test_matches_legacy(self):
+        # periods at either end or next to each other, separators within a segment
+        # and unicode all need to produce the same value as the original algorithm
+        for field in ('1-2', '.5', '5.', '1..2', 'a+b', '2xFg33.+f.5', '1.0~rc1',
+                      '0.9.8e', '1.el6_4', u'3.10', u'2.1alpha'):
+            self.assertEqual(encode(field), version_utils._legacy_encode(field), msg=field)
+
+    def test_cached(self):
+        version_utils._encode_cache.clear()
+
+        with mock.patch.object(version_utils, '_encode', wraps=version_utils._encode) as mock_encode:
+            first = encode('1.2.3')
+            second = encode('1.2.3')
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_encode.call_count, 1)
+
+    def test_cache_bounded(self):
+        cache = version_utils._LRUCache(4)
+
+        for i in range(5):
+            cache.set(str(i), i)
+            # keep the first entry in use
+            cache.get('0')
+
+        self.assertTrue(len(cache) <= 4)
+        self.assertEqual(cache.get('0'), 0)
+        self.assertEqual(cache.get('1'), None)
+
+    def test_errors_not_cached(self):
+        self.assertRaises(ValueError, encode, '1' * 100)
+        self.assertRaises(ValueError, encode, '1' * 100)
+
+
+class EncodeManyTests(unittest.TestCase):
+
+    def test_encode_many(self):
+        fields = ['1.2', '3', '1.2', 'a']
+
+        ret = version_utils.encode_many(fields)
+
+        self.assertEqual(ret, [encode(field) for field in fields])
+
+    def test_empty(self):
+        self.assertEqual(version_utils.encode_many([]), [])
+
+    def test_invalid(self):
+        self.assertRaises(TypeError, version_utils.encode_many, ['1', None])
+
 
 class DatabaseSortTests(rpm_support_base.PulpRPMTests):
     """